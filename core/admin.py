@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
-from .models import Agent, Equipement, Affectation, Restitution, Incident, Log, AgentInvite
+from .models import Agent, Equipement, Affectation, Restitution, Incident, Log, AgentInvite, ReportJob, InventoryCounter, MatriculeSequence, TokenRevocation, SearchToken, UploadSession
 
 
 User = get_user_model()
@@ -12,4 +12,9 @@ admin.site.register(Restitution)
 admin.site.register(Incident)
 admin.site.register(Log)
 admin.site.register(AgentInvite)
-
+admin.site.register(ReportJob)
+admin.site.register(InventoryCounter)
+admin.site.register(MatriculeSequence)
+admin.site.register(TokenRevocation)
+admin.site.register(SearchToken)
+admin.site.register(UploadSession)
@@ -0,0 +1,173 @@
+import gzip
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from .models import Log
+
+
+ARCHIVE_FIELDS = [
+    'id',
+    'user',
+    'user__username',
+    'action',
+    'target_type',
+    'target_id',
+    'details',
+    'ip_address',
+    'created_at',
+]
+
+
+def archive_dir():
+    return Path(settings.LOG_ARCHIVE_DIR)
+
+
+def index_path():
+    return archive_dir() / 'index.json'
+
+
+def load_index():
+    try:
+        with open(index_path(), encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {'watermark': None, 'segments': {}}
+
+
+def save_index(index):
+    path = index_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(index, handle, indent=2, sort_keys=True)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def segment_name(day):
+    return f'{day:%Y}/{day:%m}/logs-{day:%Y-%m-%d}.jsonl.gz'
+
+
+def archive_row(row):
+    return {
+        'id': row['id'],
+        'user': row['user'],
+        'user_detail': (
+            {'id': row['user'], 'username': row['user__username']} if row['user'] else None
+        ),
+        'action': row['action'],
+        'target_type': row['target_type'],
+        'target_id': row['target_id'],
+        'details': row['details'],
+        'ip_address': row['ip_address'],
+        'created_at': row['created_at'].isoformat(),
+    }
+
+
+def write_segments(rows, index):
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row['created_at'].date(), []).append(row)
+    for day, day_rows in sorted(by_day.items()):
+        name = segment_name(day)
+        path = archive_dir() / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Each batch is appended as its own gzip member; readers see one stream.
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as handle:
+                for row in day_rows:
+                    line = json.dumps(archive_row(row), cls=DjangoJSONEncoder)
+                    handle.write(line.encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        segment = index['segments'].setdefault(
+            day.isoformat(), {'file': name, 'count': 0, 'first': None, 'last': None}
+        )
+        segment['count'] += len(day_rows)
+        first = day_rows[0]['created_at'].isoformat()
+        last = day_rows[-1]['created_at'].isoformat()
+        segment['first'] = min(filter(None, [segment['first'], first]))
+        segment['last'] = max(filter(None, [segment['last'], last]))
+        if index['watermark'] is None or last > index['watermark']:
+            index['watermark'] = last
+
+
+def archive_batch(cutoff, batch_size, index):
+    rows = list(
+        Log.objects.filter(created_at__lt=cutoff)
+        .order_by('created_at', 'id')
+        .values(*ARCHIVE_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+    write_segments(rows, index)
+    save_index(index)
+    Log.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_watermark():
+    watermark = load_index()['watermark']
+    return parse_datetime(watermark) if watermark else None
+
+
+def read_segment(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_archived(
+    start=None,
+    end=None,
+    action=None,
+    target_type=None,
+    target_id=None,
+    user=None,
+    position=None,
+):
+    """Archived rows, newest first, strictly older than ``position`` (created_at, id).
+
+    Segments are read lazily, one day at a time: a consumer that stops after a page only
+    decompresses the days that page covers.
+    """
+    index = load_index()
+    if position is not None:
+        end = position[0] if end is None else min(end, position[0])
+    for day in sorted(index['segments'], reverse=True):
+        segment = index['segments'][day]
+        if start is not None and parse_datetime(segment['last']) < start:
+            break
+        if end is not None and parse_datetime(segment['first']) > end:
+            continue
+        rows = {}
+        for row in read_segment(archive_dir() / segment['file']):
+            created_at = parse_datetime(row['created_at'])
+            if start is not None and created_at < start:
+                continue
+            if end is not None and created_at > end:
+                continue
+            if position is not None and (created_at, row['id']) >= position:
+                continue
+            if action and row['action'] != action:
+                continue
+            if target_type and row['target_type'] != target_type:
+                continue
+            if target_id and row['target_id'] != target_id:
+                continue
+            if user is not None and row['user'] != user:
+                continue
+            row['created_at'] = created_at
+            rows[row['id']] = row
+        yield from sorted(rows.values(), key=archive_key, reverse=True)
+
+
+def archive_key(row):
+    return row['created_at'], row['id']
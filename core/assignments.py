@@ -0,0 +1,288 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .audit import audit_writer
+from .caching import bump_data_version_on_commit
+from .counters import apply_deltas, change_deltas
+from .models import Affectation, Agent, Equipement, Restitution
+from .utils import parse_equipement_code
+
+
+def _item_result(index, item, errors=None, affectation=None):
+    return {
+        'index': index,
+        'equipement': item['equipement'],
+        'agent': item['agent'],
+        'status': 'error' if errors else 'created',
+        'affectation': affectation,
+        'errors': errors or {},
+    }
+
+
+def _rejected(index, errors, accepted):
+    if index in errors:
+        return errors[index]
+    return {} if index in accepted else {'non_field_errors': 'Annule.'}
+
+
+def open_affectations():
+    return Affectation.objects.filter(equipement=OuterRef('pk'), is_active=True).order_by(
+        '-assigned_at', '-id'
+    )
+
+
+def current_holder_values():
+    """Per-row expressions pointing each equipement at its open affectation, or at nothing."""
+    active = open_affectations()
+    return {
+        'current_affectation_id': Subquery(active.values('pk')[:1]),
+        'current_agent_id': Subquery(active.values('agent_id')[:1]),
+    }
+
+
+def sync_current_holders(equipement_ids):
+    return Equipement.objects.filter(pk__in=equipement_ids).update(**current_holder_values())
+
+
+def stale_current_holders():
+    """Ids of the equipements whose holder pointers disagree with their open affectation."""
+    expected = {}
+    active = Affectation.objects.filter(is_active=True).order_by('assigned_at', 'id')
+    for equipement_id, affectation_id, agent_id in active.values_list(
+        'equipement_id', 'id', 'agent_id'
+    ).iterator():
+        expected[equipement_id] = (affectation_id, agent_id)
+    return [
+        pk
+        for pk, affectation_id, agent_id in Equipement.objects.values_list(
+            'id', 'current_affectation_id', 'current_agent_id'
+        ).iterator()
+        if expected.get(pk, (None, None)) != (affectation_id, agent_id)
+    ]
+
+
+def lock_equipements(ids):
+    # One locking SELECT gives status and open affectations for every equipement.
+    active = Affectation.objects.filter(equipement=OuterRef('pk'), is_active=True)
+    return {
+        equipement.pk: equipement
+        for equipement in Equipement.objects.select_for_update()
+        .filter(pk__in=ids)
+        .only('id', 'serial_number', 'status', 'type', 'condition')
+        .annotate(has_active_affectation=Exists(active))
+    }
+
+
+def update_equipements(equipements, **values):
+    """Write ``values`` to already-loaded equipements in one UPDATE and keep counters in step.
+
+    Expressions are evaluated per row by the database and are not copied to the instances.
+    """
+    deltas = Counter()
+    for equipement in equipements:
+        old_values = equipement.counted_values()
+        deltas.update(change_deltas(Equipement, old_values, dict(old_values, **values)))
+        for name, value in values.items():
+            if not hasattr(value, 'resolve_expression'):
+                setattr(equipement, name, value)
+    Equipement.objects.filter(pk__in=[equipement.pk for equipement in equipements]).update(
+        updated_at=timezone.now(), **values
+    )
+    apply_deltas(deltas)
+
+
+def check_assignments(items, equipements, agents):
+    errors = {}
+    claimed = set()
+    for index, item in enumerate(items):
+        item_errors = {}
+        equipement = equipements.get(item['equipement'])
+        if equipement is None:
+            item_errors['equipement'] = 'Equipement introuvable.'
+        elif item['equipement'] in claimed:
+            item_errors['equipement'] = 'Equipement present plusieurs fois dans la demande.'
+        elif equipement.has_active_affectation or equipement.status != Equipement.Status.AVAILABLE:
+            item_errors['equipement'] = f'Equipement non disponible ({equipement.status}).'
+        agent_status = agents.get(item['agent'])
+        if agent_status is None:
+            item_errors['agent'] = 'Agent introuvable.'
+        elif agent_status != Agent.Status.ACTIVE:
+            item_errors['agent'] = 'Agent inactif.'
+        if item_errors:
+            errors[index] = item_errors
+        else:
+            claimed.add(item['equipement'])
+    return errors
+
+
+@transaction.atomic
+def assign_bulk(items, user=None, assigned_at=None, atomic=False, ip_address=None):
+    assigned_at = assigned_at or timezone.now()
+    equipements = lock_equipements({item['equipement'] for item in items})
+    agents = dict(
+        Agent.objects.filter(pk__in={item['agent'] for item in items}).values_list('pk', 'status')
+    )
+    errors = check_assignments(items, equipements, agents)
+    accepted = [index for index in range(len(items)) if index not in errors]
+    if errors and atomic:
+        accepted = []
+
+    affectation_ids = {}
+    if accepted:
+        Affectation.objects.bulk_create(
+            [
+                Affectation(
+                    equipement_id=items[index]['equipement'],
+                    agent_id=items[index]['agent'],
+                    assigned_by_id=getattr(user, 'pk', None),
+                    assigned_at=assigned_at,
+                    expected_return_at=items[index].get('expected_return_at'),
+                    notes=items[index].get('notes', ''),
+                    is_active=True,
+                )
+                for index in accepted
+            ]
+        )
+        equipement_ids = [items[index]['equipement'] for index in accepted]
+        # Not every backend returns primary keys from bulk_create; the rows are locked,
+        # so the open affectation of each equipement is the one just inserted.
+        affectation_ids = dict(
+            Affectation.objects.filter(equipement_id__in=equipement_ids, is_active=True).values_list(
+                'equipement_id', 'id'
+            )
+        )
+        update_equipements(
+            [equipements[pk] for pk in equipement_ids],
+            status=Equipement.Status.ASSIGNED,
+            **current_holder_values(),
+        )
+        for equipement_id in equipement_ids:
+            audit_writer.record(
+                user_id=getattr(user, 'pk', None),
+                action='CREATE',
+                target_type='Affectation',
+                target_id=str(affectation_ids[equipement_id]),
+                details={'bulk': True},
+                ip_address=ip_address,
+            )
+        bump_data_version_on_commit()
+
+    return [
+        _item_result(
+            index,
+            item,
+            errors=_rejected(index, errors, accepted),
+            affectation=affectation_ids.get(item['equipement']) if index in accepted else None,
+        )
+        for index, item in enumerate(items)
+    ]
+
+
+def returned_status(condition):
+    if condition == Restitution.Condition.GOOD:
+        return Equipement.Status.AVAILABLE
+    return Equipement.Status.MAINTENANCE
+
+
+def lock_active_affectations(serials):
+    return {
+        affectation.equipement.serial_number: affectation
+        for affectation in Affectation.objects.select_for_update()
+        .filter(equipement__serial_number__in=serials, is_active=True, restitution__isnull=True)
+        .select_related('equipement')
+        .only(
+            'id',
+            'agent_id',
+            'equipement__id',
+            'equipement__serial_number',
+            'equipement__status',
+            'equipement__type',
+            'equipement__condition',
+        )
+    }
+
+
+@transaction.atomic
+def restitute_bulk(items, user=None, returned_at=None, atomic=False, ip_address=None):
+    returned_at = returned_at or timezone.now()
+    serials = [parse_equipement_code(item['code']) for item in items]
+    affectations = lock_active_affectations({serial for serial in serials if serial})
+
+    errors = {}
+    claimed = set()
+    for index, serial in enumerate(serials):
+        if not serial:
+            errors[index] = {'code': 'Code vide.'}
+        elif serial not in affectations:
+            errors[index] = {'code': 'Aucune affectation active pour cet equipement.'}
+        elif serial in claimed:
+            errors[index] = {'code': 'Equipement scanne plusieurs fois.'}
+        else:
+            claimed.add(serial)
+    accepted = [index for index in range(len(items)) if index not in errors]
+    if errors and atomic:
+        accepted = []
+
+    restitution_ids = {}
+    if accepted:
+        Restitution.objects.bulk_create(
+            [
+                Restitution(
+                    affectation=affectations[serials[index]],
+                    received_by_id=getattr(user, 'pk', None),
+                    returned_at=returned_at,
+                    condition=items[index]['condition'],
+                    notes=items[index].get('notes', ''),
+                )
+                for index in accepted
+            ]
+        )
+        affectation_ids = [affectations[serials[index]].pk for index in accepted]
+        Affectation.objects.filter(pk__in=affectation_ids).update(is_active=False)
+        by_condition = {}
+        for index in accepted:
+            equipement = affectations[serials[index]].equipement
+            by_condition.setdefault(items[index]['condition'], []).append(equipement)
+        for condition, equipements in sorted(by_condition.items()):
+            update_equipements(
+                equipements,
+                condition=condition,
+                status=returned_status(condition),
+                current_affectation=None,
+                current_agent=None,
+            )
+        restitution_ids = dict(
+            Restitution.objects.filter(affectation_id__in=affectation_ids).values_list(
+                'affectation_id', 'id'
+            )
+        )
+        for affectation_id in affectation_ids:
+            audit_writer.record(
+                user_id=getattr(user, 'pk', None),
+                action='CREATE',
+                target_type='Restitution',
+                target_id=str(restitution_ids[affectation_id]),
+                details={'scan': True},
+                ip_address=ip_address,
+            )
+        bump_data_version_on_commit()
+
+    results = []
+    for index, item in enumerate(items):
+        affectation = affectations.get(serials[index]) if index in accepted else None
+        item_errors = _rejected(index, errors, accepted)
+        results.append(
+            {
+                'index': index,
+                'code': item['code'],
+                'serial_number': serials[index],
+                'status': 'error' if item_errors else 'created',
+                'restitution': restitution_ids.get(affectation.pk) if affectation else None,
+                'affectation': affectation.pk if affectation else None,
+                'errors': item_errors,
+            }
+        )
+    return results
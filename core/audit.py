@@ -0,0 +1,131 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+
+from .models import Log
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.oldest = None
+        self.reset_stats()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUDIT_BUFFER_SIZE', 100)
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'AUDIT_FLUSH_INTERVAL', 5.0)
+
+    def is_durable(self, action, target_type=''):
+        return action in getattr(settings, 'AUDIT_DURABLE_ACTIONS', ()) or target_type in getattr(
+            settings, 'AUDIT_DURABLE_TARGETS', ()
+        )
+
+    def record(self, user_id=None, durable=None, **fields):
+        entry = Log(user_id=user_id, **fields)
+        if durable is None:
+            durable = self.is_durable(entry.action, entry.target_type)
+        if durable or self.max_size <= 1:
+            # Written in the caller's transaction: it rolls back with the action.
+            entry.save()
+            with self.lock:
+                self.durable_writes += 1
+            return entry
+        # Buffered entries outlive the transaction: only queue them once it has committed.
+        transaction.on_commit(lambda: self.buffer_entry(entry))
+        return entry
+
+    def buffer_entry(self, entry):
+        with self.lock:
+            if not self.buffer:
+                self.oldest = time.monotonic()
+            self.buffer.append(entry)
+            due = (
+                len(self.buffer) >= self.max_size
+                or time.monotonic() - self.oldest >= self.max_age
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            entries, self.buffer = self.buffer, []
+            self.oldest = None
+        if not entries:
+            return 0
+        start = time.perf_counter()
+        try:
+            Log.objects.bulk_create(entries, batch_size=500)
+        except Exception:
+            logger.exception('Audit flush of %s entries failed', len(entries))
+            with self.lock:
+                self.failures += 1
+                # Keep the entries for the next flush, within a bounded backlog.
+                self.buffer = (entries + self.buffer)[-self.max_size * 10 :]
+                self.oldest = self.oldest or time.monotonic()
+            return 0
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.flushes += 1
+            self.flushed += len(entries)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self.total_flush_ms += elapsed
+        return len(entries)
+
+    def reset_stats(self):
+        self.flushes = 0
+        self.flushed = 0
+        self.durable_writes = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def reset(self):
+        with self.lock:
+            self.buffer = []
+            self.oldest = None
+            self.reset_stats()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'buffered': len(self.buffer),
+                'oldest_age_s': round(time.monotonic() - self.oldest, 3) if self.oldest else 0,
+                'flushes': self.flushes,
+                'flushed_entries': self.flushed,
+                'durable_writes': self.durable_writes,
+                'failures': self.failures,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0,
+            }
+
+
+audit_writer = AuditWriter()
+
+
+def flush_audit_log(**kwargs):
+    audit_writer.flush()
+
+
+def connect_audit_flush():
+    # request_finished fires once the response has been handed to the server.
+    # Flush before close_old_connections so the request's connection is reused.
+    request_finished.disconnect(close_old_connections)
+    request_finished.connect(flush_audit_log, dispatch_uid='core.audit.flush')
+    request_finished.connect(close_old_connections)
+    atexit.register(audit_writer.flush)
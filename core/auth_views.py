@@ -1,30 +1,74 @@
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth import get_user_model
+from django.db.models import F, Value
+from django.db.models.functions import Lower
 
-from .models import Log, Agent
+from .audit import audit_writer
+from .authentication import is_revoked, token_claims
+from .models import Agent
 from .utils import get_client_ip
 
 
+def resolve_login(identifier):
+    """Return the username behind a username, email, phone or agent matricule.
+
+    All four lookups run as one UNION ALL query, each branch on its own index
+    (case-insensitive email through the LOWER(email) index); the first branch
+    that matches wins.
+    """
+    User = get_user_model()
+    branches = [
+        User.objects.filter(username=identifier).annotate(
+            priority=Value(0), login=F('username')
+        ),
+        User.objects.alias(email_lower=Lower('email'))
+        .filter(email_lower=identifier.lower())
+        .annotate(priority=Value(1), login=F('username')),
+        User.objects.filter(phone=identifier).annotate(priority=Value(2), login=F('username')),
+        Agent.objects.filter(matricule=identifier, user__isnull=False).annotate(
+            priority=Value(3), login=F('user__username')
+        ),
+    ]
+    branches = [branch.values_list('priority', 'login') for branch in branches]
+    match = branches[0].union(*branches[1:], all=True).order_by('priority').first()
+    return match[1] if match else None
+
+
 class IdentifierTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in token_claims(user).items():
+            token[claim] = value
+        return token
+
     def validate(self, attrs):
         identifier = attrs.get(self.username_field)
         if identifier:
-            User = get_user_model()
-            user = User.objects.filter(username=identifier).first()
-            if not user:
-                user = User.objects.filter(email__iexact=identifier).first()
-            if not user:
-                user = User.objects.filter(phone=identifier).first()
-            if not user:
-                agent = Agent.objects.select_related('user').filter(
-                    matricule=identifier
-                ).first()
-                user = agent.user if agent else None
-            if user:
-                attrs[self.username_field] = user.get_username()
+            username = resolve_login(identifier)
+            if username:
+                attrs[self.username_field] = username
+        return super().validate(attrs)
+
+
+class IdentifierTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or is_revoked(user_id, refresh.get('rev')):
+            raise InvalidToken('Jeton revoque.')
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise InvalidToken('Utilisateur introuvable ou inactif.')
+        # Refreshing is the moment claims catch up with the account.
+        for claim, value in token_claims(user).items():
+            refresh[claim] = value
+        attrs['refresh'] = str(refresh)
         return super().validate(attrs)
 
 
@@ -36,8 +80,8 @@ class LoginView(TokenObtainPairView):
         serializer.is_valid(raise_exception=True)
         user = getattr(serializer, 'user', None)
         if user:
-            Log.objects.create(
-                user=user,
+            audit_writer.record(
+                user_id=user.pk,
                 action='LOGIN',
                 target_type='User',
                 target_id=str(user.pk),
@@ -45,3 +89,7 @@ class LoginView(TokenObtainPairView):
                 ip_address=get_client_ip(request),
             )
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+class RefreshView(TokenRefreshView):
+    serializer_class = IdentifierTokenRefreshSerializer
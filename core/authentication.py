@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .caching import CACHE_PREFIX
+from .models import Agent, TokenRevocation
+
+
+REVOCATIONS_KEY = f'{CACHE_PREFIX}token-revocations'
+CLAIMS = ('role', 'is_superuser', 'is_active', 'agent_id', 'rev')
+
+
+def token_claims(user):
+    return {
+        'role': user.role,
+        'is_superuser': user.is_superuser,
+        'is_active': user.is_active,
+        'agent_id': Agent.objects.filter(user_id=user.pk).values_list('pk', flat=True).first(),
+        # Tokens stay valid until a revocation newer than this one is recorded.
+        'rev': TokenRevocation.objects.filter(user_id=user.pk).aggregate(last=Max('pk'))['last']
+        or 0,
+    }
+
+
+def _revocations():
+    revocations = cache.get(REVOCATIONS_KEY)
+    if revocations is None:
+        # Tokens older than a refresh token's lifetime are expired anyway.
+        since = timezone.now() - api_settings.REFRESH_TOKEN_LIFETIME
+        revocations = dict(
+            TokenRevocation.objects.filter(revoked_at__gte=since)
+            .values('user_id')
+            .annotate(last=Max('pk'))
+            .values_list('user_id', 'last')
+        )
+        cache.set(REVOCATIONS_KEY, revocations, settings.TOKEN_REVOCATION_CACHE_TTL)
+    return revocations
+
+
+def is_revoked(user_id, rev):
+    last = _revocations().get(int(user_id))
+    return last is not None and (rev or 0) < last
+
+
+def revoke_tokens(user_id, reason=''):
+    """Invalidate every token issued to ``user_id`` so far.
+
+    Other processes pick the revocation up when their cached deny-list expires
+    (``TOKEN_REVOCATION_CACHE_TTL``).
+    """
+    now = timezone.now()
+    TokenRevocation.objects.filter(
+        revoked_at__lt=now - api_settings.REFRESH_TOKEN_LIFETIME
+    ).delete()
+    TokenRevocation.objects.create(user_id=user_id, revoked_at=now, reason=reason[:100])
+    transaction.on_commit(lambda: cache.delete(REVOCATIONS_KEY))
+
+
+def _load_user(user_id):
+    try:
+        return get_user_model().objects.get(pk=user_id)
+    except get_user_model().DoesNotExist:
+        raise AuthenticationFailed('Utilisateur introuvable.', code='user_not_found')
+
+
+class TokenClaimsUser(SimpleLazyObject):
+    """Request user built from the token claims.
+
+    ``pk``, ``role``, ``is_superuser``, ``is_active`` and ``agent_id`` are read
+    from the token; any other attribute loads the ``User`` row on first access.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: _load_user(user_id))
+        self.__dict__.update(
+            pk=user_id,
+            id=user_id,
+            role=token['role'],
+            is_superuser=token['is_superuser'],
+            is_active=token['is_active'],
+            agent_id=token.get('agent_id'),
+            is_authenticated=True,
+            is_anonymous=False,
+            token=token,
+        )
+
+    def __bool__(self):
+        return True
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Le jeton ne contient aucun identifiant utilisateur.')
+        if is_revoked(user_id, validated_token.get('rev')):
+            raise AuthenticationFailed('Jeton revoque.', code='token_revoked')
+        if any(claim not in validated_token for claim in CLAIMS):
+            # Tokens issued before the claims existed: fall back to the row.
+            return super().get_user(validated_token)
+        if not validated_token['is_active']:
+            raise AuthenticationFailed('Utilisateur inactif.', code='user_inactive')
+        return TokenClaimsUser(validated_token)
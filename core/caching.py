@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+DATA_VERSION_KEY = 'equiptrack:data-version'
+CACHE_PREFIX = 'equiptrack:'
+
+
+def _initial_version():
+    # Never restart from a small number after an eviction: stale entries
+    # stored under an old version must not become valid again.
+    cache.add(DATA_VERSION_KEY, time.time_ns(), timeout=None)
+    return cache.get(DATA_VERSION_KEY)
+
+
+def data_version():
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        version = _initial_version()
+    return version
+
+
+def bump_data_version():
+    try:
+        return cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        return _initial_version()
+
+
+def bump_data_version_on_commit():
+    """Bump the version once the transaction commits, once per transaction."""
+    connection = transaction.get_connection()
+    # A bump queued in the same savepoint commits or rolls back with the current write.
+    # Blocks opened with savepoint=False show up as None and share their parent's fate.
+    savepoints = set(connection.savepoint_ids) - {None}
+    for sids, func, _ in connection.run_on_commit:
+        if func is bump_data_version and set(sids) - {None} == savepoints:
+            return
+    transaction.on_commit(bump_data_version)
+
+
+def versioned(name, builder, timeout=None):
+    key = f'{CACHE_PREFIX}{name}'
+    values = cache.get_many([DATA_VERSION_KEY, key])
+    version = values.get(DATA_VERSION_KEY)
+    if version is None:
+        version = _initial_version()
+    entry = values.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = builder()
+    cache.set(key, (version, value), timeout)
+    return value
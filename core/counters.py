@@ -0,0 +1,71 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Agent, Equipement, Incident, InventoryCounter
+
+
+COUNTER_SCOPES = {
+    Equipement: {
+        'equipement_status': 'status',
+        'equipement_type': 'type',
+        'equipement_condition': 'condition',
+    },
+    Incident: {
+        'incident_type': 'incident_type',
+        'incident_status': 'status',
+    },
+    Agent: {
+        'agent_status': 'status',
+    },
+}
+
+
+def values_deltas(model, values, sign=1):
+    deltas = Counter()
+    for scope, field in COUNTER_SCOPES[model].items():
+        if values.get(field) is not None:
+            deltas[(scope, values[field])] += sign
+    return deltas
+
+
+def change_deltas(model, old_values, new_values):
+    deltas = values_deltas(model, new_values)
+    deltas.update(values_deltas(model, old_values, sign=-1))
+    return deltas
+
+
+def apply_deltas(deltas):
+    # Sorted keys keep the row lock order stable between concurrent writers.
+    for (scope, key), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        counters = InventoryCounter.objects.filter(scope=scope, key=key)
+        if not counters.update(value=F('value') + delta):
+            InventoryCounter.objects.get_or_create(scope=scope, key=key)
+            counters.update(value=F('value') + delta)
+
+
+def read_counters():
+    counters = {scope: {} for scopes in COUNTER_SCOPES.values() for scope in scopes}
+    for scope, key, value in InventoryCounter.objects.values_list('scope', 'key', 'value'):
+        counters.setdefault(scope, {})[key] = value
+    return counters
+
+
+def count_rows():
+    rows = []
+    for model, scopes in COUNTER_SCOPES.items():
+        for scope, field in scopes.items():
+            for item in model.objects.values(field).annotate(total=Count('id')):
+                rows.append(InventoryCounter(scope=scope, key=item[field], value=item['total']))
+    return rows
+
+
+def rebuild_counters():
+    with transaction.atomic():
+        rows = count_rows()
+        InventoryCounter.objects.all().delete()
+        InventoryCounter.objects.bulk_create(rows)
+    return rows
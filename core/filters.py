@@ -1,7 +1,8 @@
 import django_filters
 from django.db.models import Q
 
-from .models import Agent, Equipement, Affectation, Restitution, Incident
+from .models import Agent, Equipement, Affectation, Restitution, Incident, Log, SearchToken
+from .search import search_ids, words
 
 
 class AgentFilter(django_filters.FilterSet):
@@ -12,22 +13,40 @@ class AgentFilter(django_filters.FilterSet):
         fields = ['status', 'matricule', 'name']
 
     def filter_name(self, queryset, name, value):
+        # Words of three characters or more are all made of indexed trigrams: the search
+        # index narrows the candidates, and the name lookup confirms them.
+        parts = words(value)
+        if parts and min(len(part) for part in parts) >= 3:
+            queryset = queryset.filter(pk__in=search_ids(SearchToken.Kind.AGENT, value))
         return queryset.filter(Q(first_name__icontains=value) | Q(last_name__icontains=value))
 
 
 class EquipementFilter(django_filters.FilterSet):
+    q = django_filters.CharFilter(method='filter_q')
+
     class Meta:
         model = Equipement
-        fields = ['type', 'status', 'condition', 'serial_number', 'imei']
+        fields = ['type', 'status', 'condition', 'serial_number', 'imei', 'current_agent', 'q']
+
+    def filter_q(self, queryset, name, value):
+        return queryset.filter(pk__in=search_ids(SearchToken.Kind.EQUIPEMENT, value))
 
 
 class AffectationFilter(django_filters.FilterSet):
     assigned_at_after = django_filters.DateTimeFilter(field_name='assigned_at', lookup_expr='gte')
     assigned_at_before = django_filters.DateTimeFilter(field_name='assigned_at', lookup_expr='lte')
+    project_type = django_filters.CharFilter(field_name='agent__project_type')
 
     class Meta:
         model = Affectation
-        fields = ['agent', 'equipement', 'is_active', 'assigned_at_after', 'assigned_at_before']
+        fields = [
+            'agent',
+            'equipement',
+            'is_active',
+            'assigned_at_after',
+            'assigned_at_before',
+            'project_type',
+        ]
 
 
 class RestitutionFilter(django_filters.FilterSet):
@@ -43,3 +62,12 @@ class IncidentFilter(django_filters.FilterSet):
     class Meta:
         model = Incident
         fields = ['incident_type', 'status', 'equipement', 'agent']
+
+
+class LogFilter(django_filters.FilterSet):
+    created_at_after = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_at_before = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
+
+    class Meta:
+        model = Log
+        fields = ['user', 'action', 'target_type', 'target_id', 'created_at_after', 'created_at_before']
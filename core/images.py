@@ -0,0 +1,144 @@
+import logging
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Affectation, Agent, Restitution
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = {
+    Agent: ('id_document',),
+    Affectation: ('signature', 'equipement_photo'),
+    Restitution: ('equipement_photo',),
+}
+
+
+def thumbnail_field(field):
+    return f'{field}_thumbnail'
+
+
+def thumbnail_name(name):
+    # Derived from the source name, which the storage keeps unique: a thumbnail whose
+    # name does not match its source belongs to a previous upload.
+    return str(PurePosixPath('thumbnails') / PurePosixPath(name).with_suffix('.jpg'))
+
+
+def is_processed(instance, field):
+    source = getattr(instance, field)
+    if not source:
+        return True
+    return getattr(instance, thumbnail_field(field)).name == thumbnail_name(source.name)
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _flatten(image):
+    if not _has_alpha(image):
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def encode(image, max_size, quality):
+    """Bounded copy of ``image``: PNG when it has transparency (signatures), JPEG otherwise."""
+    image = image.copy()
+    image.thumbnail((max_size, max_size))
+    buffer = BytesIO()
+    if _has_alpha(image):
+        image.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue(), '.png'
+    image.convert('RGB').save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue(), '.jpg'
+
+
+def process_field(source):
+    """Re-encode one stored image in place and write its thumbnail.
+
+    Returns the new file names, or ``{}`` if the file is not a readable image.
+    """
+    field = source.field.name
+    storage = source.storage
+    try:
+        with storage.open(source.name, 'rb') as handle:
+            original = handle.read()
+        image = Image.open(BytesIO(original))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('Cannot process image %s', source.name)
+        return {}
+
+    name = source.name
+    content, suffix = encode(image, settings.IMAGE_MAX_DIMENSION, settings.IMAGE_QUALITY)
+    oversized = max(image.size) > settings.IMAGE_MAX_DIMENSION
+    if oversized or len(content) < len(original):
+        target = str(PurePosixPath(source.name).with_suffix(suffix))
+        name = storage.save(target, ContentFile(content))
+
+    thumbnail = _flatten(image)
+    thumbnail.thumbnail((settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+    buffer = BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=settings.IMAGE_QUALITY, optimize=True)
+    thumb = thumbnail_name(name)
+    if storage.exists(thumb):
+        storage.delete(thumb)
+    storage.save(thumb, ContentFile(buffer.getvalue()))
+    return {field: name, thumbnail_field(field): thumb}
+
+
+def process_images(model, pk):
+    """Process the unprocessed images of one row; returns the number of fields done."""
+    fields = IMAGE_FIELDS[model]
+    instance = (
+        model.objects.filter(pk=pk)
+        .only('id', *fields, *[thumbnail_field(field) for field in fields])
+        .first()
+    )
+    if instance is None:
+        return 0
+    done = 0
+    for field in fields:
+        if is_processed(instance, field):
+            continue
+        source = getattr(instance, field)
+        names = process_field(source)
+        if not names:
+            continue
+        # Only if the row still points at the file that was processed.
+        updated = model.objects.filter(pk=pk, **{field: source.name}).update(**names)
+        if names[field] != source.name:
+            source.storage.delete(source.name if updated else names[field])
+        if not updated:
+            source.storage.delete(names[thumbnail_field(field)])
+        done += updated
+    return done
+
+
+def process_images_task(label, pk):
+    # Entry point for process pools: models are passed by label.
+    return process_images(apps.get_model(label), pk)
+
+
+def unprocessed(model):
+    """Ids of the rows of ``model`` with at least one image still to process."""
+    fields = IMAGE_FIELDS[model]
+    with_images = Q()
+    for field in fields:
+        with_images |= Q(**{f'{field}__isnull': False}) & ~Q(**{field: ''})
+    queryset = model.objects.filter(with_images).only(
+        'id', *fields, *[thumbnail_field(field) for field in fields]
+    )
+    for instance in queryset.order_by('id').iterator(chunk_size=1000):
+        if not all(is_processed(instance, field) for field in fields):
+            yield instance.pk
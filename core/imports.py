@@ -0,0 +1,288 @@
+import csv
+import io
+import zipfile
+from collections import Counter
+from itertools import chain, islice
+from pathlib import PurePath
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .audit import audit_writer
+from .caching import bump_data_version_on_commit
+from .counters import apply_deltas, values_deltas
+from .models import Equipement, SearchToken
+from .search import index_objects
+from .workers import run_in_background
+
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FORMATS = ('csv', 'xlsx')
+
+# Accepts the technical names as well as the headers of the Excel report.
+IMPORT_HEADERS = {
+    'type': 'type',
+    'serial_number': 'serial_number',
+    'numero de serie': 'serial_number',
+    'imei': 'imei',
+    'status': 'status',
+    'statut': 'status',
+    'condition': 'condition',
+    'etat': 'condition',
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def import_format(filename):
+    suffix = PurePath(filename or '').suffix.lower().lstrip('.')
+    if suffix not in IMPORT_FORMATS:
+        raise ImportFormatError('Format non supporte: utilisez un fichier .csv ou .xlsx.')
+    return suffix
+
+
+def _normalise_headers(headers):
+    columns = [IMPORT_HEADERS.get(str(header or '').strip().lower()) for header in headers]
+    if 'serial_number' not in columns or 'type' not in columns:
+        raise ImportFormatError('Colonnes obligatoires manquantes: type, serial_number.')
+    return columns
+
+
+def _records(rows):
+    columns = _normalise_headers(next(rows, []))
+    for line, values in enumerate(rows, start=2):
+        record = {
+            column: value
+            for column, value in zip(columns, values)
+            if column is not None
+        }
+        if any(value not in (None, '') for value in record.values()):
+            yield line, record
+
+
+def _csv_reader(handle):
+    text = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')
+    header = text.readline()
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    return text, csv.reader(chain([header], text), delimiter=delimiter)
+
+
+def read_csv(handle):
+    # The whole file is decoded and parsed once before anything is imported: an error
+    # found halfway would otherwise leave the first batches committed.
+    try:
+        text, rows = _csv_reader(handle)
+        for _ in rows:
+            pass
+    except UnicodeDecodeError:
+        raise ImportFormatError('Le fichier CSV doit etre encode en UTF-8.')
+    except csv.Error as exc:
+        raise ImportFormatError(f'Fichier CSV invalide: {exc}.')
+    text.detach()
+    handle.seek(0)
+    return _records(_csv_reader(handle)[1])
+
+
+def _open_workbook(handle):
+    try:
+        return load_workbook(handle, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError):
+        raise ImportFormatError('Fichier Excel illisible ou corrompu.')
+
+
+def read_xlsx(handle):
+    # Same as CSV: a sheet that cannot be read fails before the first batch.
+    workbook = _open_workbook(handle)
+    try:
+        for _ in workbook.worksheets[0].iter_rows(values_only=True):
+            pass
+    except (zipfile.BadZipFile, OSError, SyntaxError, ValueError):
+        raise ImportFormatError('Fichier Excel illisible ou corrompu.')
+    finally:
+        workbook.close()
+    handle.seek(0)
+    return _xlsx_records(_open_workbook(handle))
+
+
+def _xlsx_records(workbook):
+    try:
+        yield from _records(workbook.worksheets[0].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def read_rows(handle, filename):
+    if import_format(filename) == 'xlsx':
+        return read_xlsx(handle)
+    return read_csv(handle)
+
+
+def _choice_lookup(choices):
+    lookup = {}
+    for value, label in choices.choices:
+        lookup[value.lower()] = value
+        lookup[label.lower()] = value
+    return lookup
+
+
+TYPE_LOOKUP = _choice_lookup(Equipement.Type)
+STATUS_LOOKUP = _choice_lookup(Equipement.Status)
+CONDITION_LOOKUP = _choice_lookup(Equipement.Condition)
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores long IMEIs as numbers.
+        value = int(value)
+    return str(value).strip()
+
+
+def clean_record(record):
+    errors = {}
+    cleaned = {
+        'serial_number': _text(record.get('serial_number')),
+        'imei': _text(record.get('imei')) or None,
+    }
+    if not cleaned['serial_number']:
+        errors['serial_number'] = 'Ce champ est obligatoire.'
+    elif len(cleaned['serial_number']) > 100:
+        errors['serial_number'] = 'Au plus 100 caracteres.'
+    if cleaned['imei'] and len(cleaned['imei']) > 50:
+        errors['imei'] = 'Au plus 50 caracteres.'
+    for field, lookup, default in [
+        ('type', TYPE_LOOKUP, None),
+        ('status', STATUS_LOOKUP, Equipement.Status.AVAILABLE),
+        ('condition', CONDITION_LOOKUP, Equipement.Condition.GOOD),
+    ]:
+        raw = _text(record.get(field))
+        if not raw and default is not None:
+            cleaned[field] = default
+        elif raw.lower() in lookup:
+            cleaned[field] = lookup[raw.lower()]
+        else:
+            errors[field] = f'Valeur invalide: "{raw}".' if raw else 'Ce champ est obligatoire.'
+    return cleaned, errors
+
+
+def _existing_identifiers(serials, imeis):
+    existing_serials, existing_imeis = set(), set()
+    query = Q(serial_number__in=serials)
+    if imeis:
+        query |= Q(imei__in=imeis)
+    for serial, imei in Equipement.objects.filter(query).values_list('serial_number', 'imei'):
+        existing_serials.add(serial)
+        if imei:
+            existing_imeis.add(imei)
+    return existing_serials, existing_imeis
+
+
+def _import_batch(batch, seen_serials, seen_imeis, report, dry_run):
+    checked = []
+    for line, cleaned, errors in batch:
+        if not errors:
+            if cleaned['serial_number'] in seen_serials:
+                errors['serial_number'] = 'Numero de serie en double dans le fichier.'
+            elif cleaned['imei'] and cleaned['imei'] in seen_imeis:
+                errors['imei'] = 'IMEI en double dans le fichier.'
+        if not errors:
+            seen_serials.add(cleaned['serial_number'])
+            if cleaned['imei']:
+                seen_imeis.add(cleaned['imei'])
+        checked.append((line, cleaned, errors))
+
+    serials = [cleaned['serial_number'] for _, cleaned, errors in checked if not errors]
+    imeis = [cleaned['imei'] for _, cleaned, errors in checked if not errors and cleaned['imei']]
+    existing_serials, existing_imeis = _existing_identifiers(serials, imeis) if serials else ((), ())
+
+    rows = []
+    for line, cleaned, errors in checked:
+        if not errors:
+            if cleaned['serial_number'] in existing_serials:
+                errors['serial_number'] = 'Un equipement avec ce numero de serie existe deja.'
+            elif cleaned['imei'] in existing_imeis:
+                errors['imei'] = 'Un equipement avec cet IMEI existe deja.'
+        if errors:
+            report['errors'].append(
+                {'row': line, 'serial_number': cleaned['serial_number'], 'errors': errors}
+            )
+        else:
+            rows.append((line, Equipement(**cleaned)))
+
+    if not rows or dry_run:
+        report['created'] += len(rows)
+        return []
+    try:
+        with transaction.atomic():
+            Equipement.objects.bulk_create([equipement for _, equipement in rows])
+            serials = [equipement.serial_number for _, equipement in rows]
+            index_objects(
+                SearchToken.Kind.EQUIPEMENT,
+                Equipement.objects.filter(serial_number__in=serials).only(
+                    'id', 'serial_number', 'imei'
+                ),
+            )
+            deltas = Counter()
+            for _, equipement in rows:
+                deltas.update(values_deltas(Equipement, equipement.counted_values()))
+            apply_deltas(deltas)
+    except IntegrityError:
+        # A concurrent write took one of the identifiers between the check and the insert.
+        for line, equipement in rows:
+            report['errors'].append(
+                {
+                    'row': line,
+                    'serial_number': equipement.serial_number,
+                    'errors': {
+                        'non_field_errors': 'Conflit avec une ecriture concurrente, reessayez.'
+                    },
+                }
+            )
+        return []
+    report['created'] += len(rows)
+    return [equipement.serial_number for _, equipement in rows]
+
+
+def generate_imported_qr_codes(serials):
+    missing = Q(qr_code_image='') | Q(qr_code_image__isnull=True)
+    queryset = Equipement.objects.filter(missing, serial_number__in=serials)
+    for equipement in queryset.only('id', 'serial_number', 'qr_code_image').iterator():
+        equipement.generate_qr_code()
+
+
+def import_equipements(records, user=None, filename='', batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    report = {'total': 0, 'created': 0, 'errors': [], 'dry_run': dry_run}
+    seen_serials, seen_imeis = set(), set()
+    created = []
+    records = iter(records)
+    while True:
+        batch = [
+            (line, *clean_record(record)) for line, record in islice(records, batch_size)
+        ]
+        if not batch:
+            break
+        report['total'] += len(batch)
+        created.extend(_import_batch(batch, seen_serials, seen_imeis, report, dry_run))
+
+    if created:
+        bump_data_version_on_commit()
+        if settings.QR_CODE_BACKGROUND:
+            transaction.on_commit(lambda: run_in_background(generate_imported_qr_codes, created))
+        audit_writer.record(
+            user_id=getattr(user, 'pk', None),
+            action='IMPORT',
+            target_type='Equipement',
+            details={
+                'filename': filename,
+                'total': report['total'],
+                'created': report['created'],
+                'errors': len(report['errors']),
+            },
+        )
+    return report
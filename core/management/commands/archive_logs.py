@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import archive_batch, archive_dir, load_index
+from core.models import Log
+
+
+class Command(BaseCommand):
+    help = (
+        'Move audit logs older than the retention window into compressed, '
+        'date-partitioned JSONL segments, deleting them in bounded batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LOG_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--pause', type=float, default=0.1, help='Seconds to sleep between batches'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        if options['dry_run']:
+            count = Log.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f'{count} log(s) older than {cutoff:%Y-%m-%d %H:%M} would be archived.')
+            return
+
+        index = load_index()
+        total = 0
+        while True:
+            archived = archive_batch(cutoff, options['batch_size'], index)
+            if not archived:
+                break
+            total += archived
+            self.stdout.write(f'{total} log(s) archived...')
+            if archived < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(
+            self.style.SUCCESS(f'{total} log(s) archived to {archive_dir()}.')
+        )
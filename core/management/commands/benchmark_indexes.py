@@ -0,0 +1,208 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.counters import rebuild_counters
+from core.models import Agent, Equipement, Affectation, Restitution, Incident, Log, SearchToken
+from core.search import index_queryset
+
+
+SEED_PREFIX = 'BENCH-'
+INDEXED_MODELS = [Agent, Equipement, Affectation, Restitution, Incident, Log]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large dataset and compare query plans and timings of the hot '
+        'filter/ordering queries without and with the model indexes. '
+        'Indexes are dropped temporarily: run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipements', type=int, default=20000)
+        parser.add_argument('--agents', type=int, default=2000)
+        parser.add_argument('--logs', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.repeat = options['repeat']
+        try:
+            # A partial seed is removed too.
+            self.seed(options['equipements'], options['agents'], options['logs'])
+            queries = self.build_queries()
+            self.drop_indexes()
+            try:
+                before = self.run_queries(queries, 'WITHOUT indexes')
+            finally:
+                self.create_indexes()
+            after = self.run_queries(queries, 'WITH indexes')
+
+            self.stdout.write('')
+            self.stdout.write(f"{'query':<32} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+            for label in queries:
+                speedup = before[label] / after[label] if after[label] else float('inf')
+                self.stdout.write(
+                    f'{label:<32} {before[label]:>10.2f} {after[label]:>10.2f} {speedup:>7.1f}x'
+                )
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, equipement_count, agent_count, log_count):
+        self.stdout.write(
+            f'Seeding {equipement_count} equipements, {agent_count} agents, {log_count} logs...'
+        )
+        now = timezone.now()
+        types = list(Equipement.Type.values)
+        statuses = list(Equipement.Status.values)
+        Agent.objects.bulk_create(
+            (
+                Agent(
+                    matricule=f'{SEED_PREFIX}{index:07d}',
+                    first_name=f'Prenom{index}',
+                    last_name=f'Nom{index}',
+                    status=Agent.Status.ACTIVE if index % 10 else Agent.Status.INACTIVE,
+                )
+                for index in range(agent_count)
+            ),
+            batch_size=self.batch_size,
+        )
+        Equipement.objects.bulk_create(
+            (
+                Equipement(
+                    type=types[index % len(types)],
+                    serial_number=f'{SEED_PREFIX}{index:07d}',
+                    imei=f'{index:015d}',
+                    status=statuses[index % len(statuses)],
+                )
+                for index in range(equipement_count)
+            ),
+            batch_size=self.batch_size,
+        )
+        agent_ids = list(
+            Agent.objects.filter(matricule__startswith=SEED_PREFIX).values_list('pk', flat=True)
+        )
+        equipement_ids = list(
+            Equipement.objects.filter(serial_number__startswith=SEED_PREFIX).values_list(
+                'pk', flat=True
+            )
+        )
+        Affectation.objects.bulk_create(
+            (
+                Affectation(
+                    equipement_id=equipement_id,
+                    agent_id=agent_ids[index % len(agent_ids)],
+                    assigned_at=now - timedelta(minutes=index),
+                    is_active=index % 3 == 0,
+                    notes=SEED_PREFIX,
+                )
+                for index, equipement_id in enumerate(equipement_ids)
+            ),
+            batch_size=self.batch_size,
+        )
+        Incident.objects.bulk_create(
+            (
+                Incident(
+                    equipement_id=equipement_id,
+                    incident_type=Incident.Type.BREAKDOWN,
+                    description=SEED_PREFIX,
+                    status=Incident.Status.OPEN if index % 4 == 0 else Incident.Status.CLOSED,
+                    reported_at=now - timedelta(minutes=index),
+                )
+                for index, equipement_id in enumerate(equipement_ids[::4])
+            ),
+            batch_size=self.batch_size,
+        )
+        Log.objects.bulk_create(
+            (
+                Log(
+                    action=SEED_PREFIX,
+                    target_type='Equipement',
+                    target_id=str(equipement_ids[index % len(equipement_ids)]),
+                )
+                for index in range(log_count)
+            ),
+            batch_size=self.batch_size,
+        )
+        # bulk_create sends no signals: count and index the seeded rows like saved ones.
+        rebuild_counters()
+        index_queryset(
+            SearchToken.Kind.AGENT,
+            Agent.objects.filter(matricule__startswith=SEED_PREFIX),
+            self.batch_size,
+        )
+        index_queryset(
+            SearchToken.Kind.EQUIPEMENT,
+            Equipement.objects.filter(serial_number__startswith=SEED_PREFIX),
+            self.batch_size,
+        )
+        self.agent_id = agent_ids[len(agent_ids) // 2]
+        self.equipement_id = equipement_ids[len(equipement_ids) // 2]
+        self.imei = Equipement.objects.values_list('imei', flat=True).get(pk=self.equipement_id)
+
+    def build_queries(self):
+        return {
+            'affectations agent actives': Affectation.objects.filter(
+                agent_id=self.agent_id, is_active=True
+            ),
+            'affectations equipement active': Affectation.objects.filter(
+                equipement_id=self.equipement_id, is_active=True
+            ),
+            'affectations recentes': Affectation.objects.order_by('-assigned_at', '-id')[:25],
+            'equipements statut/type': Equipement.objects.filter(
+                status=Equipement.Status.AVAILABLE, type=Equipement.Type.TABLETTE
+            ).order_by('id')[:25],
+            'equipements par imei': Equipement.objects.filter(imei=self.imei),
+            'incidents ouverts recents': Incident.objects.filter(
+                status=Incident.Status.OPEN
+            ).order_by('-reported_at')[:25],
+            'restitutions recentes': Restitution.objects.order_by('-returned_at', '-id')[:25],
+            'logs recents': Log.objects.order_by('-created_at', '-id')[:25],
+            'logs par cible': Log.objects.filter(
+                target_type='Equipement', target_id=str(self.equipement_id)
+            ),
+        }
+
+    def run_queries(self, queries, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {title} =='))
+        timings = {}
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_LABEL(label))
+            self.stdout.write(queryset.explain())
+            samples = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                samples.append((time.perf_counter() - start) * 1000)
+            timings[label] = statistics.median(samples)
+            self.stdout.write(f'median: {timings[label]:.2f} ms')
+        return timings
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+    def cleanup(self):
+        self.stdout.write('Removing seeded rows...')
+        Log.objects.filter(action=SEED_PREFIX).delete()
+        Incident.objects.filter(description=SEED_PREFIX).delete()
+        Affectation.objects.filter(notes=SEED_PREFIX).delete()
+        Equipement.objects.filter(serial_number__startswith=SEED_PREFIX).delete()
+        Agent.objects.filter(matricule__startswith=SEED_PREFIX).delete()
+        # A partial seed was never counted: recount rather than trust the delete signals.
+        rebuild_counters()
@@ -0,0 +1,163 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models.signals import post_delete
+from django.test.utils import CaptureQueriesContext
+
+from core.auth_views import IdentifierTokenObtainPairSerializer, resolve_login
+from core.counters import rebuild_counters
+from core.models import Agent, SearchToken
+from core.search import index_queryset
+from core.signals import revoke_tokens_on_agent_delete, revoke_tokens_on_delete
+
+
+SEED_PREFIX = 'BENCHLOGIN'
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed agent accounts and measure identifier resolution and login throughput '
+        '(resolution, password check and token issue) under a concurrent burst.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded accounts')
+
+    def handle(self, *args, **options):
+        self.seed(options['users'], options['batch_size'])
+        try:
+            self.benchmark_resolution(options['users'], options['repeat'])
+            self.benchmark_burst(options['users'], options['logins'], options['concurrency'])
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, count, batch_size):
+        self.stdout.write(f'Seeding {count} agent accounts...')
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{SEED_PREFIX.lower()}{index}',
+                    email=f'{SEED_PREFIX}.{index}@Example.org',
+                    phone=f'+22199{index:07d}',
+                    password=password,
+                    role=User.Role.AGENT,
+                )
+                for index in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        user_ids = User.objects.filter(username__startswith=SEED_PREFIX.lower()).values_list(
+            'username', 'pk'
+        )
+        Agent.objects.bulk_create(
+            (
+                Agent(
+                    user_id=pk,
+                    matricule=f'{SEED_PREFIX}-{username[len(SEED_PREFIX):]}',
+                    first_name='Bench',
+                    last_name=username,
+                )
+                for username, pk in user_ids
+            ),
+            batch_size=batch_size,
+        )
+        # bulk_create sends no signals: count and index the seeded agents like saved ones.
+        rebuild_counters()
+        index_queryset(
+            SearchToken.Kind.AGENT,
+            Agent.objects.filter(matricule__startswith=f'{SEED_PREFIX}-'),
+            batch_size,
+        )
+
+    def identifiers(self, index):
+        return {
+            'username': f'{SEED_PREFIX.lower()}{index}',
+            'email': f'{SEED_PREFIX.lower()}.{index}@example.org',
+            'phone': f'+22199{index:07d}',
+            'matricule': f'{SEED_PREFIX}-{index}',
+        }
+
+    def benchmark_resolution(self, count, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING('\n== Identifier resolution =='))
+        self.stdout.write(f"{'identifier':<12} {'queries':>8} {'median ms':>10} {'p95 ms':>8}")
+        target = count // 2
+        for kind, identifier in self.identifiers(target).items():
+            with CaptureQueriesContext(connection) as ctx:
+                resolve_login(identifier)
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                resolve_login(identifier)
+                samples.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{kind:<12} {len(ctx.captured_queries):>8} '
+                f'{statistics.median(samples):>10.3f} {percentile(samples, 95):>8.3f}'
+            )
+
+    def benchmark_burst(self, count, logins, concurrency):
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f'\n== Login burst: {logins} logins, {concurrency} concurrent =='
+            )
+        )
+        kinds = ['username', 'email', 'phone', 'matricule']
+
+        def login(index):
+            identifier = self.identifiers(index % count)[kinds[index % len(kinds)]]
+            start = time.perf_counter()
+            try:
+                serializer = IdentifierTokenObtainPairSerializer(
+                    data={'username': identifier, 'password': PASSWORD}
+                )
+                ok = serializer.is_valid()
+            finally:
+                connections.close_all()
+            return ok, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(login, range(logins)))
+        elapsed = time.perf_counter() - start
+        samples = [duration for _, duration in results]
+        failures = sum(1 for ok, _ in results if not ok)
+        self.stdout.write(
+            f'{logins / elapsed:.1f} logins/s, median {statistics.median(samples):.1f} ms, '
+            f'p95 {percentile(samples, 95):.1f} ms, {failures} failure(s)'
+        )
+        self.stdout.write(
+            'Password hashing dominates a login: size the web workers to the CPU count '
+            'and compare with the resolution timings above.'
+        )
+
+    def cleanup(self):
+        self.stdout.write('Removing seeded accounts...')
+        User = get_user_model()
+        # The burst's tokens never leave this process: skip the revocation rows.
+        post_delete.disconnect(revoke_tokens_on_agent_delete, sender=Agent)
+        post_delete.disconnect(revoke_tokens_on_delete, sender=User)
+        try:
+            Agent.objects.filter(matricule__startswith=f'{SEED_PREFIX}-').delete()
+            User.objects.filter(username__startswith=SEED_PREFIX.lower()).delete()
+        finally:
+            post_delete.connect(revoke_tokens_on_agent_delete, sender=Agent)
+            post_delete.connect(revoke_tokens_on_delete, sender=User)
+        rebuild_counters()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
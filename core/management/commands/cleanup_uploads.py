@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.uploads import cleanup_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and already used resumable upload sessions and their files.'
+
+    def handle(self, *args, **options):
+        removed = cleanup_uploads()
+        self.stdout.write(self.style.SUCCESS(f'{removed} upload session(s) removed.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import Equipement
+
+
+class Command(BaseCommand):
+    help = 'Render and store the QR code of every equipement that does not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate existing codes too')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        queryset = Equipement.objects.only('id', 'serial_number', 'qr_code_image').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(Q(qr_code_image='') | Q(qr_code_image__isnull=True))
+        total = 0
+        for equipement in queryset.iterator(chunk_size=options['chunk_size']):
+            equipement.generate_qr_code()
+            total += 1
+            if total % options['chunk_size'] == 0:
+                self.stdout.write(f'{total} QR code(s) generated...')
+        self.stdout.write(self.style.SUCCESS(f'{total} QR code(s) generated.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import IMPORT_BATCH_SIZE, ImportFormatError, import_equipements, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import equipements from a CSV or XLSX manifest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as handle:
+                report = import_equipements(
+                    read_rows(handle, path),
+                    filename=path,
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+        for error in report['errors']:
+            messages = '; '.join(f'{field}: {message}' for field, message in error['errors'].items())
+            self.stderr.write(f"Ligne {error['row']} ({error['serial_number']}): {messages}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['created']}/{report['total']} equipement(s) importe(s), "
+                f"{len(report['errors'])} erreur(s)."
+            )
+        )
@@ -0,0 +1,219 @@
+import http.client
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import import_equipements
+from core.models import Affectation, Agent, Equipement, Restitution
+
+from .benchmark_login import percentile
+
+
+SEED_PREFIX = 'LOADTEST'
+PASSWORD = 'load-test-password'
+STEPS = ('login', 'list', 'assign')
+
+
+class Client:
+    """One virtual user: a keep-alive HTTP connection to the server under test."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.token = None
+
+    def request(self, method, path, payload=None):
+        headers = {'Accept': 'application/json'}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0, None
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        return response.status, data
+
+    def close(self):
+        self.connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed supervisors, agents and equipements, then replay the login, list and assign '
+        'flow against a running server and report its throughput.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+        parser.add_argument('--flows', type=int, default=20, help='Flows per virtual user')
+        parser.add_argument('--agents', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the agent choice')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['flows'] < 1 or options['agents'] < 1:
+            raise CommandError('--users, --flows and --agents must be positive.')
+        self.cleanup()
+        self.seed(options['users'], options['users'] * options['flows'], options['agents'])
+        try:
+            self.run(options)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, users, equipements, agents):
+        self.stdout.write(
+            f'Seeding {users} supervisor(s), {agents} agent(s) and {equipements} equipement(s)...'
+        )
+        User = get_user_model()
+        for index in range(users):
+            User.objects.create_user(
+                username=f'{SEED_PREFIX.lower()}{index}',
+                password=PASSWORD,
+                role=User.Role.SUPERVISOR,
+            )
+        for index in range(agents):
+            Agent.objects.create(
+                matricule=f'{SEED_PREFIX}-AG-{index}',
+                first_name='Load',
+                last_name=f'Test {index}',
+            )
+        report = import_equipements(
+            (
+                (line, {'serial_number': f'{SEED_PREFIX}-{line}', 'type': 'TABLETTE'})
+                for line in range(equipements)
+            ),
+            filename='load_test',
+        )
+        if report['errors']:
+            raise CommandError(f"Seeding failed: {report['errors'][:3]}")
+
+    def run(self, options):
+        users, flows = options['users'], options['flows']
+        equipement_ids = dict(
+            Equipement.objects.filter(serial_number__startswith=f'{SEED_PREFIX}-').values_list(
+                'serial_number', 'pk'
+            )
+        )
+        agent_ids = list(
+            Agent.objects.filter(matricule__startswith=f'{SEED_PREFIX}-AG-')
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        rng = random.Random(options['seed'])
+        # Flow n of virtual user u assigns equipement u * flows + n to a seeded agent.
+        plan = [
+            [
+                (equipement_ids[f'{SEED_PREFIX}-{user * flows + flow}'], rng.choice(agent_ids))
+                for flow in range(flows)
+            ]
+            for user in range(users)
+        ]
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f'\n== {options["base_url"]}: {users} user(s) x {flows} flow(s) =='
+            )
+        )
+
+        def virtual_user(user):
+            client = Client(options['base_url'], options['timeout'])
+            samples = {step: [] for step in STEPS}
+            failures = {step: {} for step in STEPS}
+
+            def call(step, expected, method, path, payload=None):
+                start = time.perf_counter()
+                status, data = client.request(method, path, payload)
+                samples[step].append((time.perf_counter() - start) * 1000)
+                if status != expected:
+                    failures[step][status] = failures[step].get(status, 0) + 1
+                    return None
+                return data
+
+            try:
+                for equipement, agent in plan[user]:
+                    client.token = None
+                    data = call(
+                        'login',
+                        200,
+                        'POST',
+                        '/api/login/',
+                        {'username': f'{SEED_PREFIX.lower()}{user}', 'password': PASSWORD},
+                    )
+                    if not data:
+                        continue
+                    client.token = data['access']
+                    if call('list', 200, 'GET', '/api/equipements/?status=AVAILABLE') is None:
+                        continue
+                    call(
+                        'assign',
+                        201,
+                        'POST',
+                        '/api/affectations/',
+                        {'equipement': equipement, 'agent': agent},
+                    )
+            finally:
+                client.close()
+            return samples, failures
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            results = list(pool.map(virtual_user, range(users)))
+        elapsed = time.perf_counter() - start
+
+        requests = sum(len(samples[step]) for samples, _ in results for step in STEPS)
+        completed = Equipement.objects.filter(
+            pk__in=equipement_ids.values(), status=Equipement.Status.ASSIGNED
+        ).count()
+        self.stdout.write(f"{'step':<8} {'requests':>9} {'median ms':>10} {'p95 ms':>8}  failures")
+        for step in STEPS:
+            samples = [sample for result, _ in results for sample in result[step]]
+            failures = {}
+            for _, result in results:
+                for status, count in result[step].items():
+                    failures[status] = failures.get(status, 0) + count
+            if not samples:
+                continue
+            errors = ', '.join(f'{count} x {status or "error"}' for status, count in failures.items())
+            self.stdout.write(
+                f'{step:<8} {len(samples):>9} {statistics.median(samples):>10.1f} '
+                f'{percentile(samples, 95):>8.1f}  {errors or "-"}'
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{completed}/{users * flows} flow(s) completed in {elapsed:.2f} s: '
+                f'{completed / elapsed:.1f} flows/s, {requests / elapsed:.1f} requests/s.'
+            )
+        )
+
+    def cleanup(self):
+        # Queryset deletes still send the delete signals that keep the counters in step.
+        affectations = Affectation.objects.filter(
+            equipement__serial_number__startswith=f'{SEED_PREFIX}-'
+        )
+        Restitution.objects.filter(affectation__in=affectations).delete()
+        affectations.delete()
+        Equipement.objects.filter(serial_number__startswith=f'{SEED_PREFIX}-').delete()
+        Agent.objects.filter(matricule__startswith=f'{SEED_PREFIX}-AG-').delete()
+        get_user_model().objects.filter(username__startswith=SEED_PREFIX.lower()).delete()
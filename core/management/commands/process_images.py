@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from core.images import IMAGE_FIELDS, process_images_task, unprocessed
+from core.workers import process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encode stored ID documents, signatures and photos to the configured size and '
+        'quality and generate their thumbnails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows')
+
+    def handle(self, *args, **options):
+        pending = [
+            (model._meta.label, pk) for model in IMAGE_FIELDS for pk in unprocessed(model)
+        ]
+        self.stdout.write(f'{len(pending)} row(s) with unprocessed images.')
+        if options['dry_run'] or not pending:
+            return
+        done = failed = 0
+        with process_pool(options['workers']) as pool:
+            futures = [pool.submit(process_images_task, label, pk) for label, pk in pending]
+            for count, future in enumerate(as_completed(futures), start=1):
+                try:
+                    done += future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Processing failed: {exc}')
+                if count % 100 == 0:
+                    self.stdout.write(f'{count}/{len(pending)} row(s) processed...')
+        self.stdout.write(
+            self.style.SUCCESS(f'{done} image(s) processed, {failed} row(s) failed.')
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the inventory counters from the Equipement, Incident and Agent tables.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_counters()
+        for row in rows:
+            self.stdout.write(f'{row.scope:<22} {row.key:<14} {row.value}')
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} counters rebuilt.'))
@@ -0,0 +1,59 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.filters import AffectationFilter
+from core.models import Affectation
+from core.pdf import SHEET_WRITERS, missing_sheets, render_cached_sheet, sheets_data
+from core.workers import process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the affectation sheets matching the filters into the PDF cache, and '
+        'optionally into one multi-page PDF or a ZIP of sheets.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agent', type=int, help='Agent id')
+        parser.add_argument('--project-type')
+        parser.add_argument('--after', help='Assigned at or after (ISO date)')
+        parser.add_argument('--before', help='Assigned at or before (ISO date)')
+        parser.add_argument('--active', choices=['true', 'false'])
+        parser.add_argument('--output', help='Path of a .pdf or .zip file to write')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if output and not output.endswith(('.pdf', '.zip')):
+            raise CommandError('--output must end with .pdf or .zip')
+        data = {
+            'agent': options['agent'],
+            'project_type': options['project_type'],
+            'assigned_at_after': options['after'],
+            'assigned_at_before': options['before'],
+            'is_active': options['active'],
+        }
+        filterset = AffectationFilter(
+            data={key: value for key, value in data.items() if value is not None},
+            queryset=Affectation.objects.order_by('-assigned_at'),
+        )
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+        sheets = list(sheets_data(filterset.qs))
+        self.stdout.write(f'{len(sheets)} affectation sheet(s) selected.')
+        if not sheets:
+            return
+        missing = missing_sheets(sheets)
+        if len(missing) > 1 and options['workers'] > 1:
+            with process_pool(options['workers']) as pool:
+                chunk_size = max(1, len(missing) // (options['workers'] * 4))
+                list(pool.map(render_cached_sheet, missing, chunksize=chunk_size))
+        else:
+            for data in missing:
+                render_cached_sheet(data)
+        self.stdout.write(self.style.SUCCESS(f'{len(missing)} sheet(s) rendered.'))
+        if output:
+            with open(output, 'wb') as handle:
+                SHEET_WRITERS[output.rsplit('.', 1)[1]](sheets, handle)
+            self.stdout.write(f'{len(sheets)} sheet(s) written to {output}.')
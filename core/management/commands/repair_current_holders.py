@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from core.assignments import stale_current_holders, sync_current_holders
+from core.caching import bump_data_version
+from core.models import Affectation
+
+
+class Command(BaseCommand):
+    help = (
+        'Check the current_affectation/current_agent pointers of every equipement against '
+        'its open affectation and repair the ones that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift')
+
+    def handle(self, *args, **options):
+        duplicates = (
+            Affectation.objects.filter(is_active=True)
+            .values('equipement_id')
+            .annotate(total=Count('id'))
+            .filter(total__gt=1)
+            .count()
+        )
+        if duplicates:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{duplicates} equipement(s) have several open affectations; '
+                    'the most recent one is kept as holder.'
+                )
+            )
+        stale = stale_current_holders()
+        if options['dry_run'] or not stale:
+            self.stdout.write(f'{len(stale)} equipement(s) with stale holder pointers.')
+            return
+        batch_size = max(1, options['batch_size'])
+        repaired = 0
+        for start in range(0, len(stale), batch_size):
+            with transaction.atomic():
+                repaired += sync_current_holders(stale[start : start + batch_size])
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f'{repaired} equipement(s) repaired.'))
@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ReportJob
+from core.reports import run_report_job
+from core.workers import process_pool
+
+
+class Command(BaseCommand):
+    help = 'Run pending report jobs on a local process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=3600,
+            help='Requeue RUNNING jobs started more than this many seconds ago',
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.requeue_stale(options['stale_after'])
+        running = {}
+        with process_pool(workers) as pool:
+            while True:
+                for job_id in self.claim(workers - len(running)):
+                    running[pool.submit(run_report_job, job_id)] = job_id
+                    self.stdout.write(f'Job {job_id} started')
+                if not running:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        ReportJob.objects.filter(pk=job_id).update(
+                            status=ReportJob.Status.FAILED,
+                            error=str(exc),
+                            finished_at=timezone.now(),
+                        )
+                        result = ReportJob.Status.FAILED
+                    self.stdout.write(f'Job {job_id} {result}')
+
+    def claim(self, limit):
+        if limit <= 0:
+            return []
+        claimed = []
+        pending = ReportJob.objects.filter(status=ReportJob.Status.PENDING).order_by('created_at')
+        for job_id in pending.values_list('pk', flat=True)[:limit]:
+            updated = ReportJob.objects.filter(pk=job_id, status=ReportJob.Status.PENDING).update(
+                status=ReportJob.Status.RUNNING, started_at=timezone.now()
+            )
+            if updated:
+                claimed.append(job_id)
+        return claimed
+
+    def requeue_stale(self, seconds):
+        cutoff = timezone.now() - timedelta(seconds=seconds)
+        count = ReportJob.objects.filter(
+            status=ReportJob.Status.RUNNING, started_at__lt=cutoff
+        ).update(status=ReportJob.Status.PENDING, progress=0, started_at=None)
+        if count:
+            self.stdout.write(f'{count} stale job(s) requeued')
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_agent_id_document_agent_id_number_agent_project_type"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="affectation",
+            index=models.Index(
+                fields=["agent", "is_active"], name="affect_agent_active_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="affectation",
+            index=models.Index(
+                fields=["equipement", "is_active"], name="affect_equip_active_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="affectation",
+            index=models.Index(
+                fields=["assigned_at", "id"], name="affect_assigned_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="agent",
+            index=models.Index(fields=["status"], name="agent_status_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="equipement",
+            index=models.Index(fields=["status", "type"], name="equip_status_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="equipement",
+            index=models.Index(
+                fields=["type", "condition"], name="equip_type_condition_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="equipement",
+            index=models.Index(fields=["imei"], name="equip_imei_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="incident",
+            index=models.Index(
+                fields=["status", "reported_at"], name="incident_status_reported_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="incident",
+            index=models.Index(
+                fields=["reported_at", "id"], name="incident_reported_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="log",
+            index=models.Index(fields=["created_at", "id"], name="log_created_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="log",
+            index=models.Index(
+                fields=["target_type", "target_id"], name="log_target_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restitution",
+            index=models.Index(
+                fields=["returned_at", "id"], name="restit_returned_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+COUNTER_SCOPES = {
+    "Equipement": {
+        "equipement_status": "status",
+        "equipement_type": "type",
+        "equipement_condition": "condition",
+    },
+    "Incident": {
+        "incident_type": "incident_type",
+        "incident_status": "status",
+    },
+    "Agent": {
+        "agent_status": "status",
+    },
+}
+
+
+def fill_counters(apps, schema_editor):
+    InventoryCounter = apps.get_model("core", "InventoryCounter")
+    rows = []
+    for model_name, scopes in COUNTER_SCOPES.items():
+        model = apps.get_model("core", model_name)
+        for scope, field in scopes.items():
+            for item in model.objects.values(field).annotate(total=Count("id")):
+                rows.append(
+                    InventoryCounter(scope=scope, key=item[field], value=item["total"])
+                )
+    InventoryCounter.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_reportjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(max_length=50)),
+                ("key", models.CharField(max_length=50)),
+                ("value", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "key"), name="inventorycounter_scope_key_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
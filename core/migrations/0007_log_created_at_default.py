@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_inventorycounter"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="log",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
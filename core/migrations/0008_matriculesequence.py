@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_log_created_at_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MatriculeSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prefix", models.CharField(max_length=20)),
+                ("day", models.DateField()),
+                ("last_value", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("prefix", "day"),
+                        name="matriculesequence_prefix_day_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_user_login_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TokenRevocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.BigIntegerField()),
+                ("revoked_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("reason", models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["revoked_at"], name="tokenrevocation_revoked_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_current_holders(apps, schema_editor):
+    Affectation = apps.get_model("core", "Affectation")
+    Equipement = apps.get_model("core", "Equipement")
+    active = Affectation.objects.filter(equipement=OuterRef("pk"), is_active=True).order_by(
+        "-assigned_at", "-id"
+    )
+    Equipement.objects.filter(affectations__is_active=True).update(
+        current_affectation=Subquery(active.values("pk")[:1]),
+        current_agent=Subquery(active.values("agent_id")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_tokenrevocation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="equipement",
+            name="current_affectation",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="core.affectation",
+            ),
+        ),
+        migrations.AddField(
+            model_name="equipement",
+            name="current_agent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="current_equipements",
+                to="core.agent",
+            ),
+        ),
+        migrations.RunPython(fill_current_holders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Frozen copy of core.search as of this migration: later changes to the tokenizer are
+# applied with `python manage.py rebuild_search_index`, not by replaying this one.
+SEARCH_FIELDS = {
+    "agent": {
+        "matricule": (3, "code"),
+        "first_name": (2, "words"),
+        "last_name": (2, "words"),
+        "phone": (1, "code"),
+        "id_number": (1, "code"),
+    },
+    "equipement": {
+        "serial_number": (3, "code"),
+        "imei": (2, "code"),
+    },
+}
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def words(value):
+    value = unicodedata.normalize("NFKD", str(value or "")).lower()
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return [word for word in NON_ALNUM.split(value) if word]
+
+
+def object_tokens(kind, instance):
+    weights = {}
+    for field, (weight, mode) in SEARCH_FIELDS[kind].items():
+        parts = words(getattr(instance, field, None))
+        if mode == "code" and len(parts) > 1:
+            parts.append("".join(parts))
+        for part in parts:
+            tokens = {part[:1], part[:2]}
+            tokens.update(part[index : index + 3] for index in range(len(part) - 2))
+            for token in tokens:
+                weights[token] = max(weights.get(token, 0), weight)
+    return weights
+
+
+def fill_search_index(apps, schema_editor):
+    SearchToken = apps.get_model("core", "SearchToken")
+    for kind, model_name in [("agent", "Agent"), ("equipement", "Equipement")]:
+        model = apps.get_model("core", model_name)
+        queryset = model.objects.only("id", *SEARCH_FIELDS[kind])
+        SearchToken.objects.bulk_create(
+            (
+                SearchToken(kind=kind, object_id=instance.pk, token=token, weight=weight)
+                for instance in queryset.iterator()
+                for token, weight in object_tokens(kind, instance).items()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_equipement_current_holder"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("agent", "Agent"), ("equipement", "Equipement")],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("token", models.CharField(max_length=3)),
+                ("weight", models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["token", "kind", "object_id"],
+                        name="searchtoken_lookup_idx",
+                    ),
+                    models.Index(
+                        fields=["kind", "object_id"], name="searchtoken_object_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
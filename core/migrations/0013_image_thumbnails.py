@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_searchtoken"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="affectation",
+            name="equipement_photo_thumbnail",
+            field=models.ImageField(blank=True, null=True, upload_to="thumbnails/"),
+        ),
+        migrations.AddField(
+            model_name="affectation",
+            name="signature_thumbnail",
+            field=models.ImageField(blank=True, null=True, upload_to="thumbnails/"),
+        ),
+        migrations.AddField(
+            model_name="agent",
+            name="id_document_thumbnail",
+            field=models.ImageField(blank=True, null=True, upload_to="thumbnails/"),
+        ),
+        migrations.AddField(
+            model_name="restitution",
+            name="equipement_photo_thumbnail",
+            field=models.ImageField(blank=True, null=True, upload_to="thumbnails/"),
+        ),
+    ]
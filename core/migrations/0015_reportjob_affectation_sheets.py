@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reportjob",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("EXCEL", "Rapport Excel"),
+                    ("PDF", "Rapport PDF"),
+                    ("EXPORT", "Export de liste"),
+                    ("AFFECTATION_SHEETS", "Fiches d'affectation"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
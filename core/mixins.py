@@ -1,30 +1,126 @@
-from .models import Log
+from django.db import transaction
+
+from .audit import audit_writer
+from .models import Agent
+from .caching import bump_data_version_on_commit
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_CONTENT_TYPES, export_response
+from .serializers import relation_paths
 from .utils import get_client_ip
 
 
+def query_param_list(request, name):
+    """Comma-separated values of a query parameter, or ``None`` when it is absent."""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
 class AuditLogMixin:
     action_create = 'CREATE'
     action_update = 'UPDATE'
     action_delete = 'DELETE'
 
     def _log_action(self, request, action, instance, details=None):
-        Log.objects.create(
-            user=request.user if request.user.is_authenticated else None,
+        audit_writer.record(
+            user_id=request.user.pk if request.user.is_authenticated else None,
             action=action,
             target_type=instance.__class__.__name__,
             target_id=str(instance.pk),
             details=details or {},
             ip_address=get_client_ip(request),
         )
+        bump_data_version_on_commit()
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save()
         self._log_action(self.request, self.action_create, instance)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         instance = serializer.save()
         self._log_action(self.request, self.action_update, instance)
 
+    @transaction.atomic
     def perform_destroy(self, instance):
         self._log_action(self.request, self.action_delete, instance)
         instance.delete()
+
+
+class SparseFieldsMixin:
+    sparse_field_actions = ('list', 'retrieve')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request is not None and self.action in self.sparse_field_actions:
+            for name in ('fields', 'expand'):
+                values = query_param_list(self.request, name)
+                if values is not None:
+                    kwargs.setdefault(name, values)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        paths = relation_paths(self.get_serializer())
+        if paths:
+            queryset = queryset.select_related(*paths)
+        return queryset
+
+
+class ExportMixin:
+    export_fields = ()
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    def list(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export')
+        if export_format not in EXPORT_CONTENT_TYPES or not self.export_fields:
+            return super().list(request, *args, **kwargs)
+        fields = list(self.export_fields)
+        selected = query_param_list(request, 'fields')
+        if selected:
+            fields = [field for field in fields if field in selected] or fields
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(
+            queryset, fields, export_format, self.basename, chunk_size=self.export_chunk_size
+        )
+
+
+_UNRESOLVED = object()
+
+
+def request_agent_id(request):
+    """Id of the caller's agent profile, resolved at most once per request.
+
+    Token users carry it as a claim; other users cost one indexed lookup.
+    """
+    agent_id = getattr(request, '_agent_id', _UNRESOLVED)
+    if agent_id is _UNRESOLVED:
+        user = request.user
+        if 'agent_id' in vars(user):
+            agent_id = user.agent_id
+        else:
+            agent_id = (
+                Agent.objects.filter(user_id=user.pk).values_list('pk', flat=True).first()
+            )
+        request._agent_id = agent_id
+    return agent_id
+
+
+class RoleScopedMixin:
+    # Lookup from the viewset's model to the owning agent id, for AGENT callers.
+    agent_scope = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        if getattr(user, 'role', None) != 'AGENT':
+            return queryset
+        agent_id = request_agent_id(self.request)
+        if agent_id is None:
+            return queryset.none()
+        return self.scope_to_agent(queryset, agent_id)
+
+    def scope_to_agent(self, queryset, agent_id):
+        return queryset.filter(**{self.agent_scope: agent_id})
@@ -1,10 +1,68 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.files.base import ContentFile
+from django.db.models.functions import Lower
 from django.utils import timezone
 from io import BytesIO
 import qrcode
 
+from .utils import EQUIPEMENT_CODE_PREFIX
+
+
+class CountedModel(models.Model):
+    counted_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_counted_values()
+        return instance
+
+    def counted_values(self):
+        return {name: self.__dict__.get(name) for name in self.counted_fields}
+
+    def remember_counted_values(self):
+        self._counted_values = self.counted_values()
+
+    def lock_counted_values(self, using):
+        # The snapshot taken when the instance was loaded may predate a concurrent write:
+        # the deltas start from the committed row, locked until this transaction ends.
+        self._counted_values = (
+            type(self)._base_manager.using(using)
+            .select_for_update()
+            .filter(pk=self.pk)
+            .values(*self.counted_fields)
+            .first()
+        )
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic(using=using, savepoint=False):
+            if not self._state.adding and self.pk is not None and (
+                update_fields is None or set(update_fields) & set(self.counted_fields)
+            ):
+                self.lock_counted_values(using)
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self.lock_counted_values(using)
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        current = self.counted_values()
+        snapshot = getattr(self, '_counted_values', None) or current
+        self._counted_values = {
+            name: current[name] if fields is None or name in fields else snapshot[name]
+            for name in self.counted_fields
+        }
+
 
 class User(AbstractUser):
     class Role(models.TextChoices):
@@ -15,17 +73,38 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=Role.choices, default=Role.AGENT)
     phone = models.CharField(max_length=30, blank=True)
 
+    # Changing any of these invalidates the tokens issued before the change.
+    token_fields = ('role', 'is_superuser', 'is_active', 'password')
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Login resolves identifiers by case-insensitive email and by phone.
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(fields=['phone'], name='user_phone_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.role == self.Role.ADMIN:
             self.is_staff = True
             self.is_superuser = True
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._token_values = instance.token_values()
+        return instance
+
+    def token_values(self):
+        return {name: self.__dict__.get(name) for name in self.token_fields}
+
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
 
-class Agent(models.Model):
+class Agent(CountedModel):
+    counted_fields = ('status',)
+
     class Status(models.TextChoices):
         ACTIVE = 'ACTIVE', 'Actif'
         INACTIVE = 'INACTIVE', 'Inactif'
@@ -41,16 +120,24 @@ class Agent(models.Model):
     address = models.TextField(blank=True)
     id_number = models.CharField(max_length=100, blank=True)
     id_document = models.ImageField(upload_to='id_documents/', blank=True, null=True)
+    id_document_thumbnail = models.ImageField(upload_to='thumbnails/', blank=True, null=True)
     project_type = models.CharField(max_length=100, blank=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='agent_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.matricule} - {self.first_name} {self.last_name}"
 
 
-class Equipement(models.Model):
+class Equipement(CountedModel):
+    counted_fields = ('status', 'type', 'condition')
+
     class Type(models.TextChoices):
         TABLETTE = 'TABLETTE', 'Tablette'
         CHARGEUR = 'CHARGEUR', 'Chargeur'
@@ -74,23 +161,41 @@ class Equipement(models.Model):
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.AVAILABLE)
     condition = models.CharField(max_length=20, choices=Condition.choices, default=Condition.GOOD)
     qr_code_image = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    # Copy of the open affectation, kept in step by the assignment and restitution flows.
+    current_affectation = models.ForeignKey(
+        'Affectation', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    current_agent = models.ForeignKey(
+        Agent,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='current_equipements',
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_qr_code(self):
-        data = f"EQUIPEMENT:{self.serial_number}"
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'type'], name='equip_status_type_idx'),
+            models.Index(fields=['type', 'condition'], name='equip_type_condition_idx'),
+            models.Index(fields=['imei'], name='equip_imei_idx'),
+        ]
+
+    def render_qr_code(self):
+        data = f"{EQUIPEMENT_CODE_PREFIX}{self.serial_number}"
         qr = qrcode.make(data)
         buffer = BytesIO()
         qr.save(buffer, format='PNG')
-        filename = f"qr_{self.serial_number}.png"
-        self.qr_code_image.save(filename, ContentFile(buffer.getvalue()), save=False)
+        return buffer.getvalue()
 
-    def save(self, *args, **kwargs):
-        creating = self.pk is None
-        super().save(*args, **kwargs)
-        if creating and not self.qr_code_image:
-            self.generate_qr_code()
-            super().save(update_fields=['qr_code_image'])
+    def generate_qr_code(self):
+        # Stored with a queryset update: no second save(), signals or updated_at bump.
+        if self.qr_code_image:
+            self.qr_code_image.delete(save=False)
+        filename = f"qr_{self.serial_number}.png"
+        self.qr_code_image.save(filename, ContentFile(self.render_qr_code()), save=False)
+        Equipement.objects.filter(pk=self.pk).update(qr_code_image=self.qr_code_image.name)
 
     def __str__(self):
         return f"{self.type} - {self.serial_number}"
@@ -107,10 +212,21 @@ class Affectation(models.Model):
     assigned_at = models.DateTimeField(default=timezone.now)
     expected_return_at = models.DateTimeField(null=True, blank=True)
     signature = models.ImageField(upload_to='signatures/', blank=True, null=True)
+    signature_thumbnail = models.ImageField(upload_to='thumbnails/', blank=True, null=True)
     equipement_photo = models.ImageField(upload_to='equipement_photos/', blank=True, null=True)
+    equipement_photo_thumbnail = models.ImageField(
+        upload_to='thumbnails/', blank=True, null=True
+    )
     notes = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['agent', 'is_active'], name='affect_agent_active_idx'),
+            models.Index(fields=['equipement', 'is_active'], name='affect_equip_active_idx'),
+            models.Index(fields=['assigned_at', 'id'], name='affect_assigned_at_idx'),
+        ]
+
     def __str__(self):
         return f"Affectation {self.id} - {self.equipement} -> {self.agent}"
 
@@ -131,12 +247,22 @@ class Restitution(models.Model):
     condition = models.CharField(max_length=20, choices=Condition.choices, default=Condition.GOOD)
     notes = models.TextField(blank=True)
     equipement_photo = models.ImageField(upload_to='restitutions/', blank=True, null=True)
+    equipement_photo_thumbnail = models.ImageField(
+        upload_to='thumbnails/', blank=True, null=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['returned_at', 'id'], name='restit_returned_at_idx'),
+        ]
 
     def __str__(self):
         return f"Restitution {self.id} - {self.affectation.equipement}"
 
 
-class Incident(models.Model):
+class Incident(CountedModel):
+    counted_fields = ('incident_type', 'status')
+
     class Type(models.TextChoices):
         LOSS = 'LOSS', 'Perte'
         THEFT = 'THEFT', 'Vol'
@@ -161,6 +287,12 @@ class Incident(models.Model):
     reported_at = models.DateTimeField(default=timezone.now)
     closed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'reported_at'], name='incident_status_reported_idx'),
+            models.Index(fields=['reported_at', 'id'], name='incident_reported_at_idx'),
+        ]
+
     def __str__(self):
         return f"Incident {self.id} - {self.get_incident_type_display()}"
 
@@ -172,7 +304,13 @@ class Log(models.Model):
     target_id = models.CharField(max_length=64, blank=True)
     details = models.JSONField(blank=True, null=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='log_created_at_idx'),
+            models.Index(fields=['target_type', 'target_id'], name='log_target_idx'),
+        ]
 
     def __str__(self):
         return f"{self.action} - {self.created_at:%Y-%m-%d %H:%M:%S}"
@@ -200,3 +338,134 @@ class AgentInvite(models.Model):
         status = 'used' if self.is_used() else 'active'
         return f"Invite {self.token} ({status})"
 
+
+
+class ReportJob(models.Model):
+    class Kind(models.TextChoices):
+        EXCEL = 'EXCEL', 'Rapport Excel'
+        PDF = 'PDF', 'Rapport PDF'
+        EXPORT = 'EXPORT', 'Export de liste'
+        AFFECTATION_SHEETS = 'AFFECTATION_SHEETS', "Fiches d'affectation"
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'En attente'
+        RUNNING = 'RUNNING', 'En cours'
+        DONE = 'DONE', 'Termine'
+        FAILED = 'FAILED', 'Echec'
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    output = models.FileField(upload_to='reports/', blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='reportjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"ReportJob {self.id} - {self.kind} ({self.status})"
+
+
+class InventoryCounter(models.Model):
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='inventorycounter_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} = {self.value}"
+
+
+class MatriculeSequence(models.Model):
+    prefix = models.CharField(max_length=20)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prefix', 'day'], name='matriculesequence_prefix_day_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix}{self.day:%Y%m%d}: {self.last_value}"
+
+
+class TokenRevocation(models.Model):
+    # Plain id, not a foreign key: revocations must outlive a deleted account.
+    user_id = models.BigIntegerField()
+    revoked_at = models.DateTimeField(default=timezone.now)
+    reason = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['revoked_at'], name='tokenrevocation_revoked_idx'),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} - {self.revoked_at:%Y-%m-%d %H:%M:%S}"
+
+
+class SearchToken(models.Model):
+    class Kind(models.TextChoices):
+        AGENT = 'agent', 'Agent'
+        EQUIPEMENT = 'equipement', 'Equipement'
+
+    # Plain id, not a foreign key: one table indexes several models.
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    token = models.CharField(max_length=3)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'kind', 'object_id'], name='searchtoken_lookup_idx'),
+            models.Index(fields=['kind', 'object_id'], name='searchtoken_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.token}"
+
+
+class UploadSession(models.Model):
+    class Status(models.TextChoices):
+        OPEN = 'OPEN', 'En cours'
+        COMPLETE = 'COMPLETE', 'Termine'
+
+    token = models.CharField(max_length=64, unique=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.OPEN)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='uploadsession_expires_idx'),
+        ]
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.received}/{self.size})"
@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TimelinePagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Curseur invalide.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.keyset_field = view.keyset_field
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.keyset_field}', '-pk')
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(**{f'{self.keyset_field}__lte': value}).filter(
+                Q(**{f'{self.keyset_field}__lt': value}) | Q(pk__lt=pk)
+            )
+        rows = list(queryset[: page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.rows = rows[:page_size]
+        return self.rows
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            # Every keyset field is a timestamp; anything else would fail in the query.
+            value = parse_datetime(value) if isinstance(value, str) else None
+            if value is None or isinstance(pk, bool):
+                raise ValueError(value)
+            return value, int(pk)
+        except (TypeError, ValueError, UnicodeEncodeError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    def encode_cursor(self, instance):
+        return self.encode_position(getattr(instance, self.keyset_field), instance.pk)
+
+    def encode_position(self, value, pk):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps([value, pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.rows[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
+
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from pypdf import PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+
+SHEET_FIELDS = {
+    'id': 'id',
+    'serial_number': 'equipement__serial_number',
+    'matricule': 'agent__matricule',
+    'assigned_at': 'assigned_at',
+    'expected_return_at': 'expected_return_at',
+    'is_active': 'is_active',
+    'notes': 'notes',
+}
+
+
+def sheet_data(affectation):
+    return {
+        'id': affectation.id,
+        'serial_number': affectation.equipement.serial_number,
+        'matricule': affectation.agent.matricule,
+        'assigned_at': affectation.assigned_at,
+        'expected_return_at': affectation.expected_return_at,
+        'is_active': affectation.is_active,
+        'notes': affectation.notes,
+    }
+
+
+def sheets_data(queryset):
+    """Sheet values of every affectation of ``queryset`` in one query."""
+    for row in queryset.values(*SHEET_FIELDS.values()).iterator():
+        yield {key: row[path] for key, path in SHEET_FIELDS.items()}
+
+
+def draw_sheet(pdf, data):
+    pdf.setTitle(f"Affectation {data['id']}")
+    y = 800
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawString(40, y, 'Fiche d\'affectation')
+    y -= 30
+    pdf.setFont('Helvetica', 11)
+    pdf.drawString(40, y, f"ID: {data['id']}")
+    y -= 18
+    pdf.drawString(40, y, f"Equipement: {data['serial_number']}")
+    y -= 18
+    pdf.drawString(40, y, f"Agent: {data['matricule']}")
+    y -= 18
+    pdf.drawString(40, y, f"Affecte le: {data['assigned_at']:%Y-%m-%d}")
+    y -= 18
+    if data['expected_return_at']:
+        pdf.drawString(40, y, f"Retour prevu: {data['expected_return_at']:%Y-%m-%d}")
+        y -= 18
+    pdf.drawString(40, y, f"Statut: {'Active' if data['is_active'] else 'Cloturee'}")
+    y -= 18
+    if data['notes']:
+        pdf.drawString(40, y, f"Notes: {data['notes']}")
+    pdf.showPage()
+
+
+def render_sheets(sheets, output):
+    """Draw one page per sheet into ``output``, a path or a binary file object."""
+    pdf = canvas.Canvas(output, pagesize=A4)
+    for data in sheets:
+        draw_sheet(pdf, data)
+    pdf.save()
+    return output
+
+
+def sheet_digest(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def cache_dir():
+    return Path(settings.PDF_CACHE_DIR)
+
+
+def cache_path(data):
+    # A change to any printed value changes the name: stale sheets are never served.
+    return cache_dir() / f"affectation_{data['id']}_{sheet_digest(data)}.pdf"
+
+
+def render_cached_sheet(data):
+    """Render ``data`` to the cache unless it is there already; returns the path."""
+    path = cache_path(data)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            render_sheets([data], output)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    for stale in path.parent.glob(f"affectation_{data['id']}_*.pdf"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path
+
+
+def cached_sheet(data):
+    return render_cached_sheet(data).read_bytes()
+
+
+def missing_sheets(sheets):
+    return [data for data in sheets if not cache_path(data).exists()]
+
+
+def fill_cache(sheets):
+    """Cache path of every sheet, rendering the missing ones in this process."""
+    return [render_cached_sheet(data) for data in sheets]
+
+
+def write_pdf(sheets, output):
+    """One document made of the cached sheets, in order."""
+    writer = PdfWriter()
+    for path in fill_cache(sheets):
+        writer.append(str(path))
+    writer.write(output)
+    return output
+
+
+def write_zip(sheets, output):
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for data, path in zip(sheets, fill_cache(sheets)):
+            archive.write(path, arcname=f"affectation_{data['id']}.pdf")
+    return output
+
+
+SHEET_WRITERS = {
+    'pdf': write_pdf,
+    'zip': write_zip,
+}
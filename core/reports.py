@@ -0,0 +1,232 @@
+import logging
+import tempfile
+
+from django.core.files import File
+from django.utils import timezone
+from django_filters.utils import translate_validation
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from .counters import read_counters
+from .exports import (
+    EXPORT_CHUNK_SIZE,
+    export_headers,
+    iter_rows,
+    stream_csv,
+    stream_ndjson,
+    write_xlsx,
+)
+from .models import Agent, Equipement, Incident, ReportJob
+from .pdf import SHEET_WRITERS, render_cached_sheet, sheets_data
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_RESOURCES = {
+    'users': 'UserViewSet',
+    'agents': 'AgentViewSet',
+    'equipements': 'EquipementViewSet',
+    'affectations': 'AffectationViewSet',
+    'restitutions': 'RestitutionViewSet',
+    'incidents': 'IncidentViewSet',
+    'logs': 'LogViewSet',
+}
+
+EQUIPEMENT_SHEET = (
+    'Equipements',
+    ['Type', 'Numero de serie', 'IMEI', 'Statut', 'Etat'],
+    ['type', 'serial_number', 'imei', 'status', 'condition'],
+)
+AGENT_SHEET = (
+    'Agents',
+    ['Matricule', 'Prenom', 'Nom', 'Telephone', 'Email', 'Statut'],
+    ['matricule', 'first_name', 'last_name', 'phone', 'email', 'status'],
+)
+
+
+def _counter_items(counters, scope, choices, name):
+    return [
+        {name: key, 'total': counters[scope][key]}
+        for key in choices.values
+        if counters[scope].get(key)
+    ]
+
+
+def report_summary():
+    counters = read_counters()
+    return {
+        'equipements_by_status': _counter_items(
+            counters, 'equipement_status', Equipement.Status, 'status'
+        ),
+        'equipements_by_type': _counter_items(
+            counters, 'equipement_type', Equipement.Type, 'type'
+        ),
+        'equipements_by_condition': _counter_items(
+            counters, 'equipement_condition', Equipement.Condition, 'condition'
+        ),
+        'incidents_by_type': _counter_items(
+            counters, 'incident_type', Incident.Type, 'incident_type'
+        ),
+        'incidents_by_status': _counter_items(
+            counters, 'incident_status', Incident.Status, 'status'
+        ),
+        'agents_active': counters['agent_status'].get(Agent.Status.ACTIVE, 0),
+        'agents_inactive': counters['agent_status'].get(Agent.Status.INACTIVE, 0),
+    }
+
+
+def excel_report_sheets(progress=None):
+    sheets = []
+    for model, (title, headers, fields) in [
+        (Equipement, EQUIPEMENT_SHEET),
+        (Agent, AGENT_SHEET),
+    ]:
+        rows = iter_rows(model.objects.all(), fields)
+        if progress is not None:
+            rows = progress.track(rows)
+        sheets.append((title, headers, rows))
+    return sheets
+
+
+def write_pdf_report(handle):
+    pdf = canvas.Canvas(handle, pagesize=A4)
+    pdf.setTitle('Rapports EquipTrack')
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawString(40, 800, 'Rapport EquipTrack')
+    pdf.setFont('Helvetica', 11)
+
+    summary = report_summary()
+
+    y = 760
+    pdf.drawString(40, y, 'Equipements par statut:')
+    y -= 18
+    for item in summary['equipements_by_status']:
+        pdf.drawString(60, y, f"{item['status']}: {item['total']}")
+        y -= 16
+
+    y -= 10
+    pdf.drawString(40, y, 'Incidents par type:')
+    y -= 18
+    for item in summary['incidents_by_type']:
+        pdf.drawString(60, y, f"{item['incident_type']}: {item['total']}")
+        y -= 16
+
+    pdf.showPage()
+    pdf.save()
+    return handle
+
+
+def export_viewset(resource):
+    from . import views
+
+    return getattr(views, EXPORT_RESOURCES[resource])
+
+
+def can_export(resource, request):
+    """Whether the caller may list ``resource`` through its own endpoint.
+
+    Jobs are created by admins and supervisors, whom RoleScopedMixin does not narrow:
+    the permission classes of the viewset are the only check left to apply.
+    """
+    view = export_viewset(resource)()
+    view.request = request
+    view.action = 'list'
+    view.format_kwarg = None
+    return all(
+        permission.has_permission(request, view) for permission in view.get_permissions()
+    )
+
+
+def export_queryset(resource, filters=None):
+    viewset = export_viewset(resource)
+    queryset = viewset.queryset.all()
+    filterset_class = getattr(viewset, 'filterset_class', None)
+    if filterset_class is not None and filters:
+        filterset = filterset_class(data=filters, queryset=queryset)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        queryset = filterset.qs
+    return queryset
+
+
+class JobProgress:
+    def __init__(self, job, total, step=EXPORT_CHUNK_SIZE):
+        self.job = job
+        self.total = max(total, 1)
+        self.step = step
+        self.done = 0
+
+    def track(self, rows):
+        for row in rows:
+            self.done += 1
+            if self.done % self.step == 0:
+                progress = min(99, self.done * 100 // self.total)
+                ReportJob.objects.filter(pk=self.job.pk).update(progress=progress)
+            yield row
+
+
+def _build_excel(job, handle):
+    progress = JobProgress(job, Equipement.objects.count() + Agent.objects.count())
+    write_xlsx(handle, excel_report_sheets(progress))
+    return 'rapports.xlsx'
+
+
+def _build_pdf(job, handle):
+    write_pdf_report(handle)
+    return 'rapports.pdf'
+
+
+def _build_export(job, handle):
+    resource = job.params['resource']
+    export_format = job.params['format']
+    viewset = export_viewset(resource)
+    fields = list(viewset.export_fields)
+    queryset = export_queryset(resource, job.params.get('filters'))
+    rows = JobProgress(job, queryset.count()).track(iter_rows(queryset, fields))
+    headers = export_headers(fields)
+    if export_format == 'xlsx':
+        write_xlsx(handle, [(resource, headers, rows)])
+    else:
+        writer = stream_csv if export_format == 'csv' else stream_ndjson
+        for line in writer(headers, rows):
+            handle.write(line.encode('utf-8'))
+    return f'{resource}.{export_format}'
+
+
+def _build_affectation_sheets(job, handle):
+    sheets = list(sheets_data(export_queryset('affectations', job.params.get('filters'))))
+    # Render the missing sheets first, with progress; the writer then only reads the cache.
+    rendered = (render_cached_sheet(data) for data in sheets)
+    for _ in JobProgress(job, len(sheets), step=50).track(rendered):
+        pass
+    SHEET_WRITERS[job.params['format']](sheets, handle)
+    return f"affectations.{job.params['format']}"
+
+
+JOB_BUILDERS = {
+    ReportJob.Kind.EXCEL: _build_excel,
+    ReportJob.Kind.PDF: _build_pdf,
+    ReportJob.Kind.EXPORT: _build_export,
+    ReportJob.Kind.AFFECTATION_SHEETS: _build_affectation_sheets,
+}
+
+
+def run_report_job(job_id):
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        with tempfile.TemporaryFile() as handle:
+            filename = JOB_BUILDERS[job.kind](job, handle)
+            handle.seek(0)
+            job.output.save(filename, File(handle), save=False)
+    except Exception as exc:
+        logger.exception('Report job %s failed', job_id)
+        job.status = ReportJob.Status.FAILED
+        job.error = str(exc)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job.status
+    job.status = ReportJob.Status.DONE
+    job.progress = 100
+    job.finished_at = timezone.now()
+    job.save(update_fields=['output', 'status', 'progress', 'finished_at'])
+    return job.status
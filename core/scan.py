@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import FilteredRelation, Q
+
+from .caching import data_version
+from .models import Equipement, Incident
+from .utils import parse_equipement_code
+
+
+EQUIPEMENT_FIELDS = ['id', 'type', 'serial_number', 'imei', 'status', 'condition']
+AFFECTATION_FIELDS = ['id', 'assigned_at', 'expected_return_at']
+AGENT_FIELDS = ['id', 'matricule', 'first_name', 'last_name', 'phone', 'project_type']
+INCIDENT_FIELDS = ['id', 'incident_type', 'description', 'reported_at']
+
+
+def _pick(row, prefix, fields):
+    return {field: row[f'{prefix}{field}'] for field in fields}
+
+
+def resolve_scan(serial):
+    """Equipement, holder and open incidents of ``serial`` in one query, or ``None``.
+
+    Open incidents are LEFT JOINed through a filtered relation, one row per incident.
+    """
+    rows = list(
+        Equipement.objects.filter(serial_number=serial)
+        .annotate(
+            open_incidents=FilteredRelation(
+                'incidents', condition=Q(incidents__status=Incident.Status.OPEN)
+            )
+        )
+        .values(
+            *EQUIPEMENT_FIELDS,
+            *[f'current_affectation__{field}' for field in AFFECTATION_FIELDS],
+            *[f'current_agent__{field}' for field in AGENT_FIELDS],
+            *[f'open_incidents__{field}' for field in INCIDENT_FIELDS],
+        )
+        .order_by('-open_incidents__reported_at')
+    )
+    if not rows:
+        return None
+    first = rows[0]
+    holder = None
+    if first['current_affectation__id'] is not None:
+        holder = {
+            'affectation': _pick(first, 'current_affectation__', AFFECTATION_FIELDS),
+            'agent': _pick(first, 'current_agent__', AGENT_FIELDS),
+        }
+    return {
+        'equipement': _pick(first, '', EQUIPEMENT_FIELDS),
+        'holder': holder,
+        'open_incidents': [
+            _pick(row, 'open_incidents__', INCIDENT_FIELDS)
+            for row in rows
+            if row['open_incidents__id'] is not None
+        ],
+    }
+
+
+class ScanCache:
+    """Bounded per-process LRU of scan results, valid for one data version."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'SCAN_CACHE_SIZE', 1024)
+
+    def get(self, serial):
+        version = data_version()
+        with self.lock:
+            entry = self.entries.get(serial)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(serial)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        result = resolve_scan(serial)
+        with self.lock:
+            self.entries[serial] = (version, result)
+            self.entries.move_to_end(serial)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+scan_cache = ScanCache()
+
+
+def scan(payload):
+    serial = parse_equipement_code(payload)
+    return scan_cache.get(serial) if serial else None
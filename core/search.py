@@ -0,0 +1,210 @@
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .caching import CACHE_PREFIX
+from .models import Agent, Equipement, SearchToken
+
+
+# field: (weight, mode). Names are split into words; codes are also indexed as one string
+# so that any part of a serial number, IMEI or phone number can be found.
+SEARCH_FIELDS = {
+    SearchToken.Kind.AGENT: {
+        'matricule': (3, 'code'),
+        'first_name': (2, 'words'),
+        'last_name': (2, 'words'),
+        'phone': (1, 'code'),
+        'id_number': (1, 'code'),
+    },
+    SearchToken.Kind.EQUIPEMENT: {
+        'serial_number': (3, 'code'),
+        'imei': (2, 'code'),
+    },
+}
+SEARCH_MODELS = {
+    SearchToken.Kind.AGENT: Agent,
+    SearchToken.Kind.EQUIPEMENT: Equipement,
+}
+SEARCH_KINDS = {model: kind for kind, model in SEARCH_MODELS.items()}
+MAX_QUERY_TOKENS = 32
+# Frequencies only pick the most selective token; stale values cost speed, not results.
+FREQUENCY_TIMEOUT = 3600
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def _fold(value):
+    value = unicodedata.normalize('NFKD', str(value or '')).lower()
+    return ''.join(char for char in value if not unicodedata.combining(char))
+
+
+def words(value):
+    return [word for word in _NON_ALNUM.split(_fold(value)) if word]
+
+
+def word_tokens(word):
+    """Prefixes of one and two characters, then every trigram of the word."""
+    tokens = {word[:1], word[:2]}
+    tokens.update(word[index : index + 3] for index in range(len(word) - 2))
+    return tokens
+
+
+def query_tokens(query):
+    # Short words must start a word; longer ones may appear anywhere.
+    tokens = set()
+    for word in words(query):
+        if len(word) < 3:
+            tokens.add(word)
+        else:
+            tokens.update(word[index : index + 3] for index in range(len(word) - 2))
+    return sorted(tokens)[:MAX_QUERY_TOKENS]
+
+
+def object_tokens(kind, instance):
+    weights = {}
+    for field, (weight, mode) in SEARCH_FIELDS[kind].items():
+        value = getattr(instance, field, None)
+        parts = words(value)
+        if mode == 'code' and len(parts) > 1:
+            parts.append(''.join(parts))
+        for part in filter(None, parts):
+            for token in word_tokens(part):
+                weights[token] = max(weights.get(token, 0), weight)
+    return weights
+
+
+def token_rows(kind, instances, model=SearchToken):
+    return [
+        model(kind=kind, object_id=instance.pk, token=token, weight=weight)
+        for instance in instances
+        for token, weight in object_tokens(kind, instance).items()
+    ]
+
+
+def index_objects(kind, instances):
+    instances = list(instances)
+    if not instances:
+        return 0
+    rows = token_rows(kind, instances)
+    with transaction.atomic():
+        SearchToken.objects.filter(
+            kind=kind, object_id__in=[instance.pk for instance in instances]
+        ).delete()
+        SearchToken.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def unindex_object(kind, object_id):
+    SearchToken.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_queryset(kind, queryset, batch_size=1000):
+    """Index the rows of ``queryset`` by batches, e.g. after a bulk_create."""
+    total = 0
+    batch = []
+    fields = ['id', *SEARCH_FIELDS[kind]]
+    for instance in queryset.only(*fields).iterator(chunk_size=batch_size):
+        batch.append(instance)
+        if len(batch) >= batch_size:
+            total += index_objects(kind, batch)
+            batch = []
+    return total + index_objects(kind, batch)
+
+
+def rebuild_index(batch_size=1000):
+    total = 0
+    for kind, model in SEARCH_MODELS.items():
+        # Searches never see a half-built index of this kind.
+        with transaction.atomic():
+            SearchToken.objects.filter(kind=kind).delete()
+            total += index_queryset(kind, model.objects.all(), batch_size)
+    return total
+
+
+def token_frequencies(tokens):
+    keys = {f'{CACHE_PREFIX}search-token:{token}': token for token in tokens}
+    frequencies = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [token for token in tokens if token not in frequencies]
+    if missing:
+        counted = dict.fromkeys(missing, 0)
+        counted.update(
+            SearchToken.objects.filter(token__in=missing)
+            .values('token')
+            .annotate(total=Count('id'))
+            .order_by()
+            .values_list('token', 'total')
+        )
+        cache.set_many(
+            {f'{CACHE_PREFIX}search-token:{token}': total for token, total in counted.items()},
+            FREQUENCY_TIMEOUT,
+        )
+        frequencies.update(counted)
+    return frequencies
+
+
+def search(query, kinds=None):
+    """Ranked ``(kind, object_id, score)`` rows matching every token of ``query``.
+
+    Matches are candidates from the token index: every trigram of the query is present,
+    so a word containing the query always matches. Only the objects carrying the rarest
+    token are grouped.
+    """
+    tokens = query_tokens(query)
+    # Every column of the (token, kind, object_id) index is constrained.
+    kinds = kinds or list(SEARCH_MODELS)
+    queryset = SearchToken.objects.filter(token__in=tokens, kind__in=kinds)
+    if not tokens:
+        return queryset.none().values('kind', 'object_id')
+    if len(tokens) > 1:
+        frequencies = token_frequencies(tokens)
+        rarest = min(tokens, key=lambda token: frequencies[token])
+        candidates = SearchToken.objects.filter(token=rarest, kind__in=kinds)
+        queryset = queryset.filter(object_id__in=candidates.values('object_id'))
+    return (
+        queryset.values('kind', 'object_id')
+        .annotate(matched=Count('token'), score=Sum('weight'))
+        .filter(matched=len(tokens))
+        .order_by('-score', 'kind', 'object_id')
+    )
+
+
+def search_ids(kind, query):
+    """Subquery of the ids of ``kind`` objects matching ``query``, for ``pk__in`` filters."""
+    return search(query, kinds=[kind]).values_list('object_id', flat=True)
+
+
+RESULT_FIELDS = {
+    SearchToken.Kind.AGENT: ['id', 'matricule', 'first_name', 'last_name', 'phone', 'status'],
+    SearchToken.Kind.EQUIPEMENT: [
+        'id',
+        'type',
+        'serial_number',
+        'imei',
+        'status',
+        'current_agent',
+    ],
+}
+
+
+def hydrate(rows):
+    """Attach the object fields to a page of search rows, one query per kind."""
+    ids = {}
+    for row in rows:
+        ids.setdefault(row['kind'], []).append(row['object_id'])
+    objects = {
+        kind: {
+            values['id']: values
+            for values in SEARCH_MODELS[kind].objects.filter(pk__in=kind_ids).values(
+                *RESULT_FIELDS[kind]
+            )
+        }
+        for kind, kind_ids in ids.items()
+    }
+    return [
+        {'type': row['kind'], 'score': row['score'], **objects[row['kind']][row['object_id']]}
+        for row in rows
+        if row['object_id'] in objects[row['kind']]
+    ]
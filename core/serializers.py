@@ -1,8 +1,24 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-
-from .models import Agent, Equipement, Affectation, Restitution, Incident, Log, AgentInvite
+from rest_framework.exceptions import PermissionDenied
+
+from .models import (
+    Agent,
+    Equipement,
+    Affectation,
+    Restitution,
+    Incident,
+    Log,
+    AgentInvite,
+    ReportJob,
+    UploadSession,
+)
+from .exports import EXPORT_CONTENT_TYPES
+from .pdf import SHEET_WRITERS
+from .reports import EXPORT_RESOURCES, can_export, export_queryset
+from .uploads import open_upload
 from .utils import generate_matricule
+from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta
@@ -12,7 +28,73 @@ import secrets
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+def _split_paths(values):
+    nested = {}
+    for value in values:
+        name, _, rest = value.partition('.')
+        nested.setdefault(name, [])
+        if rest:
+            nested[name].append(rest)
+    return nested
+
+
+def prune_fields(serializer, fields=None, expand=None):
+    if fields is not None:
+        nested = _split_paths(fields)
+        for name in list(serializer.fields):
+            if name not in nested:
+                serializer.fields.pop(name)
+            elif nested[name] and isinstance(serializer.fields[name], serializers.Serializer):
+                prune_fields(serializer.fields[name], fields=nested[name])
+    if expand is not None:
+        nested = _split_paths(expand)
+        for name in list(serializer.fields):
+            field = serializer.fields[name]
+            if not name.endswith('_detail') or not isinstance(field, serializers.Serializer):
+                continue
+            key = name[: -len('_detail')]
+            if key not in nested:
+                serializer.fields.pop(name)
+            else:
+                prune_fields(field, expand=nested[key])
+
+
+def relation_paths(serializer, prefix=''):
+    paths = []
+    for field in serializer.fields.values():
+        if not isinstance(field, serializers.Serializer) or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        paths.extend(relation_paths(field, f'{path}__') or [path])
+    return paths
+
+
+class UploadedImageField(serializers.ImageField):
+    """Image sent in the request body, or the token of a completed resumable upload."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.strip():
+            upload = open_upload(data.strip())
+            if upload is None:
+                raise serializers.ValidationError('Televersement introuvable, incomplet ou expire.')
+            try:
+                return super().to_internal_value(upload)
+            except Exception:
+                # Not an image: the session file stays in place, without an open handle.
+                upload.close()
+                raise
+        return super().to_internal_value(data)
+
+
+class DynamicFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        prune_fields(self, fields=fields, expand=expand)
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
 
     class Meta:
@@ -49,12 +131,12 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
-class AgentSerializer(serializers.ModelSerializer):
+class AgentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_detail = UserSerializer(source='user', read_only=True)
     matricule = serializers.CharField(required=False, allow_blank=True)
     id_number = serializers.CharField(required=True)
     project_type = serializers.CharField(required=True)
-    id_document = serializers.ImageField(required=True)
+    id_document = UploadedImageField(required=True)
 
     class Meta:
         model = Agent
@@ -70,11 +152,13 @@ class AgentSerializer(serializers.ModelSerializer):
             'address',
             'id_number',
             'id_document',
+            'id_document_thumbnail',
             'project_type',
             'status',
             'created_at',
             'updated_at',
         ]
+        read_only_fields = ['id_document_thumbnail']
 
     def create(self, validated_data):
         matricule = (validated_data.get('matricule') or '').strip()
@@ -84,7 +168,7 @@ class AgentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class EquipementSerializer(serializers.ModelSerializer):
+class EquipementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     qr_code_image = serializers.ImageField(read_only=True)
 
     class Meta:
@@ -97,15 +181,27 @@ class EquipementSerializer(serializers.ModelSerializer):
             'status',
             'condition',
             'qr_code_image',
+            'current_affectation',
+            'current_agent',
             'created_at',
             'updated_at',
         ]
+        read_only_fields = ['current_affectation', 'current_agent']
+
+    def update(self, instance, validated_data):
+        serial_number = validated_data.get('serial_number', instance.serial_number)
+        if serial_number != instance.serial_number and instance.qr_code_image:
+            # The stored code encodes the old serial; it is rendered again on demand.
+            instance.qr_code_image.delete(save=False)
+        return super().update(instance, validated_data)
 
 
-class AffectationSerializer(serializers.ModelSerializer):
+class AffectationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     equipement_detail = EquipementSerializer(source='equipement', read_only=True)
     agent_detail = AgentSerializer(source='agent', read_only=True)
     assigned_by_detail = UserSerializer(source='assigned_by', read_only=True)
+    signature = UploadedImageField(required=False, allow_null=True)
+    equipement_photo = UploadedImageField(required=False, allow_null=True)
 
     class Meta:
         model = Affectation
@@ -120,16 +216,19 @@ class AffectationSerializer(serializers.ModelSerializer):
             'assigned_at',
             'expected_return_at',
             'signature',
+            'signature_thumbnail',
             'equipement_photo',
+            'equipement_photo_thumbnail',
             'notes',
             'is_active',
         ]
-        read_only_fields = ['assigned_by']
+        read_only_fields = ['assigned_by', 'signature_thumbnail', 'equipement_photo_thumbnail']
 
 
-class RestitutionSerializer(serializers.ModelSerializer):
+class RestitutionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     affectation_detail = AffectationSerializer(source='affectation', read_only=True)
     received_by_detail = UserSerializer(source='received_by', read_only=True)
+    equipement_photo = UploadedImageField(required=False, allow_null=True)
 
     class Meta:
         model = Restitution
@@ -143,11 +242,12 @@ class RestitutionSerializer(serializers.ModelSerializer):
             'condition',
             'notes',
             'equipement_photo',
+            'equipement_photo_thumbnail',
         ]
-        read_only_fields = ['received_by']
+        read_only_fields = ['received_by', 'equipement_photo_thumbnail']
 
 
-class IncidentSerializer(serializers.ModelSerializer):
+class IncidentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     equipement_detail = EquipementSerializer(source='equipement', read_only=True)
     agent_detail = AgentSerializer(source='agent', read_only=True)
     reported_by_detail = UserSerializer(source='reported_by', read_only=True)
@@ -171,7 +271,7 @@ class IncidentSerializer(serializers.ModelSerializer):
         read_only_fields = ['reported_by']
 
 
-class LogSerializer(serializers.ModelSerializer):
+class LogSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_detail = UserSerializer(source='user', read_only=True)
 
     class Meta:
@@ -189,7 +289,7 @@ class LogSerializer(serializers.ModelSerializer):
         ]
 
 
-class AgentInviteSerializer(serializers.ModelSerializer):
+class AgentInviteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     link = serializers.SerializerMethodField()
 
     class Meta:
@@ -230,7 +330,7 @@ class AgentSelfRegisterSerializer(serializers.Serializer):
     address = serializers.CharField(required=False, allow_blank=True)
     id_number = serializers.CharField(max_length=100)
     project_type = serializers.CharField(max_length=100)
-    id_document = serializers.ImageField()
+    id_document = UploadedImageField()
     username = serializers.CharField(max_length=150, required=False, allow_blank=True)
     password = serializers.CharField(write_only=True, min_length=4)
 
@@ -305,7 +405,7 @@ class AgentOpenRegisterSerializer(serializers.Serializer):
     address = serializers.CharField(required=False, allow_blank=True)
     id_number = serializers.CharField(max_length=100)
     project_type = serializers.CharField(max_length=100)
-    id_document = serializers.ImageField()
+    id_document = UploadedImageField()
     username = serializers.CharField(max_length=150, required=False, allow_blank=True)
     password = serializers.CharField(write_only=True, min_length=4)
 
@@ -354,3 +454,142 @@ class AgentOpenRegisterSerializer(serializers.Serializer):
         )
 
         return agent
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id',
+            'kind',
+            'params',
+            'status',
+            'progress',
+            'error',
+            'download_url',
+            'created_by',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+        read_only_fields = [
+            'status',
+            'progress',
+            'error',
+            'created_by',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.Status.DONE:
+            return None
+        url = reverse('report-job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def validate(self, attrs):
+        params = attrs.get('params') or {}
+        if attrs['kind'] == ReportJob.Kind.AFFECTATION_SHEETS:
+            return self._validate_affectation_sheets(attrs, params)
+        if attrs['kind'] != ReportJob.Kind.EXPORT:
+            attrs['params'] = {}
+            return attrs
+        if params.get('resource') not in EXPORT_RESOURCES:
+            raise serializers.ValidationError({'params': 'Ressource inconnue.'})
+        request = self.context.get('request')
+        if request is not None and not can_export(params['resource'], request):
+            raise PermissionDenied("Vous n'avez pas acces a cette ressource.")
+        if params.get('format') not in EXPORT_CONTENT_TYPES:
+            raise serializers.ValidationError({'params': 'Format inconnu.'})
+        filters = params.get('filters') or {}
+        if not isinstance(filters, dict):
+            raise serializers.ValidationError({'params': 'Filtres invalides.'})
+        export_queryset(params['resource'], filters)
+        attrs['params'] = {
+            'resource': params['resource'],
+            'format': params['format'],
+            'filters': filters,
+        }
+        return attrs
+
+    def _validate_affectation_sheets(self, attrs, params):
+        if params.get('format') not in SHEET_WRITERS:
+            raise serializers.ValidationError({'params': 'Format inconnu.'})
+        filters = params.get('filters') or {}
+        if not isinstance(filters, dict):
+            raise serializers.ValidationError({'params': 'Filtres invalides.'})
+        export_queryset('affectations', filters)
+        attrs['params'] = {'format': params['format'], 'filters': filters}
+        return attrs
+
+
+class BulkAffectationItemSerializer(serializers.Serializer):
+    equipement = serializers.IntegerField(min_value=1)
+    agent = serializers.IntegerField(min_value=1)
+    expected_return_at = serializers.DateTimeField(required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkAffectationSerializer(serializers.Serializer):
+    items = BulkAffectationItemSerializer(many=True, allow_empty=False, max_length=1000)
+    assigned_at = serializers.DateTimeField(required=False)
+    atomic = serializers.BooleanField(
+        required=False, default=False, help_text='Tout annuler si un element est refuse.'
+    )
+
+
+class ScanRestitutionItemSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=200)
+    condition = serializers.ChoiceField(
+        choices=Restitution.Condition.choices, default=Restitution.Condition.GOOD
+    )
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class ScanRestitutionSerializer(serializers.Serializer):
+    items = ScanRestitutionItemSerializer(many=True, allow_empty=False, max_length=1000)
+    returned_at = serializers.DateTimeField(required=False)
+    atomic = serializers.BooleanField(
+        required=False, default=False, help_text='Tout annuler si un element est refuse.'
+    )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'token',
+            'filename',
+            'size',
+            'sha256',
+            'offset',
+            'chunk_size',
+            'status',
+            'expires_at',
+            'completed_at',
+        ]
+        read_only_fields = ['token', 'status', 'expires_at', 'completed_at']
+        extra_kwargs = {'sha256': {'required': False}}
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate_size(self, value):
+        if value < 1 or value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Taille de 1 a {settings.UPLOAD_MAX_SIZE} octets attendue.'
+            )
+        return value
+
+    def validate_sha256(self, value):
+        value = value.strip().lower()
+        if value and (len(value) != 64 or any(char not in '0123456789abcdef' for char in value)):
+            raise serializers.ValidationError('Empreinte SHA-256 hexadecimale attendue.')
+        return value
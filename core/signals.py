@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import revoke_tokens
+from .caching import bump_data_version_on_commit
+from .counters import apply_deltas, change_deltas, values_deltas
+from .images import IMAGE_FIELDS, is_processed, process_images
+from .models import Affectation, Agent, Equipement, Incident, Restitution, User
+from .search import SEARCH_FIELDS, SEARCH_KINDS, index_objects, unindex_object
+from .workers import run_in_background
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Equipement)
+@receiver(post_save, sender=Incident)
+def update_counters_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    new_values = instance.counted_values()
+    if created:
+        apply_deltas(values_deltas(sender, new_values))
+        instance.remember_counted_values()
+        return
+    old_values = getattr(instance, '_counted_values', None)
+    if old_values is None:
+        return
+    if update_fields is not None:
+        new_values = {
+            name: value if name in update_fields else old_values[name]
+            for name, value in new_values.items()
+        }
+    apply_deltas(change_deltas(sender, old_values, new_values))
+    instance._counted_values = new_values
+
+
+@receiver(post_delete, sender=Agent)
+@receiver(post_delete, sender=Equipement)
+@receiver(post_delete, sender=Incident)
+def update_counters_on_delete(sender, instance, **kwargs):
+    if not hasattr(instance, '_counted_values'):
+        instance.remember_counted_values()
+    if instance._counted_values is None:
+        return  # The row was already gone when delete() locked it.
+    apply_deltas(values_deltas(sender, instance._counted_values, sign=-1))
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Equipement)
+@receiver(post_save, sender=Affectation)
+@receiver(post_save, sender=Restitution)
+@receiver(post_save, sender=Incident)
+@receiver(post_delete, sender=Agent)
+@receiver(post_delete, sender=Equipement)
+@receiver(post_delete, sender=Affectation)
+@receiver(post_delete, sender=Restitution)
+@receiver(post_delete, sender=Incident)
+def invalidate_cached_data(sender, instance, raw=False, **kwargs):
+    # Admin edits, registrations and commands bypass the views that bump the version.
+    if not raw:
+        bump_data_version_on_commit()
+
+
+@receiver(post_save, sender=Affectation)
+def update_current_holder(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    held = Equipement.objects.filter(current_affectation_id=instance.pk)
+    if instance.is_active:
+        Equipement.objects.filter(pk=instance.equipement_id).update(
+            current_affectation_id=instance.pk, current_agent_id=instance.agent_id
+        )
+        if created:
+            return
+        # The affectation may have been moved to another equipement.
+        held = held.exclude(pk=instance.equipement_id)
+    held.update(current_affectation=None, current_agent=None)
+
+
+@receiver(post_delete, sender=Affectation)
+def clear_current_holder(sender, instance, **kwargs):
+    # SET_NULL only clears current_affectation; the agent pointer goes with it.
+    Equipement.objects.filter(
+        pk=instance.equipement_id, current_affectation__isnull=True, current_agent__isnull=False
+    ).update(current_agent=None)
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Equipement)
+def update_search_index(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    kind = SEARCH_KINDS[sender]
+    if created or update_fields is None or set(update_fields) & set(SEARCH_FIELDS[kind]):
+        index_objects(kind, [instance])
+
+
+@receiver(post_delete, sender=Agent)
+@receiver(post_delete, sender=Equipement)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_object(SEARCH_KINDS[sender], instance.pk)
+
+
+def generate_missing_qr_code(equipement_id):
+    equipement = (
+        Equipement.objects.filter(pk=equipement_id)
+        .only('id', 'serial_number', 'qr_code_image')
+        .first()
+    )
+    if equipement is not None and not equipement.qr_code_image:
+        equipement.generate_qr_code()
+
+
+@receiver(post_save, sender=Equipement)
+def queue_qr_code(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or instance.qr_code_image or not settings.QR_CODE_BACKGROUND:
+        return
+    if created or update_fields is None:
+        transaction.on_commit(lambda: run_in_background(generate_missing_qr_code, instance.pk))
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Affectation)
+@receiver(post_save, sender=Restitution)
+def queue_image_processing(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not settings.IMAGE_PROCESSING_BACKGROUND:
+        return
+    fields = IMAGE_FIELDS[sender]
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    if not all(is_processed(instance, field) for field in fields):
+        transaction.on_commit(lambda: run_in_background(process_images, sender, instance.pk))
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    old_values = getattr(instance, '_token_values', None)
+    new_values = instance.token_values()
+    instance._token_values = new_values
+    if created or raw or old_values is None:
+        return
+    changed = [
+        name
+        for name in instance.token_fields
+        if old_values[name] != new_values[name]
+        and (update_fields is None or name in update_fields)
+    ]
+    if changed:
+        revoke_tokens(instance.pk, reason='changed: ' + ', '.join(changed))
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_tokens(instance.pk, reason='deleted')
+
+
+@receiver(post_delete, sender=Agent)
+def revoke_tokens_on_agent_delete(sender, instance, **kwargs):
+    # The agent_id claim of the account's tokens points at a removed profile.
+    if instance.user_id:
+        revoke_tokens(instance.user_id, reason='agent deleted')
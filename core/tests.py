@@ -1,11 +1,61 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework.test import APIClient
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken
 from PIL import Image
 from io import BytesIO
+from openpyxl import load_workbook
+from pypdf import PdfReader
+from unittest.mock import patch
+from datetime import timedelta
+from pathlib import Path
+from io import StringIO
+from urllib.parse import urlencode
+import hashlib
+import json
+import tempfile
+import zipfile
 
-from .models import Equipement
+from .archive import load_index
+from .audit import audit_writer
+from .auth_views import resolve_login
+from .caching import DATA_VERSION_KEY, data_version
+from .counters import count_rows, rebuild_counters
+from .images import process_images
+from .exports import iter_rows, write_xlsx
+from .models import (
+    Agent,
+    Equipement,
+    Affectation,
+    Restitution,
+    Incident,
+    Log,
+    ReportJob,
+    InventoryCounter,
+    MatriculeSequence,
+    TokenRevocation,
+    SearchToken,
+    UploadSession,
+)
+from .pagination import TimelinePagination
+from .reports import run_report_job
+from .scan import scan_cache
+from .signals import generate_missing_qr_code
+from .uploads import UploadedSessionFile
+from .utils import generate_matricule
+from .views import AffectationViewSet, EquipementViewSet
 
 
 class APISmokeTests(TestCase):
@@ -77,6 +127,13 @@ class APISmokeTests(TestCase):
 
         equipement = Equipement.objects.get(pk=equip_id)
         self.assertEqual(equipement.status, Equipement.Status.ASSIGNED)
+        self.assertFalse(bool(equipement.qr_code_image))
+
+        qr_resp = self.client.get(f'/api/equipements/{equip_id}/qr/')
+        self.assertEqual(qr_resp.status_code, 200)
+        self.assertEqual(qr_resp['Content-Type'], 'image/png')
+        self.assertTrue(b''.join(qr_resp.streaming_content).startswith(b'\x89PNG'))
+        equipement.refresh_from_db()
         self.assertTrue(bool(equipement.qr_code_image))
 
         restitution_resp = self.client.post(
@@ -111,3 +168,1252 @@ class APISmokeTests(TestCase):
         report_resp = self.client.get('/api/rapports/')
         self.assertEqual(report_resp.status_code, 200)
 
+
+
+class FleetTestCase(TestCase):
+    rows = 5
+
+    def setUp(self):
+        cache.clear()
+        audit_writer.reset()
+        User = get_user_model()
+        self.admin = User.objects.create_user(
+            username='admin', password='admin123', role='ADMIN'
+        )
+        self.agent_user = User.objects.create_user(
+            username='agent', password='agent123', role='AGENT'
+        )
+        self.agent = Agent.objects.create(
+            user=self.agent_user,
+            matricule='AG-BUDGET-0',
+            first_name='Budget',
+            last_name='Agent',
+        )
+        for index in range(self.rows):
+            equipement = Equipement.objects.create(
+                type=Equipement.Type.TABLETTE,
+                serial_number=f'TB-BUDGET-{index}',
+                qr_code_image='qr_codes/placeholder.png',
+            )
+            agent = Agent.objects.create(
+                user=User.objects.create_user(username=f'agent-{index}', role='AGENT'),
+                matricule=f'AG-BUDGET-{index + 1}',
+                first_name='Budget',
+                last_name=f'Agent {index}',
+            )
+            holder = self.agent if index % 2 else agent
+            affectation = Affectation.objects.create(
+                equipement=equipement, agent=holder, assigned_by=self.admin
+            )
+            Restitution.objects.create(affectation=affectation, received_by=self.admin)
+            Incident.objects.create(
+                equipement=equipement,
+                agent=holder,
+                reported_by=self.admin,
+                incident_type=Incident.Type.BREAKDOWN,
+                description='Panne',
+            )
+            Log.objects.create(user=self.admin, action='CREATE', target_type='Equipement')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def assert_budget(self, url, budget):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class QueryBudgetTests(FleetTestCase):
+    def test_list_endpoints(self):
+        # COUNT(*) for the page plus one SELECT carrying the whole relation graph.
+        for url in [
+            '/api/agents/',
+            '/api/equipements/',
+            '/api/affectations/',
+            '/api/restitutions/',
+            '/api/incidents/',
+            '/api/logs/',
+        ]:
+            with self.subTest(url=url):
+                response = self.assert_budget(url, 2)
+                self.assertGreaterEqual(len(response.data['results']), self.rows)
+
+    def test_retrieve_endpoints(self):
+        restitution = Restitution.objects.first()
+        incident = Incident.objects.first()
+        for url in [
+            f'/api/affectations/{restitution.affectation_id}/',
+            f'/api/restitutions/{restitution.pk}/',
+            f'/api/incidents/{incident.pk}/',
+        ]:
+            with self.subTest(url=url):
+                self.assert_budget(url, 1)
+
+    def test_agent_scoped_lists(self):
+        User = get_user_model()
+        for url in [
+            '/api/agents/',
+            '/api/equipements/',
+            '/api/affectations/',
+            '/api/restitutions/',
+            '/api/incidents/',
+        ]:
+            with self.subTest(url=url):
+                self.client.force_authenticate(user=User.objects.get(pk=self.agent_user.pk))
+                # The agent id lookup is the only extra query.
+                response = self.assert_budget(url, 3)
+                self.assertGreater(response.data['count'], 0)
+
+    def test_agent_scoped_lists_with_token_claims(self):
+        login = APIClient().post(
+            '/api/login/', {'username': 'agent', 'password': 'agent123'}, format='json'
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+        client.get('/api/agents/')  # loads the cached revocation list
+        for url, count in [
+            ('/api/agents/', 1),
+            ('/api/equipements/', 2),
+            ('/api/affectations/', 2),
+            ('/api/restitutions/', 2),
+            ('/api/incidents/', 2),
+        ]:
+            with self.subTest(url=url), self.assertNumQueries(2):
+                # The agent id comes from the token: COUNT(*) and the page only.
+                response = client.get(url)
+            self.assertEqual(response.data['count'], count)
+
+
+class SparseFieldsTests(FleetTestCase):
+    def test_fields_restrict_payload_and_joins(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/affectations/?fields=id,equipement_detail.serial_number,agent_detail.matricule'
+            )
+        self.assertEqual(response.status_code, 200)
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'equipement_detail', 'agent_detail'})
+        self.assertEqual(set(item['equipement_detail']), {'serial_number'})
+        self.assertEqual(set(item['agent_detail']), {'matricule'})
+        self.assertNotIn('core_user', queries[-1]['sql'])
+
+    def test_expand_collapses_unlisted_details(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/restitutions/?expand=affectation.equipement')
+        self.assertEqual(response.status_code, 200)
+        item = response.data['results'][0]
+        self.assertNotIn('received_by_detail', item)
+        self.assertIn('equipement_detail', item['affectation_detail'])
+        self.assertNotIn('agent_detail', item['affectation_detail'])
+        self.assertNotIn('core_agent', queries[-1]['sql'])
+
+    def test_empty_expand_returns_flat_rows(self):
+        response = self.assert_budget('/api/incidents/?expand=', 2)
+        item = response.data['results'][0]
+        self.assertFalse([name for name in item if name.endswith('_detail')])
+        self.assertIn('equipement', item)
+
+
+class TimelinePaginationTests(FleetTestCase):
+    def test_cursor_walk_is_stable_on_timestamp_ties(self):
+        Log.objects.update(created_at=timezone.now())
+        expected = list(Log.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen = []
+        url = '/api/logs/?cursor=&page_size=2&fields=id'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            self.assertEqual(len(queries), 1)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_bounded(self):
+        response = self.client.get('/api/affectations/?cursor=&page_size=100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.data['results']), TimelinePagination.max_page_size)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/incidents/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_are_checked(self):
+        paginator = TimelinePagination()
+        for value, pk in (('abc', 1), (None, 1), (1, 1), ('2024-01-01T00:00:00+00:00', 'x')):
+            cursor = paginator.encode_position(value, pk)
+            for url in ('/api/affectations/', '/api/logs/'):
+                response = self.client.get(f'{url}?cursor={cursor}')
+                self.assertEqual(response.status_code, 404, (url, value, pk))
+
+    def test_page_numbers_remain_default(self):
+        response = self.client.get('/api/restitutions/?page=1')
+        self.assertEqual(response.data['count'], self.rows)
+
+
+class StreamingExportTests(FleetTestCase):
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_follows_filters_in_chunks(self):
+        with patch.object(EquipementViewSet, 'export_chunk_size', 2):
+            response = self.client.get('/api/equipements/?export=csv&type=TABLETTE')
+            lines = self.read(response).decode().splitlines()
+        self.assertEqual(lines[0], 'id,type,serial_number,imei,status,condition,created_at')
+        self.assertEqual(len(lines), self.rows + 1)
+
+    def test_ndjson_export_uses_relation_columns(self):
+        response = self.client.get(
+            '/api/affectations/?export=ndjson&fields=id,agent__matricule'
+        )
+        rows = [json.loads(line) for line in self.read(response).decode().splitlines()]
+        self.assertEqual(len(rows), self.rows)
+        self.assertEqual(set(rows[0]), {'id', 'agent.matricule'})
+
+    def test_chunks_keep_the_requested_order(self):
+        start = timezone.now()
+        for index, affectation in enumerate(Affectation.objects.order_by('pk')):
+            # Pairs share a date: ties fall back to the primary key.
+            affectation.assigned_at = start + timedelta(days=index // 2)
+            affectation.save(update_fields=['assigned_at'])
+        with patch.object(AffectationViewSet, 'export_chunk_size', 2):
+            response = self.client.get('/api/affectations/?export=ndjson&fields=id')
+            ids = [json.loads(line)['id'] for line in self.read(response).decode().splitlines()]
+        expected = Affectation.objects.order_by('-assigned_at', 'pk').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+        for index, equipement in enumerate(Equipement.objects.order_by('pk')):
+            equipement.imei = None if index % 2 else f'35000000000000{index}'
+            equipement.save(update_fields=['imei'])
+        rows = list(iter_rows(Equipement.objects.order_by('-imei'), ['imei'], chunk_size=2))
+        imeis = [imei for imei, in rows]
+        filled = sorted((imei for imei in imeis if imei), reverse=True)
+        self.assertEqual(imeis, filled + [None] * (len(imeis) - len(filled)))
+
+    def test_xlsx_export_is_a_workbook(self):
+        response = self.client.get('/api/logs/?export=xlsx')
+        workbook = load_workbook(BytesIO(self.read(response)), read_only=True)
+        self.assertEqual(len(list(workbook['log'].rows)), self.rows + 1)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_reports_excel_export_is_a_job(self):
+        self.assertEqual(self.client.get('/api/rapports/?export=excel').status_code, 400)
+        response = self.client.post('/api/rapports/jobs/', {'kind': 'EXCEL'}, format='json')
+        self.assertEqual(run_report_job(response.data['id']), ReportJob.Status.DONE)
+        download = self.client.get(f"/api/rapports/jobs/{response.data['id']}/download/")
+        workbook = load_workbook(BytesIO(self.read(download)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Equipements', 'Agents'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobTests(FleetTestCase):
+    def test_job_is_queued_then_downloadable(self):
+        response = self.client.post(
+            '/api/rapports/jobs/',
+            {'kind': 'EXPORT', 'params': {'resource': 'equipements', 'format': 'csv'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ReportJob.Status.PENDING)
+        job_id = response.data['id']
+
+        pending = self.client.get(f'/api/rapports/jobs/{job_id}/download/')
+        self.assertEqual(pending.status_code, 409)
+
+        self.assertEqual(run_report_job(job_id), ReportJob.Status.DONE)
+        status_resp = self.client.get(f'/api/rapports/jobs/{job_id}/')
+        self.assertEqual(status_resp.data['progress'], 100)
+        self.assertTrue(status_resp.data['download_url'])
+
+        download = self.client.get(f'/api/rapports/jobs/{job_id}/download/')
+        content = b''.join(download.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), self.rows + 1)
+
+    def test_unknown_export_resource_is_rejected(self):
+        response = self.client.post(
+            '/api/rapports/jobs/',
+            {'kind': 'EXPORT', 'params': {'resource': 'invites', 'format': 'csv'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_exports_follow_the_resource_permissions(self):
+        supervisor = get_user_model().objects.create_user(
+            username='supervisor', password='supervisor123', role='SUPERVISOR'
+        )
+        self.client.force_authenticate(user=supervisor)
+        self.assertEqual(self.client.get('/api/users/').status_code, 403)
+        response = self.client.post(
+            '/api/rapports/jobs/',
+            {'kind': 'EXPORT', 'params': {'resource': 'users', 'format': 'csv'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ReportJob.objects.exists())
+        response = self.client.post(
+            '/api/rapports/jobs/',
+            {'kind': 'EXPORT', 'params': {'resource': 'agents', 'format': 'csv'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202)
+
+
+class InventoryCounterTests(FleetTestCase):
+    def assert_counters_match_tables(self):
+        expected = {(row.scope, row.key): row.value for row in count_rows()}
+        actual = {
+            (row.scope, row.key): row.value
+            for row in InventoryCounter.objects.exclude(value=0)
+        }
+        self.assertEqual(actual, expected)
+
+    def test_counters_follow_writes(self):
+        self.assert_counters_match_tables()
+        equipement = Equipement.objects.create(
+            type=Equipement.Type.CHARGEUR,
+            serial_number='CH-COUNTER-1',
+            qr_code_image='qr_codes/placeholder.png',
+        )
+        affect_resp = self.client.post(
+            '/api/affectations/',
+            {'equipement': equipement.pk, 'agent': self.agent.pk},
+            format='json',
+        )
+        self.assertEqual(affect_resp.status_code, 201)
+        self.assert_counters_match_tables()
+
+        self.client.post(
+            '/api/restitutions/',
+            {'affectation': affect_resp.data['id'], 'condition': 'DAMAGED'},
+            format='json',
+        )
+        incident_resp = self.client.post(
+            '/api/incidents/',
+            {'equipement': equipement.pk, 'incident_type': 'THEFT', 'description': 'Vol'},
+            format='json',
+        )
+        self.client.patch(
+            f"/api/incidents/{incident_resp.data['id']}/", {'status': 'CLOSED'}, format='json'
+        )
+        self.client.patch(f'/api/agents/{self.agent.pk}/', {'status': 'INACTIVE'})
+        self.assert_counters_match_tables()
+
+        Incident.objects.filter(pk=incident_resp.data['id']).get().delete()
+        self.assert_counters_match_tables()
+
+    def test_stale_instances_do_not_skew_counters(self):
+        created = Equipement.objects.create(
+            type=Equipement.Type.CHARGEUR,
+            serial_number='CH-COUNTER-2',
+            qr_code_image='qr_codes/placeholder.png',
+        )
+        first = Equipement.objects.get(pk=created.pk)
+        second = Equipement.objects.get(pk=created.pk)
+        first.condition = Equipement.Condition.DAMAGED
+        first.save()
+        # The second copy still remembers GOOD; its save must start from DAMAGED.
+        second.condition = Equipement.Condition.NEEDS_REPAIR
+        second.save()
+        self.assert_counters_match_tables()
+
+        first.refresh_from_db()
+        self.assertEqual(first._counted_values['condition'], Equipement.Condition.NEEDS_REPAIR)
+        second.delete()
+        first.delete()
+        self.assert_counters_match_tables()
+
+    def test_reports_read_counters_only(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/rapports/')
+        self.assertEqual(response.data['agents_active'], self.rows + 1)
+        self.assertEqual(
+            response.data['incidents_by_status'], [{'status': 'OPEN', 'total': self.rows}]
+        )
+
+    def test_rebuild(self):
+        InventoryCounter.objects.update(value=0)
+        rebuild_counters()
+        self.assert_counters_match_tables()
+
+
+class ReportCacheTests(FleetTestCase):
+    def test_reports_are_served_from_cache_until_a_write(self):
+        first = self.client.get('/api/rapports/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/rapports/')
+        self.assertEqual(cached.data, first.data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/agents/{self.agent.pk}/', {'status': 'INACTIVE'})
+        audit_writer.flush()
+        with self.assertNumQueries(1):
+            fresh = self.client.get('/api/rapports/')
+        self.assertEqual(fresh.data['agents_inactive'], 1)
+
+    def test_pdf_summary_is_cached(self):
+        first = self.client.get('/api/rapports/?export=pdf')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/rapports/?export=pdf')
+        self.assertEqual(cached.content, first.content)
+
+    def test_version_survives_eviction(self):
+        version = data_version()
+        cache.delete(DATA_VERSION_KEY)
+        self.assertNotEqual(data_version(), version)
+
+
+class AuditWriterTests(FleetTestCase):
+    def test_entries_are_flushed_in_one_batch_at_request_end(self):
+        before = Log.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/equipements/',
+                {'type': 'CHARGEUR', 'serial_number': 'CH-AUDIT-1'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        # Entries are queued on commit, which the test only runs after the request.
+        self.assertEqual(audit_writer.stats()['buffered'], 1)
+        stats = self.client.get('/api/logs/audit-stats/').data
+        self.assertEqual(stats['buffered'], 1)
+        self.assertEqual(Log.objects.count(), before + 1)
+        self.assertEqual(audit_writer.stats()['flushes'], 1)
+        self.assertEqual(audit_writer.stats()['buffered'], 0)
+
+    @override_settings(AUDIT_BUFFER_SIZE=3)
+    def test_size_threshold_triggers_a_bulk_insert(self):
+        before = Log.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(4):
+                audit_writer.record(user_id=self.admin.pk, action='CREATE', target_id=str(index))
+        self.assertEqual(Log.objects.count(), before + 3)
+        self.assertEqual(audit_writer.stats()['buffered'], 1)
+        audit_writer.flush()
+        self.assertEqual(Log.objects.count(), before + 4)
+
+    def test_durable_actions_are_written_immediately(self):
+        audit_writer.record(user_id=self.admin.pk, action='DELETE', target_type='Equipement')
+        audit_writer.record(user_id=self.admin.pk, action='UPDATE', target_type='User')
+        self.assertEqual(audit_writer.stats()['durable_writes'], 2)
+        self.assertEqual(audit_writer.stats()['buffered'], 0)
+
+    def test_rolled_back_entries_are_discarded(self):
+        before = Log.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                audit_writer.record(user_id=self.admin.pk, action='CREATE', target_id='1')
+                audit_writer.record(user_id=self.admin.pk, action='DELETE', target_id='1')
+                transaction.set_rollback(True)
+        audit_writer.flush()
+        self.assertEqual(Log.objects.count(), before)
+
+
+@override_settings(LOG_ARCHIVE_DIR=tempfile.mkdtemp())
+class LogArchiveTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old_at = timezone.now() - timedelta(days=400)
+        Log.objects.bulk_create(
+            Log(
+                user=self.admin,
+                action='DELETE',
+                target_type='Equipement',
+                target_id=str(index),
+                created_at=self.old_at + timedelta(days=index % 2),
+            )
+            for index in range(6)
+        )
+        self.recent = Log.objects.filter(created_at__gte=self.old_at + timedelta(days=2)).count()
+
+    def test_old_logs_move_to_segments_and_stay_queryable(self):
+        call_command('archive_logs', days=180, batch_size=4, pause=0, stdout=StringIO())
+
+        self.assertFalse(Log.objects.filter(created_at__lt=self.old_at + timedelta(days=2)).exists())
+        self.assertEqual(Log.objects.count(), self.recent)
+        index = load_index()
+        self.assertEqual(sum(segment['count'] for segment in index['segments'].values()), 6)
+        self.assertEqual(len(index['segments']), 2)
+
+        response = self.client.get('/api/logs/', {'source': 'archive', 'target_id': '3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['action'], 'DELETE')
+
+        before = (self.old_at + timedelta(days=1)).isoformat()
+        response = self.client.get('/api/logs/', {'created_at_before': before})
+        self.assertEqual(len(response.data['results']), 6)
+        created = [row['created_at'] for row in response.data['results']]
+        self.assertEqual(created, sorted(created, reverse=True))
+
+        # A range across the watermark pages through the table, then the archive.
+        after = (self.old_at - timedelta(days=1)).isoformat()
+        ids = []
+        url = f'/api/logs/?{urlencode({"created_at_after": after, "page_size": 4})}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(ids), self.recent + 6)
+        self.assertEqual(len(set(ids)), len(ids))
+
+        response = self.client.get('/api/logs/', {'source': 'all', 'export': 'csv'})
+        self.assertEqual(response.status_code, 400)
+
+        # Live queries stay on the table.
+        response = self.client.get('/api/logs/', {'page_size': 100})
+        self.assertEqual(len(response.data['results']), self.recent)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QrCodeTests(FleetTestCase):
+    @override_settings(QR_CODE_BACKGROUND=True)
+    def test_create_is_a_single_insert_and_qr_is_rendered_once(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                '/api/equipements/',
+                {'type': 'CHARGEUR', 'serial_number': 'CH-QR-1'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        writes = [
+            query['sql'] for query in ctx.captured_queries
+            if 'core_equipement' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+        self.assertEqual(len(callbacks), 3)  # QR generation, the audit entry and the version bump
+
+        url = f"/api/equipements/{response.data['id']}/qr/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in ctx.captured_queries))
+
+    def test_background_generation_fills_missing_codes(self):
+        equipement = Equipement.objects.create(type='CHARGEUR', serial_number='CH-QR-2')
+        generate_missing_qr_code(equipement.pk)
+        equipement.refresh_from_db()
+        self.assertEqual(equipement.qr_code_image.name, 'qr_codes/qr_CH-QR-2.png')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaAccessTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        default_storage.save('id_documents/piece.jpg', ContentFile(b'piece'))
+        default_storage.save('reports/rapports.xlsx', ContentFile(b'rapport'))
+        default_storage.save('qr_codes/qr_TB.png', ContentFile(b'qr'))
+
+    def test_media_are_served_to_staff_only(self):
+        url = '/media/id_documents/piece.jpg'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get('/media/reports/rapports.xlsx').status_code, 404)
+        self.assertEqual(self.client.get('/media/id_documents/../reports/rapports.xlsx').status_code, 404)
+        self.client.force_authenticate(user=self.agent_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get('/media/qr_codes/qr_TB.png').status_code, 200)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_nginx_sends_the_file(self):
+        response = self.client.get('/media/id_documents/piece.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/id_documents/piece.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImagePipelineTests(FleetTestCase):
+    def image_upload(self, name, mode, size, image_format):
+        buffer = BytesIO()
+        image = Image.effect_noise(size, 64).convert(mode)
+        image.save(buffer, format=image_format)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format}')
+
+    @override_settings(IMAGE_PROCESSING_BACKGROUND=True)
+    def test_uploads_are_bounded_and_get_thumbnails_outside_the_request(self):
+        spare = Equipement.objects.create(type=Equipement.Type.TABLETTE, serial_number='TB-IMG')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                '/api/affectations/',
+                {
+                    'equipement': spare.pk,
+                    'agent': self.agent.pk,
+                    'equipement_photo': self.image_upload('photo.jpg', 'RGB', (2400, 1800), 'jpeg'),
+                    'signature': self.image_upload('signature.png', 'RGBA', (900, 300), 'png'),
+                },
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(callbacks), 3)  # image processing, the audit entry and the version bump
+        self.assertIsNone(response.data['equipement_photo_thumbnail'])
+
+        affectation = Affectation.objects.get(pk=response.data['id'])
+        original = affectation.equipement_photo.name
+        self.assertEqual(process_images(Affectation, affectation.pk), 2)
+        self.assertEqual(process_images(Affectation, affectation.pk), 0)
+
+        affectation.refresh_from_db()
+        self.assertFalse(affectation.equipement_photo.storage.exists(original))
+        with Image.open(affectation.equipement_photo.path) as photo:
+            self.assertEqual(photo.size, (1600, 1200))
+        with Image.open(affectation.signature.path) as signature:
+            self.assertEqual(signature.mode, 'RGBA')
+        for thumbnail in [affectation.equipement_photo_thumbnail, affectation.signature_thumbnail]:
+            with Image.open(thumbnail.path) as image:
+                self.assertLessEqual(max(image.size), 320)
+                self.assertEqual(image.format, 'JPEG')
+
+        response = self.client.get(f'/api/affectations/?equipement={spare.pk}')
+        self.assertTrue(
+            response.data['results'][0]['equipement_photo_thumbnail'].endswith(
+                affectation.equipement_photo_thumbnail.name
+            )
+        )
+        out = StringIO()
+        call_command('process_images', '--dry-run', stdout=out)
+        self.assertIn('0 row(s) with unprocessed images.', out.getvalue())
+
+
+class EquipementImportTests(FleetTestCase):
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content)
+        url = '/api/equipements/import/'
+        if params:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.post(url, {'file': upload}, format='multipart')
+
+    def test_csv_import_reports_row_errors_and_bulk_inserts_the_rest(self):
+        manifest = '\n'.join(
+            [
+                'type;serial_number;imei;status',
+                'TABLETTE;TB-IMP-1;350000000000001;',
+                'chargeur;CH-IMP-1;;Disponible',
+                'TABLETTE;TB-IMP-1;;',
+                'TABLETTE;TB-BUDGET-0;;',
+                'TELEPHONE;PH-IMP-1;;',
+                'POWERBANK;PB-IMP-1;350000000000001;',
+            ]
+        ).encode('utf-8')
+        before = Equipement.objects.count()
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            response = self.upload('manifest.csv', manifest)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 6)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            [(error['row'], list(error['errors'])) for error in response.data['errors']],
+            [(4, ['serial_number']), (5, ['serial_number']), (6, ['type']), (7, ['imei'])],
+        )
+        self.assertEqual(Equipement.objects.count(), before + 2)
+        inserts = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith('INSERT INTO "core_equipement"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        expected = {(row.scope, row.key): row.value for row in count_rows()}
+        actual = {
+            (row.scope, row.key): row.value
+            for row in InventoryCounter.objects.exclude(value=0)
+        }
+        self.assertEqual(actual, expected)
+        audit_writer.flush()
+        self.assertEqual(Log.objects.filter(action='IMPORT').count(), 1)
+
+    def test_xlsx_import_and_dry_run(self):
+        handle = write_xlsx(
+            BytesIO(),
+            [
+                (
+                    'Equipements',
+                    ['Type', 'Numero de serie', 'IMEI', 'Statut', 'Etat'],
+                    [['Tablette', 'TB-XLS-1', 350000000000002, 'AVAILABLE', 'Bon']],
+                )
+            ],
+        )
+        response = self.upload('manifest.xlsx', handle.getvalue(), dry_run=1)
+        self.assertEqual(response.data['created'], 1)
+        self.assertFalse(Equipement.objects.filter(serial_number='TB-XLS-1').exists())
+
+        response = self.upload('manifest.xlsx', handle.getvalue())
+        equipement = Equipement.objects.get(serial_number='TB-XLS-1')
+        self.assertEqual(equipement.imei, '350000000000002')
+        self.assertEqual(equipement.condition, Equipement.Condition.GOOD)
+
+        response = self.upload('manifest.txt', b'x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unreadable_files_are_rejected_before_any_insert(self):
+        rows = ['type;serial_number'] + [f'TABLETTE;TB-ENC-{index}' for index in range(5)]
+        manifest = '\n'.join(rows + ['TABLETTE;TB-Eté']).encode('latin-1')
+        before = Equipement.objects.count()
+        response = self.upload('manifest.csv', manifest)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['file'][0])
+        with tempfile.NamedTemporaryFile(suffix='.csv') as handle:
+            handle.write(manifest)
+            handle.flush()
+            # The invalid byte is three batches in: nothing may have been committed.
+            with self.assertRaises(CommandError):
+                call_command('import_equipements', handle.name, batch_size=2, stdout=StringIO())
+
+        handle = write_xlsx(BytesIO(), [('Equipements', ['Type', 'Numero de serie'], [])])
+        response = self.upload('manifest.xlsx', handle.getvalue()[:-40])
+        self.assertEqual(response.status_code, 400)
+        response = self.upload('manifest.xlsx', b'not a workbook')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Equipement.objects.count(), before)
+
+
+class BulkAffectationTests(FleetTestCase):
+    def test_bulk_assign_validates_in_one_pass_and_flips_statuses_together(self):
+        spares = [
+            Equipement.objects.create(
+                type=Equipement.Type.TABLETTE, serial_number=f'TB-BULK-{index}'
+            )
+            for index in range(3)
+        ]
+        busy = Equipement.objects.get(serial_number='TB-BUDGET-0')  # has an open affectation
+        items = [{'equipement': equipement.pk, 'agent': self.agent.pk} for equipement in spares]
+        items += [
+            {'equipement': spares[0].pk, 'agent': self.agent.pk},
+            {'equipement': busy.pk, 'agent': self.agent.pk},
+            {'equipement': spares[1].pk + 1000, 'agent': self.agent.pk},
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/affectations/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created'] * 3 + ['error'] * 3,
+        )
+        updates = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith('UPDATE "core_equipement"')
+        ]
+        self.assertEqual(len(updates), 1)
+        assigned = Equipement.objects.filter(pk__in=[e.pk for e in spares], status='ASSIGNED')
+        self.assertEqual(assigned.count(), 3)
+        ids = {result['affectation'] for result in response.data['results'][:3]}
+        active = Affectation.objects.filter(equipement__in=spares, is_active=True)
+        self.assertEqual(set(active.values_list('id', flat=True)), ids)
+        expected = {(row.scope, row.key): row.value for row in count_rows()}
+        actual = {
+            (row.scope, row.key): row.value
+            for row in InventoryCounter.objects.exclude(value=0)
+        }
+        self.assertEqual(actual, expected)
+
+    def test_atomic_bulk_assign_rolls_back_on_any_error(self):
+        spare = Equipement.objects.create(type=Equipement.Type.TABLETTE, serial_number='TB-BULK-A')
+        response = self.client.post(
+            '/api/affectations/bulk/',
+            {
+                'atomic': True,
+                'items': [
+                    {'equipement': spare.pk, 'agent': self.agent.pk},
+                    {'equipement': spare.pk, 'agent': 999999},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.assertFalse(Affectation.objects.filter(equipement=spare).exists())
+
+
+class ScanRestitutionTests(FleetTestCase):
+    def test_scan_returns_devices_with_set_based_writes(self):
+        codes = [
+            {'code': 'EQUIPEMENT:TB-BUDGET-0'},
+            {'code': ' TB-BUDGET-1 '},  # already returned
+            {'code': 'TB-BUDGET-2', 'condition': 'DAMAGED'},
+            {'code': 'equipement:TB-BUDGET-0'},
+            {'code': 'TB-UNKNOWN'},
+        ]
+        Affectation.objects.filter(equipement__serial_number='TB-BUDGET-1').update(is_active=False)
+        Restitution.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    '/api/restitutions/scan/', {'items': codes}, format='json'
+                )
+            audit_writer.flush()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'error', 'created', 'error', 'error'],
+        )
+        writes = [
+            query['sql'].split(' ')[0] + ' ' + query['sql'].split('"')[1]
+            for query in ctx.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE'))
+            and 'inventorycounter' not in query['sql']
+        ]
+        self.assertEqual(
+            sorted(writes),
+            [
+                'INSERT core_log',
+                'INSERT core_restitution',
+                'UPDATE core_affectation',
+                'UPDATE core_equipement',
+                'UPDATE core_equipement',
+            ],
+        )
+        returned = Equipement.objects.filter(serial_number__in=['TB-BUDGET-0', 'TB-BUDGET-2'])
+        self.assertEqual(
+            dict(returned.values_list('serial_number', 'status')),
+            {'TB-BUDGET-0': 'AVAILABLE', 'TB-BUDGET-2': 'MAINTENANCE'},
+        )
+        self.assertFalse(Affectation.objects.filter(equipement__in=returned, is_active=True).exists())
+        expected = {(row.scope, row.key): row.value for row in count_rows()}
+        actual = {
+            (row.scope, row.key): row.value
+            for row in InventoryCounter.objects.exclude(value=0)
+        }
+        self.assertEqual(actual, expected)
+
+
+class CurrentHolderTests(FleetTestCase):
+    def holders(self, equipements):
+        return {
+            equipement.serial_number: (
+                equipement.current_affectation_id,
+                equipement.current_agent_id,
+            )
+            for equipement in Equipement.objects.filter(pk__in=[e.pk for e in equipements])
+        }
+
+    def test_flows_keep_holder_pointers_in_step(self):
+        equipement = Equipement.objects.get(serial_number='TB-BUDGET-1')
+        affectation = Affectation.objects.get(equipement=equipement)
+        self.assertEqual(self.holders([equipement])['TB-BUDGET-1'], (affectation.pk, self.agent.pk))
+
+        Restitution.objects.filter(affectation=affectation).delete()
+        response = self.client.post(
+            '/api/restitutions/', {'affectation': affectation.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.holders([equipement])['TB-BUDGET-1'], (None, None))
+
+        spares = [
+            Equipement.objects.create(type=Equipement.Type.TABLETTE, serial_number=f'TB-HOLD-{i}')
+            for i in range(2)
+        ]
+        response = self.client.post(
+            '/api/affectations/bulk/',
+            {'items': [{'equipement': e.pk, 'agent': self.agent.pk} for e in spares]},
+            format='json',
+        )
+        ids = [result['affectation'] for result in response.data['results']]
+        self.assertEqual(
+            self.holders(spares),
+            {'TB-HOLD-0': (ids[0], self.agent.pk), 'TB-HOLD-1': (ids[1], self.agent.pk)},
+        )
+        response = self.client.get(f'/api/equipements/?current_agent={self.agent.pk}')
+        self.assertEqual(response.data['count'], 3)
+
+        response = self.client.post(
+            '/api/restitutions/scan/', {'items': [{'code': 'TB-HOLD-0'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.holders(spares)['TB-HOLD-0'], (None, None))
+
+    def test_repair_command_fixes_drifted_pointers(self):
+        Equipement.objects.filter(serial_number='TB-BUDGET-0').update(
+            current_affectation=None, current_agent=None
+        )
+        Equipement.objects.filter(serial_number='TB-BUDGET-2').update(current_agent=self.agent)
+        out = StringIO()
+        call_command('repair_current_holders', '--dry-run', stdout=out)
+        self.assertIn('2 equipement(s) with stale', out.getvalue())
+        call_command('repair_current_holders', stdout=StringIO())
+        for equipement in Equipement.objects.all():
+            affectation = Affectation.objects.filter(equipement=equipement, is_active=True).first()
+            self.assertEqual(
+                (equipement.current_affectation_id, equipement.current_agent_id),
+                (affectation.pk, affectation.agent_id) if affectation else (None, None),
+            )
+
+
+class SearchTests(FleetTestCase):
+    def test_search_is_ranked_paginated_and_follows_writes(self):
+        indexed = SearchToken.objects.filter(kind='agent').values('object_id').distinct()
+        self.assertEqual(indexed.count(), 6)
+        self.client.get('/api/search/?q=budget')  # caches the token frequencies
+        with self.assertNumQueries(4):
+            # COUNT(*), the ranked page, then one query per result type.
+            response = self.client.get('/api/search/?q=budget')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 11)
+        self.assertEqual(response.data['results'][0]['type'], 'agent')  # matricule outranks names
+
+        response = self.client.get('/api/search/?q=TB-BUDGET-3')
+        self.assertEqual(response.data['results'][0]['serial_number'], 'TB-BUDGET-3')
+        response = self.client.get('/api/search/?q=dget&type=equipement')
+        self.assertEqual(response.data['count'], 5)
+
+        agent = Agent.objects.get(matricule='AG-BUDGET-2')
+        agent.last_name = 'Ndiaye'
+        agent.save()
+        response = self.client.get('/api/agents/?name=ndia')
+        self.assertEqual([row['id'] for row in response.data['results']], [agent.pk])
+        response = self.client.get('/api/agents/?name=agent 1')
+        self.assertNotIn(agent.pk, [row['id'] for row in response.data['results']])
+        # Names only, any substring, and no match made of trigrams from different words.
+        response = self.client.get('/api/agents/?name=di')
+        self.assertEqual([row['id'] for row in response.data['results']], [agent.pk])
+        self.assertEqual(self.client.get('/api/agents/?name=AG-BUDGET-2').data['count'], 0)
+        self.assertEqual(self.client.get('/api/agents/?name=budgent').data['count'], 0)
+        response = self.client.get('/api/equipements/?q=budget-4')
+        self.assertEqual([row['serial_number'] for row in response.data['results']], ['TB-BUDGET-4'])
+
+        SearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/search/?q=ndiaye').data['count'], 1)
+
+    def test_search_requires_staff(self):
+        self.client.force_authenticate(user=self.agent_user)
+        self.assertEqual(self.client.get('/api/search/?q=budget').status_code, 403)
+
+
+class ScanTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        scan_cache.clear()
+
+    def test_scan_resolves_in_one_query_and_is_cached_until_a_write(self):
+        url = '/api/scan/EQUIPEMENT:TB-BUDGET-1/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['equipement']['serial_number'], 'TB-BUDGET-1')
+        self.assertEqual(response.data['holder']['agent']['matricule'], 'AG-BUDGET-0')
+        self.assertEqual(len(response.data['open_incidents']), 1)
+        with self.assertNumQueries(0):
+            self.client.get('/api/scan/TB-BUDGET-1/')
+
+        affectation = Affectation.objects.get(pk=response.data['holder']['affectation']['id'])
+        Restitution.objects.filter(affectation=affectation).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/restitutions/', {'affectation': affectation.pk}, format='json')
+        audit_writer.flush()
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertIsNone(response.data['holder'])
+        self.assertEqual(self.client.get('/api/scan/EQUIPEMENT:TB-NOPE/').status_code, 404)
+
+
+    def test_admin_edits_invalidate_cached_scans(self):
+        response = self.client.get('/api/scan/TB-BUDGET-1/')
+        self.assertEqual(response.data['equipement']['condition'], 'GOOD')
+        equipement = Equipement.objects.get(serial_number='TB-BUDGET-1')
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        admin_client = Client()
+        admin_client.force_login(self.admin)
+        form = model_to_dict(equipement, exclude=['id', 'qr_code_image'])
+        form = {key: value for key, value in form.items() if value is not None}
+        form['condition'] = 'DAMAGED'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = admin_client.post(f'/admin/core/equipement/{equipement.pk}/change/', form)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/api/scan/TB-BUDGET-1/')
+        self.assertEqual(response.data['equipement']['condition'], 'DAMAGED')
+
+@override_settings(PDF_CACHE_DIR=tempfile.mkdtemp())
+class AffectationPdfTests(FleetTestCase):
+    def test_sheets_are_cached_by_content(self):
+        affectation = Affectation.objects.order_by('id').first()
+        url = f'/api/affectations/{affectation.id}/pdf/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        cached = list(Path(settings.PDF_CACHE_DIR).glob(f'affectation_{affectation.id}_*.pdf'))
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(self.client.get(url).content, first.content)
+
+        affectation.notes = 'Chargeur manquant'
+        affectation.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        renewed = list(Path(settings.PDF_CACHE_DIR).glob(f'affectation_{affectation.id}_*.pdf'))
+        self.assertEqual(len(renewed), 1)
+        self.assertNotEqual(renewed, cached)
+
+    def test_batch_renders_the_filtered_sheets(self):
+        response = self.client.get(f'/api/affectations/pdf-batch/?agent={self.agent.id}')
+        self.assertEqual(response.status_code, 200)
+        document = PdfReader(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(document.pages), 2)
+        # Both outputs are assembled from the same cached sheets.
+        self.assertEqual(len(list(Path(settings.PDF_CACHE_DIR).glob('*.pdf'))), 2)
+
+        response = self.client.get('/api/affectations/pdf-batch/?output=zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), self.rows)
+        response = self.client.get('/api/affectations/pdf-batch/?project_type=Inconnu')
+        self.assertEqual(response.status_code, 404)
+
+        output = Path(tempfile.mkdtemp()) / 'fiches.pdf'
+        call_command('render_affectation_pdfs', output=str(output), stdout=StringIO())
+        self.assertEqual(len(PdfReader(output).pages), self.rows)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PDF_BATCH_MAX=2)
+    def test_large_batches_are_queued(self):
+        response = self.client.get('/api/affectations/pdf-batch/?output=zip&is_active=true')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+        response = self.client.post(
+            '/api/rapports/jobs/',
+            {
+                'kind': 'AFFECTATION_SHEETS',
+                'params': {'format': 'zip', 'filters': {'is_active': 'true'}},
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 202)
+        job = ReportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(run_report_job(job.pk), ReportJob.Status.DONE)
+        job.refresh_from_db()
+        with job.output.open('rb') as handle, zipfile.ZipFile(handle) as archive:
+            self.assertEqual(len(archive.namelist()), self.rows)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_TEMP_DIR=tempfile.mkdtemp(), UPLOAD_CHUNK_SIZE=4096
+)
+class ResumableUploadTests(TestCase):
+    def put_chunk(self, client, token, offset, chunk, digest=None):
+        return client.put(
+            f'/api/uploads/{token}/?offset={offset}',
+            chunk,
+            content_type='application/octet-stream',
+            HTTP_X_CONTENT_SHA256=digest or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_chunks_resume_and_the_token_feeds_registration(self):
+        buffer = BytesIO()
+        Image.effect_noise((80, 80), 64).convert('RGB').save(buffer, format='PNG')
+        content = buffer.getvalue()
+        self.assertGreater(len(content), 4096)
+        client = APIClient()
+        response = client.post(
+            '/api/uploads/',
+            {
+                'filename': 'piece.png',
+                'size': len(content),
+                'sha256': hashlib.sha256(content).hexdigest(),
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        token = response.data['token']
+
+        first = content[:4096]
+        self.assertEqual(self.put_chunk(client, token, 0, first).data['offset'], 4096)
+        response = self.put_chunk(client, token, 0, first)  # replayed after a dropped reply
+        self.assertEqual((response.status_code, response.data['offset']), (409, 4096))
+        second = content[4096:8192]
+        response = self.put_chunk(client, token, 4096, second, digest='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get(f'/api/uploads/{token}/').data['offset'], 4096)
+        self.assertEqual(client.post(f'/api/uploads/{token}/complete/').status_code, 409)
+        for offset in range(4096, len(content), 4096):
+            response = self.put_chunk(client, token, offset, content[offset : offset + 4096])
+        self.assertEqual(response.data['offset'], len(content))
+        response = client.post(f'/api/uploads/{token}/complete/')
+        self.assertEqual(response.data['status'], 'COMPLETE')
+
+        registration = {
+            'first_name': 'Awa',
+            'last_name': 'Diop',
+            'phone': '770000001',
+            'id_number': 'CNI-42',
+            'project_type': 'Collecte',
+            'username': 'awa',
+            'password': 'secret42',
+            'id_document': token,
+        }
+        response = client.post('/api/agents/register/', registration, format='json')
+        self.assertEqual(response.status_code, 200)
+        agent = Agent.objects.get(pk=response.data['agent_id'])
+        with agent.id_document.open('rb') as handle:
+            self.assertEqual(handle.read(), content)
+
+        registration['username'] = 'awa2'
+        response = client.post('/api/agents/register/', registration, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id_document', response.data)
+        call_command('cleanup_uploads', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_sessions_are_throttled_and_bounded(self):
+        cache.clear()
+        client = APIClient()
+        start = {'filename': 'piece.png', 'size': 100}
+        with override_settings(UPLOAD_TOTAL_MAX_SIZE=150):
+            # Sessions that never send anything do not hold the quota.
+            first = client.post('/api/uploads/', start, format='json').data['token']
+            second = client.post('/api/uploads/', start, format='json').data['token']
+            self.assertEqual(self.put_chunk(client, first, 0, b'x' * 100).status_code, 200)
+            self.assertEqual(self.put_chunk(client, second, 0, b'x' * 100).status_code, 503)
+            self.assertEqual(client.post('/api/uploads/', start, format='json').status_code, 503)
+        cache.clear()
+        with patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'uploads': '1/hour'}):
+            self.assertEqual(client.post('/api/uploads/', start, format='json').status_code, 201)
+            self.assertEqual(client.post('/api/uploads/', start, format='json').status_code, 429)
+
+    def test_rejected_uploads_are_closed(self):
+        content = b'not an image'
+        client = APIClient()
+        token = client.post(
+            '/api/uploads/', {'filename': 'piece.png', 'size': len(content)}, format='json'
+        ).data['token']
+        self.put_chunk(client, token, 0, content)
+        client.post(f'/api/uploads/{token}/complete/')
+        registration = {
+            'first_name': 'Awa',
+            'last_name': 'Diop',
+            'phone': '770000001',
+            'id_number': 'CNI-42',
+            'project_type': 'Collecte',
+            'username': 'awa',
+            'password': 'secret42',
+            'id_document': token,
+        }
+        with patch.object(
+            UploadedSessionFile, 'close', autospec=True, side_effect=UploadedSessionFile.close
+        ) as close:
+            response = client.post('/api/agents/register/', registration, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id_document', response.data)
+        close.assert_called_once()
+
+
+class MatriculeAllocatorTests(TransactionTestCase):
+    def test_sequence_starts_after_existing_matricules(self):
+        base = f'AG{timezone.localdate():%Y%m%d}'
+        Agent.objects.create(matricule=f'{base}0417', first_name='A', last_name='B')
+        self.assertEqual(generate_matricule(), f'{base}0418')
+        # Steady state: BEGIN, UPDATE, SELECT, COMMIT whatever the day's volume.
+        with self.assertNumQueries(4):
+            self.assertEqual(generate_matricule(), f'{base}0419')
+        self.assertEqual(generate_matricule('SUP'), f'SUP{timezone.localdate():%Y%m%d}0001')
+
+    def test_racing_first_allocations_are_unique(self):
+        # Another caller creates the day's sequence between our UPDATE and get_or_create.
+        base = f'AG{timezone.localdate():%Y%m%d}'
+        get_or_create = MatriculeSequence.objects.get_or_create
+        raced = []
+
+        def racing_get_or_create(*args, **kwargs):
+            if not raced:
+                raced.append(None)
+                raced[0] = generate_matricule()
+            return get_or_create(*args, **kwargs)
+
+        with patch.object(
+            MatriculeSequence.objects, 'get_or_create', side_effect=racing_get_or_create
+        ):
+            ours = generate_matricule()
+        self.assertEqual(raced, [f'{base}0001'])
+        self.assertEqual(ours, f'{base}0002')
+        self.assertEqual(MatriculeSequence.objects.get(prefix='AG').last_value, 2)
+
+
+class LoginResolutionTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='awa', password='secret123', email='Awa.Diop@Example.org', phone='770000009'
+        )
+        Agent.objects.create(
+            user=self.user, matricule='AG-LOGIN-1', first_name='Awa', last_name='Diop'
+        )
+        # A username equal to another account's phone wins: usernames come first.
+        User.objects.create_user(username='770000001', password='secret123')
+        User.objects.create_user(username='moussa', password='secret123', phone='770000001')
+
+    def test_every_identifier_kind_resolves_in_one_query(self):
+        for identifier, expected in [
+            ('awa', 'awa'),
+            ('awa.diop@example.ORG', 'awa'),
+            ('770000009', 'awa'),
+            ('AG-LOGIN-1', 'awa'),
+            ('770000001', '770000001'),
+            ('unknown', None),
+        ]:
+            with self.subTest(identifier=identifier), self.assertNumQueries(1):
+                self.assertEqual(resolve_login(identifier), expected)
+
+    def test_login_with_matricule(self):
+        response = APIClient().post(
+            '/api/login/', {'username': 'AG-LOGIN-1', 'password': 'secret123'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+
+class ClaimsAuthenticationTests(FleetTestCase):
+    def login(self, username, password):
+        response = APIClient().post(
+            '/api/login/', {'username': username, 'password': password}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def bearer(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def test_requests_authenticate_from_claims_without_loading_the_user(self):
+        tokens = self.login('agent', 'agent123')
+        access = AccessToken(tokens['access'])
+        self.assertEqual(access['role'], 'AGENT')
+        self.assertEqual(access['agent_id'], self.agent.pk)
+
+        client = self.bearer(self.login('admin', 'admin123')['access'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/equipements/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM "core_user"' in query['sql'] for query in ctx.captured_queries))
+
+    def test_role_change_revokes_issued_tokens(self):
+        tokens = self.login('agent', 'agent123')
+        client = self.bearer(tokens['access'])
+        self.assertEqual(client.get('/api/equipements/').status_code, 200)
+
+        self.agent_user.refresh_from_db()
+        self.agent_user.role = 'SUPERVISOR'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent_user.save()
+        self.assertEqual(TokenRevocation.objects.filter(user_id=self.agent_user.pk).count(), 1)
+
+        self.assertEqual(client.get('/api/equipements/').status_code, 401)
+        refresh = APIClient().post(
+            '/api/token/refresh/', {'refresh': tokens['refresh']}, format='json'
+        )
+        self.assertEqual(refresh.status_code, 401)
+        # A fresh login after the revocation is accepted straight away.
+        access = self.login('agent', 'agent123')['access']
+        self.assertEqual(self.bearer(access).get('/api/equipements/').status_code, 200)
+
+    def test_refresh_picks_up_current_claims(self):
+        tokens = self.login('agent', 'agent123')
+        Agent.objects.filter(pk=self.agent.pk).update(user=None)
+        response = APIClient().post(
+            '/api/token/refresh/', {'refresh': tokens['refresh']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(AccessToken(response.data['access'])['agent_id'])
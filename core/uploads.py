@@ -0,0 +1,187 @@
+import hashlib
+import os
+import secrets
+from datetime import timedelta
+from pathlib import Path, PurePath
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import UploadSession
+
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def upload_path(token):
+    return Path(settings.UPLOAD_TEMP_DIR) / token
+
+
+def stored_bytes(now=None):
+    """Bytes received by the sessions whose files may still be on disk."""
+    now = now or timezone.now()
+    return (
+        UploadSession.objects.filter(expires_at__gt=now).aggregate(total=Sum('received'))['total']
+        or 0
+    )
+
+
+def check_quota(size):
+    # Sessions can be opened anonymously: the temporary directory has a quota of its own,
+    # counted on the bytes written so that empty sessions cannot hold it.
+    if stored_bytes() + size > settings.UPLOAD_TOTAL_MAX_SIZE:
+        raise UploadError('Espace de televersement sature, reessayez plus tard.', status=503)
+
+
+def start_upload(filename, size, sha256='', user=None):
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f'Fichier trop volumineux (maximum {settings.UPLOAD_MAX_SIZE} octets).')
+    check_quota(size)
+    session = UploadSession.objects.create(
+        token=secrets.token_urlsafe(32),
+        filename=PurePath(filename).name[:255],
+        size=size,
+        sha256=(sha256 or '').lower(),
+        created_by_id=getattr(user, 'pk', None),
+        expires_at=timezone.now() + timedelta(hours=settings.UPLOAD_EXPIRY_HOURS),
+    )
+    Path(settings.UPLOAD_TEMP_DIR).mkdir(parents=True, exist_ok=True)
+    upload_path(session.token).touch()
+    return session
+
+
+def get_session(token, lock=False):
+    queryset = UploadSession.objects.select_for_update() if lock else UploadSession.objects
+    session = queryset.filter(token=token).first()
+    if session is None or session.is_expired():
+        raise UploadError('Televersement introuvable ou expire.', status=404)
+    return session
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@transaction.atomic
+def append_chunk(token, offset, stream, length, sha256):
+    """Write ``length`` bytes of ``stream`` at ``offset``; the row lock serialises writers.
+
+    A chunk that is short or does not match ``sha256`` is discarded, so the client can
+    send it again from the same offset.
+    """
+    session = get_session(token, lock=True)
+    if session.status != UploadSession.Status.OPEN:
+        raise UploadError('Televersement deja termine.', status=409, offset=session.received)
+    if offset != session.received:
+        raise UploadError(
+            'Position inattendue: reprenez a la position indiquee.',
+            status=409,
+            offset=session.received,
+        )
+    if not sha256:
+        raise UploadError("L'empreinte SHA-256 du morceau est obligatoire.")
+    if length <= 0 or length > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError(f'Morceau de 1 a {settings.UPLOAD_CHUNK_SIZE} octets attendu.')
+    if offset + length > session.size:
+        raise UploadError('Le morceau depasse la taille annoncee.')
+    check_quota(length)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(upload_path(token), 'r+b') as handle:
+        handle.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            handle.write(block)
+            digest.update(block)
+            written += len(block)
+        if written != length or digest.hexdigest() != sha256.lower():
+            handle.truncate(offset)
+            raise UploadError('Morceau incomplet ou corrompu: renvoyez-le.', offset=offset)
+        handle.truncate(offset + length)
+        handle.flush()
+        os.fsync(handle.fileno())
+    session.received = offset + length
+    session.save(update_fields=['received'])
+    return session
+
+
+@transaction.atomic
+def complete_upload(token):
+    session = get_session(token, lock=True)
+    if session.status == UploadSession.Status.COMPLETE:
+        return session
+    if session.received != session.size:
+        raise UploadError(
+            f'Televersement incomplet ({session.received}/{session.size} octets).',
+            status=409,
+            offset=session.received,
+        )
+    digest = file_digest(upload_path(token))
+    if session.sha256 and digest != session.sha256:
+        with open(upload_path(token), 'r+b') as handle:
+            handle.truncate(0)
+        session.received = 0
+        session.save(update_fields=['received'])
+        raise UploadError('Empreinte du fichier differente: recommencez le televersement.', offset=0)
+    session.sha256 = digest
+    session.status = UploadSession.Status.COMPLETE
+    session.completed_at = timezone.now()
+    session.save(update_fields=['sha256', 'status', 'completed_at'])
+    return session
+
+
+class UploadedSessionFile(File):
+    """A completed upload, moved (not copied) into the media storage when saved."""
+
+    def __init__(self, session):
+        super().__init__(open(upload_path(session.token), 'rb'), name=session.filename)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def open_upload(token):
+    try:
+        session = get_session(token)
+    except UploadError:
+        return None
+    if session.status != UploadSession.Status.COMPLETE or not upload_path(token).exists():
+        return None
+    return UploadedSessionFile(session)
+
+
+def cleanup_uploads(now=None):
+    """Delete expired or consumed sessions and stray files; returns the number of sessions."""
+    now = now or timezone.now()
+    removed = 0
+    directory = Path(settings.UPLOAD_TEMP_DIR)
+    for session in UploadSession.objects.only('id', 'token', 'status', 'expires_at').iterator():
+        path = upload_path(session.token)
+        consumed = session.status == UploadSession.Status.COMPLETE and not path.exists()
+        if session.expires_at < now or consumed:
+            path.unlink(missing_ok=True)
+            session.delete()
+            removed += 1
+    if directory.exists():
+        tokens = set(UploadSession.objects.values_list('token', flat=True))
+        for path in directory.iterdir():
+            if path.is_file() and path.name not in tokens:
+                path.unlink(missing_ok=True)
+    return removed
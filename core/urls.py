@@ -10,6 +10,10 @@ from .views import (
     IncidentViewSet,
     LogViewSet,
     ReportsView,
+    ScanView,
+    SearchView,
+    ReportJobViewSet,
+    UploadSessionViewSet,
     AgentInviteViewSet,
     AgentRegistrationView,
     AgentOpenRegistrationView,
@@ -25,11 +29,15 @@ router.register(r'restitutions', RestitutionViewSet, basename='restitution')
 router.register(r'incidents', IncidentViewSet, basename='incident')
 router.register(r'logs', LogViewSet, basename='log')
 router.register(r'invites', AgentInviteViewSet, basename='invite')
+router.register(r'rapports/jobs', ReportJobViewSet, basename='report-job')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 
 urlpatterns = [
     path('agents/register/', AgentOpenRegistrationView.as_view(), name='agent-register'),
     path('invites/<str:token>/register/', AgentRegistrationView.as_view(), name='invite-register'),
     path('rapports/', ReportsView.as_view(), name='rapports'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('scan/<path:payload>/', ScanView.as_view(), name='scan'),
     path('', include(router.urls)),
 ]
@@ -1,3 +1,6 @@
+EQUIPEMENT_CODE_PREFIX = 'EQUIPEMENT:'
+
+
 def get_client_ip(request):
     forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if forwarded_for:
@@ -5,14 +8,44 @@ def get_client_ip(request):
     return request.META.get('REMOTE_ADDR')
 
 
+def _highest_suffix(base):
+    from .models import Agent
+
+    highest = 0
+    for matricule in Agent.objects.filter(matricule__startswith=base).values_list(
+        'matricule', flat=True
+    ).iterator():
+        suffix = matricule[len(base):]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
+
 def generate_matricule(prefix='AG'):
+    from django.db import transaction
+    from django.db.models import F
     from django.utils import timezone
-    import secrets
-    from .models import Agent
+    from .models import MatriculeSequence
+
+    day = timezone.localdate()
+    base = f"{prefix}{day:%Y%m%d}"
+    sequences = MatriculeSequence.objects.filter(prefix=prefix, day=day)
+    with transaction.atomic():
+        # The UPDATE takes the row lock, so concurrent callers are serialised
+        # on it and each reads back its own value.
+        if not sequences.update(last_value=F('last_value') + 1):
+            # First allocation of the day: start after any matricule already issued.
+            MatriculeSequence.objects.get_or_create(
+                prefix=prefix, day=day, defaults={'last_value': _highest_suffix(base)}
+            )
+            sequences.update(last_value=F('last_value') + 1)
+        value = sequences.values_list('last_value', flat=True).get()
+    return f"{base}{value:04d}"
+
 
-    base = timezone.now().strftime(f"{prefix}%Y%m%d")
-    for _ in range(100):
-        candidate = f"{base}{secrets.randbelow(10000):04d}"
-        if not Agent.objects.filter(matricule=candidate).exists():
-            return candidate
-    raise RuntimeError('Impossible de generer un matricule unique.')
+def parse_equipement_code(value):
+    """Return the serial number behind a scanned QR payload or a typed serial."""
+    code = (value or '').strip()
+    if code.upper().startswith(EQUIPEMENT_CODE_PREFIX):
+        code = code[len(EQUIPEMENT_CODE_PREFIX):].strip()
+    return code
@@ -1,17 +1,34 @@
-from django.db.models import Count
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
 from io import BytesIO
+from itertools import islice
+import mimetypes
+import posixpath
+from urllib.parse import quote
+import tempfile
 from django.utils import timezone
-from rest_framework import viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from openpyxl import Workbook
-from .models import Agent, Equipement, Affectation, Restitution, Incident, Log, AgentInvite
+from .models import (
+    Agent,
+    Equipement,
+    Affectation,
+    Restitution,
+    Incident,
+    Log,
+    AgentInvite,
+    ReportJob,
+)
 from .serializers import (
     UserSerializer,
     AgentSerializer,
@@ -23,79 +40,158 @@ from .serializers import (
     AgentInviteSerializer,
     AgentSelfRegisterSerializer,
     AgentOpenRegisterSerializer,
+    ReportJobSerializer,
+    UploadSessionSerializer,
+    BulkAffectationSerializer,
+    ScanRestitutionSerializer,
+)
+from .permissions import _is_admin, IsAdmin, IsAdminOrSupervisor, IsAdminOrSupervisorOrReadOnly
+from .archive import (
+    ARCHIVE_FIELDS,
+    archive_key,
+    archive_row,
+    archive_watermark,
+    read_archived,
+)
+from .assignments import assign_bulk, restitute_bulk
+from .audit import audit_writer
+from .caching import versioned
+from .imports import ImportFormatError, import_equipements, read_rows
+from .mixins import AuditLogMixin, ExportMixin, RoleScopedMixin, SparseFieldsMixin
+from .pagination import TimelinePagination
+from .pdf import SHEET_WRITERS, cached_sheet, sheet_data, sheets_data
+from .utils import get_client_ip
+from .reports import report_summary, write_pdf_report
+from .scan import scan
+from .search import SEARCH_MODELS, hydrate, search
+from .uploads import UploadError, append_chunk, complete_upload, get_session, start_upload
+from .filters import (
+    AgentFilter,
+    EquipementFilter,
+    AffectationFilter,
+    RestitutionFilter,
+    IncidentFilter,
+    LogFilter,
 )
-from .permissions import IsAdmin, IsAdminOrSupervisor, IsAdminOrSupervisorOrReadOnly
-from .mixins import AuditLogMixin
-from .filters import AgentFilter, EquipementFilter, AffectationFilter, RestitutionFilter, IncidentFilter
 from django.contrib.auth import get_user_model
 
 
 User = get_user_model()
 
 
-class UserViewSet(AuditLogMixin, viewsets.ModelViewSet):
+def media_response(name, storage=default_storage, as_attachment=False, filename=None):
+    """Serve a stored file, through nginx when MEDIA_ACCEL_REDIRECT is set."""
+    prefix = settings.MEDIA_ACCEL_REDIRECT
+    if not prefix:
+        return FileResponse(
+            storage.open(name, 'rb'), as_attachment=as_attachment, filename=filename or ''
+        )
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    if as_attachment:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class UserViewSet(ExportMixin, SparseFieldsMixin, AuditLogMixin, viewsets.ModelViewSet):
     queryset = User.objects.all().order_by('id')
     serializer_class = UserSerializer
+    export_fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_active']
     permission_classes = [IsAdmin]
 
 
-class AgentViewSet(AuditLogMixin, viewsets.ModelViewSet):
+class AgentViewSet(
+    ExportMixin, SparseFieldsMixin, AuditLogMixin, RoleScopedMixin, viewsets.ModelViewSet
+):
     queryset = Agent.objects.all().order_by('id')
     serializer_class = AgentSerializer
+    export_fields = [
+        'id',
+        'matricule',
+        'first_name',
+        'last_name',
+        'phone',
+        'email',
+        'address',
+        'id_number',
+        'project_type',
+        'status',
+        'created_at',
+    ]
     permission_classes = [IsAdminOrSupervisorOrReadOnly]
     filterset_class = AgentFilter
+    agent_scope = 'pk'
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Agent.objects.none()
-        if getattr(user, 'role', None) == 'AGENT':
-            agent = getattr(user, 'agent_profile', None)
-            if agent:
-                return Agent.objects.filter(pk=agent.pk)
-            return Agent.objects.none()
-        return super().get_queryset()
-
-
-class EquipementViewSet(AuditLogMixin, viewsets.ModelViewSet):
+
+class EquipementViewSet(
+    ExportMixin, SparseFieldsMixin, AuditLogMixin, RoleScopedMixin, viewsets.ModelViewSet
+):
     queryset = Equipement.objects.all().order_by('id')
     serializer_class = EquipementSerializer
+    export_fields = ['id', 'type', 'serial_number', 'imei', 'status', 'condition', 'created_at']
     permission_classes = [IsAdminOrSupervisorOrReadOnly]
     filterset_class = EquipementFilter
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Equipement.objects.none()
-        if getattr(user, 'role', None) == 'AGENT':
-            agent = getattr(user, 'agent_profile', None)
-            if agent:
-                return Equipement.objects.filter(
-                    affectations__agent=agent, affectations__is_active=True
-                ).distinct()
-            return Equipement.objects.none()
-        return super().get_queryset()
-
-
-class AffectationViewSet(AuditLogMixin, viewsets.ModelViewSet):
+    agent_scope = 'current_agent_id'
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        parser_classes=[MultiPartParser, FormParser],
+    )
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'file': ['Ce champ est obligatoire.']}, status=status.HTTP_400_BAD_REQUEST
+            )
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        try:
+            records = read_rows(upload, upload.name)
+            report = import_equipements(
+                records, user=request.user, filename=upload.name, dry_run=dry_run
+            )
+        except ImportFormatError as exc:
+            return Response({'file': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+    @action(detail=True, methods=['get'], url_path='qr')
+    def qr(self, request, pk=None):
+        equipement = self.get_object()
+        image = equipement.qr_code_image
+        if not image or not image.storage.exists(image.name):
+            equipement.generate_qr_code()
+        response = media_response(image.name, image.storage)
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+
+class AffectationViewSet(
+    ExportMixin, SparseFieldsMixin, AuditLogMixin, RoleScopedMixin, viewsets.ModelViewSet
+):
     queryset = Affectation.objects.all().order_by('-assigned_at')
+    pagination_class = TimelinePagination
+    keyset_field = 'assigned_at'
     serializer_class = AffectationSerializer
+    export_fields = [
+        'id',
+        'equipement__serial_number',
+        'agent__matricule',
+        'assigned_by__username',
+        'assigned_at',
+        'expected_return_at',
+        'is_active',
+        'notes',
+    ]
     permission_classes = [IsAdminOrSupervisorOrReadOnly]
     filterset_class = AffectationFilter
+    agent_scope = 'agent_id'
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Affectation.objects.none()
-        if getattr(user, 'role', None) == 'AGENT':
-            agent = getattr(user, 'agent_profile', None)
-            if agent:
-                return Affectation.objects.filter(agent=agent)
-            return Affectation.objects.none()
-        return super().get_queryset()
-
+    @transaction.atomic
     def perform_create(self, serializer):
         affectation = serializer.save(assigned_by=self.request.user)
         equipement = affectation.equipement
@@ -104,64 +200,90 @@ class AffectationViewSet(AuditLogMixin, viewsets.ModelViewSet):
             equipement.save(update_fields=['status'])
         self._log_action(self.request, self.action_create, affectation)
 
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser])
+    def bulk(self, request):
+        serializer = BulkAffectationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = assign_bulk(
+            serializer.validated_data['items'],
+            user=request.user,
+            assigned_at=serializer.validated_data.get('assigned_at'),
+            atomic=serializer.validated_data['atomic'],
+            ip_address=get_client_ip(request),
+        )
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response(
+            {'created': created, 'errors': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=True, methods=['get'], url_path='pdf')
     def pdf(self, request, pk=None):
         affectation = self.get_object()
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        pdf.setTitle(f"Affectation {affectation.id}")
-
-        y = 800
-        pdf.setFont('Helvetica-Bold', 16)
-        pdf.drawString(40, y, 'Fiche d\'affectation')
-        y -= 30
-        pdf.setFont('Helvetica', 11)
-        pdf.drawString(40, y, f"ID: {affectation.id}")
-        y -= 18
-        pdf.drawString(40, y, f"Equipement: {affectation.equipement.serial_number}")
-        y -= 18
-        pdf.drawString(40, y, f"Agent: {affectation.agent.matricule}")
-        y -= 18
-        pdf.drawString(40, y, f"Affecte le: {affectation.assigned_at:%Y-%m-%d}")
-        y -= 18
-        if affectation.expected_return_at:
-            pdf.drawString(
-                40, y, f"Retour prevu: {affectation.expected_return_at:%Y-%m-%d}"
-            )
-            y -= 18
-        pdf.drawString(40, y, f"Statut: {'Active' if affectation.is_active else 'Cloturee'}")
-        y -= 18
-        if affectation.notes:
-            pdf.drawString(40, y, f"Notes: {affectation.notes}")
-
-        pdf.showPage()
-        pdf.save()
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+        content = cached_sheet(sheet_data(affectation))
+        response = HttpResponse(content, content_type='application/pdf')
         response['Content-Disposition'] = (
             f'attachment; filename=affectation_{affectation.id}.pdf'
         )
         return response
 
+    @action(detail=False, methods=['get'], url_path='pdf-batch')
+    def pdf_batch(self, request):
+        output = request.query_params.get('output', 'pdf')
+        if output not in SHEET_WRITERS:
+            return Response(
+                {'detail': "Sortie invalide: 'pdf' ou 'zip'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        sheets = list(sheets_data(queryset[: settings.PDF_BATCH_MAX + 1]))
+        if not sheets:
+            return Response(
+                {'detail': 'Aucune affectation ne correspond aux filtres.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if len(sheets) > settings.PDF_BATCH_MAX:
+            # A GET must not queue work: large batches go through POST /api/rapports/jobs/.
+            return Response(
+                {
+                    'detail': f'Trop de fiches (maximum {settings.PDF_BATCH_MAX}): affinez les '
+                    "filtres ou creez une tache AFFECTATION_SHEETS (/api/rapports/jobs/)."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        buffer = SHEET_WRITERS[output](sheets, tempfile.TemporaryFile())
+        buffer.seek(0)
+        return FileResponse(
+            buffer,
+            as_attachment=True,
+            filename=f'affectations.{output}',
+            content_type='application/zip' if output == 'zip' else 'application/pdf',
+        )
 
-class RestitutionViewSet(AuditLogMixin, viewsets.ModelViewSet):
+
+class RestitutionViewSet(
+    ExportMixin, SparseFieldsMixin, AuditLogMixin, RoleScopedMixin, viewsets.ModelViewSet
+):
     queryset = Restitution.objects.all().order_by('-returned_at')
+    pagination_class = TimelinePagination
+    keyset_field = 'returned_at'
     serializer_class = RestitutionSerializer
+    export_fields = [
+        'id',
+        'affectation',
+        'affectation__equipement__serial_number',
+        'affectation__agent__matricule',
+        'received_by__username',
+        'returned_at',
+        'condition',
+        'notes',
+    ]
     permission_classes = [IsAdminOrSupervisorOrReadOnly]
     filterset_class = RestitutionFilter
+    agent_scope = 'affectation__agent_id'
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Restitution.objects.none()
-        if getattr(user, 'role', None) == 'AGENT':
-            agent = getattr(user, 'agent_profile', None)
-            if agent:
-                return Restitution.objects.filter(affectation__agent=agent)
-            return Restitution.objects.none()
-        return super().get_queryset()
-
+    @transaction.atomic
     def perform_create(self, serializer):
         restitution = serializer.save(received_by=self.request.user)
         affectation = restitution.affectation
@@ -176,24 +298,47 @@ class RestitutionViewSet(AuditLogMixin, viewsets.ModelViewSet):
         equipement.save(update_fields=['condition', 'status'])
         self._log_action(self.request, self.action_create, restitution)
 
+    @action(detail=False, methods=['post'], url_path='scan', parser_classes=[JSONParser])
+    def scan(self, request):
+        serializer = ScanRestitutionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = restitute_bulk(
+            serializer.validated_data['items'],
+            user=request.user,
+            returned_at=serializer.validated_data.get('returned_at'),
+            atomic=serializer.validated_data['atomic'],
+            ip_address=get_client_ip(request),
+        )
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response(
+            {'created': created, 'errors': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
 
-class IncidentViewSet(AuditLogMixin, viewsets.ModelViewSet):
+class IncidentViewSet(
+    ExportMixin, SparseFieldsMixin, AuditLogMixin, RoleScopedMixin, viewsets.ModelViewSet
+):
     queryset = Incident.objects.all().order_by('-reported_at')
+    pagination_class = TimelinePagination
+    keyset_field = 'reported_at'
     serializer_class = IncidentSerializer
+    export_fields = [
+        'id',
+        'equipement__serial_number',
+        'agent__matricule',
+        'reported_by__username',
+        'incident_type',
+        'description',
+        'status',
+        'reported_at',
+        'closed_at',
+    ]
     permission_classes = [IsAdminOrSupervisorOrReadOnly]
     filterset_class = IncidentFilter
+    agent_scope = 'agent_id'
 
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Incident.objects.none()
-        if getattr(user, 'role', None) == 'AGENT':
-            agent = getattr(user, 'agent_profile', None)
-            if agent:
-                return Incident.objects.filter(agent=agent)
-            return Incident.objects.none()
-        return super().get_queryset()
-
+    @transaction.atomic
     def perform_create(self, serializer):
         incident = serializer.save(reported_by=self.request.user)
         equipement = incident.equipement
@@ -204,6 +349,7 @@ class IncidentViewSet(AuditLogMixin, viewsets.ModelViewSet):
         equipement.save(update_fields=['status'])
         self._log_action(self.request, self.action_create, incident)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         incident = serializer.save()
         if incident.status == Incident.Status.CLOSED and incident.closed_at is None:
@@ -212,15 +358,113 @@ class IncidentViewSet(AuditLogMixin, viewsets.ModelViewSet):
         self._log_action(self.request, self.action_update, incident)
 
 
-class LogViewSet(viewsets.ReadOnlyModelViewSet):
+class LogViewSet(ExportMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Log.objects.all().order_by('-created_at')
+    pagination_class = TimelinePagination
+    keyset_field = 'created_at'
     serializer_class = LogSerializer
+    export_fields = [
+        'id',
+        'user__username',
+        'action',
+        'target_type',
+        'target_id',
+        'details',
+        'ip_address',
+        'created_at',
+    ]
     permission_classes = [IsAdminOrSupervisor]
+    filterset_class = LogFilter
+
+    def list(self, request, *args, **kwargs):
+        filterset = LogFilter(request.query_params, queryset=Log.objects.none())
+        if not filterset.is_valid():
+            return super().list(request, *args, **kwargs)
+        data = filterset.form.cleaned_data
+        source = self._source(data)
+        if source == 'live':
+            return super().list(request, *args, **kwargs)
+        if request.query_params.get('export'):
+            return Response(
+                {'detail': "L'export ne couvre que les journaux non archives."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return self._timeline(request, data, include_live=source == 'all')
+
+    def _source(self, data):
+        """'archive', 'all' (table and archive merged) or 'live'."""
+        source = self.request.query_params.get('source')
+        if source in ('archive', 'all'):
+            return source
+        watermark = archive_watermark()
+        after, before = data.get('created_at_after'), data.get('created_at_before')
+        if watermark is None or (after is None and before is None):
+            return 'live'
+        if before is not None and before <= watermark:
+            return 'archive'
+        # The range reaches below the watermark: both sides hold rows of it.
+        return 'all' if after is None or after <= watermark else 'live'
+
+    def _timeline(self, request, data, include_live):
+        # Always keyset paginated: a page reads the live rows and the archived days it covers.
+        paginator = TimelinePagination()
+        page_size = paginator.get_page_size(request)
+        position = paginator.decode_cursor(request)
+
+        rows = []
+        if include_live:
+            queryset = self.filter_queryset(self.get_queryset()).order_by('-created_at', '-pk')
+            if position is not None:
+                value, pk = position
+                queryset = queryset.filter(created_at__lte=value).filter(
+                    Q(created_at__lt=value) | Q(pk__lt=pk)
+                )
+            # Same shape as the archived rows, which only keep the username of the user.
+            rows = [
+                {**archive_row(row), 'created_at': row['created_at']}
+                for row in queryset.values(*ARCHIVE_FIELDS)[: page_size + 1]
+            ]
+            watermark = archive_watermark()
+            if len(rows) > page_size and (
+                watermark is None or rows[page_size]['created_at'] > watermark
+            ):
+                return self._timeline_page(request, paginator, rows, page_size)
+
+        user = data.get('user')
+        archived = read_archived(
+            start=data.get('created_at_after'),
+            end=data.get('created_at_before'),
+            action=data.get('action'),
+            target_type=data.get('target_type'),
+            target_id=data.get('target_id'),
+            user=user.pk if user else None,
+            position=position,
+        )
+        seen = {row['id'] for row in rows}
+        rows.extend(row for row in islice(archived, page_size + 1) if row['id'] not in seen)
+        rows.sort(key=archive_key, reverse=True)
+        return self._timeline_page(request, paginator, rows, page_size)
+
+    def _timeline_page(self, request, paginator, rows, page_size):
+        next_link = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                paginator.cursor_query_param,
+                paginator.encode_position(last['created_at'], last['id']),
+            )
+        return Response({'next': next_link, 'results': rows[:page_size]})
 
+    @action(detail=False, methods=['get'], url_path='audit-stats')
+    def audit_stats(self, request):
+        return Response(audit_writer.stats())
 
-class AgentInviteViewSet(viewsets.ModelViewSet):
+
+class AgentInviteViewSet(ExportMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = AgentInvite.objects.all().order_by('-created_at')
     serializer_class = AgentInviteSerializer
+    export_fields = ['id', 'email', 'phone', 'created_at', 'expires_at', 'used_at', 'notes']
     permission_classes = [IsAdmin]
 
     def perform_create(self, serializer):
@@ -229,7 +473,7 @@ class AgentInviteViewSet(viewsets.ModelViewSet):
 
 class AgentRegistrationView(APIView):
     permission_classes = [AllowAny]
-    parser_classes = [FormParser, MultiPartParser]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
 
     def post(self, request, token):
         payload = {**request.data, 'token': token}
@@ -248,7 +492,7 @@ class AgentRegistrationView(APIView):
 
 class AgentOpenRegistrationView(APIView):
     permission_classes = [AllowAny]
-    parser_classes = [FormParser, MultiPartParser]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
 
     def post(self, request):
         serializer = AgentOpenRegisterSerializer(data=request.data)
@@ -264,99 +508,177 @@ class AgentOpenRegistrationView(APIView):
         )
 
 
+class UploadSessionViewSet(viewsets.ViewSet):
+    """Resumable uploads: start, PUT chunks at ``?offset=``, then complete.
+
+    Public, like agent registration: the random token is the only credential. Opening
+    a session is throttled per client; the chunks are bounded by the announced size.
+    """
+
+    permission_classes = [AllowAny]
+    throttle_scope = 'uploads'
+    lookup_field = 'token'
+    lookup_value_regex = '[-_A-Za-z0-9]+'
+
+    def get_throttles(self):
+        return [ScopedRateThrottle()] if self.action == 'create' else []
+
+    def _error(self, exc):
+        data = {'detail': str(exc)}
+        if exc.offset is not None:
+            data['offset'] = exc.offset
+        return Response(data, status=exc.status)
+
+    def create(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+        try:
+            session = start_upload(user=user, **serializer.validated_data)
+        except UploadError as exc:
+            return self._error(exc)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, token=None):
+        try:
+            session = get_session(token)
+        except UploadError as exc:
+            return self._error(exc)
+        return Response(UploadSessionSerializer(session).data)
+
+    def update(self, request, token=None):
+        try:
+            offset = int(request.query_params.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response(
+                {'detail': 'Parametre offset entier attendu.'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            session = append_chunk(
+                token,
+                offset,
+                request.stream,
+                length,
+                request.META.get('HTTP_X_CONTENT_SHA256', '').strip(),
+            )
+        except UploadError as exc:
+            return self._error(exc)
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, token=None):
+        try:
+            session = complete_upload(token)
+        except UploadError as exc:
+            return self._error(exc)
+        return Response(UploadSessionSerializer(session).data)
+
+
 class ReportsView(APIView):
     permission_classes = [IsAdminOrSupervisor]
 
     def get(self, request):
         export_format = request.query_params.get('export')
         if export_format == 'excel':
-            return self._export_excel()
+            # The workbook lists every equipement and agent: it is built by a report job.
+            return Response(
+                {'detail': "L'export Excel passe par POST /api/rapports/jobs/ (kind EXCEL)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         if export_format == 'pdf':
             return self._export_pdf()
-
-        equipement_counts = Equipement.objects.values('status').annotate(total=Count('id'))
-        incidents_by_type = Incident.objects.values('incident_type').annotate(total=Count('id'))
-        incidents_by_status = Incident.objects.values('status').annotate(total=Count('id'))
-        agents_active = Agent.objects.filter(status=Agent.Status.ACTIVE).count()
-        agents_inactive = Agent.objects.filter(status=Agent.Status.INACTIVE).count()
-        data = {
-            'equipements_by_status': list(equipement_counts),
-            'incidents_by_type': list(incidents_by_type),
-            'incidents_by_status': list(incidents_by_status),
-            'agents_active': agents_active,
-            'agents_inactive': agents_inactive,
-        }
+        data = versioned('rapports:json', report_summary, settings.REPORTS_CACHE_TIMEOUT)
         return Response(data)
 
-    def _export_excel(self):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Equipements'
-        ws.append(['Type', 'Numero de serie', 'IMEI', 'Statut', 'Etat'])
-        for item in Equipement.objects.all().order_by('id'):
-            ws.append(
-                [
-                    item.type,
-                    item.serial_number,
-                    item.imei or '',
-                    item.status,
-                    item.condition,
-                ]
-            )
+    def _export_pdf(self):
+        content = versioned(
+            'rapports:pdf',
+            lambda: write_pdf_report(BytesIO()).getvalue(),
+            settings.REPORTS_CACHE_TIMEOUT,
+        )
+        response = HttpResponse(content, content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename=rapports.pdf'
+        return response
+
 
-        ws_agents = wb.create_sheet('Agents')
-        ws_agents.append(['Matricule', 'Prenom', 'Nom', 'Telephone', 'Email', 'Statut'])
-        for agent in Agent.objects.all().order_by('id'):
-            ws_agents.append(
-                [
-                    agent.matricule,
-                    agent.first_name,
-                    agent.last_name,
-                    agent.phone,
-                    agent.email,
-                    agent.status,
-                ]
+class SearchView(generics.GenericAPIView):
+    permission_classes = [IsAdminOrSupervisor]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kinds = [
+            kind
+            for kind in request.query_params.get('type', '').split(',')
+            if kind in SEARCH_MODELS
+        ]
+        page = self.paginate_queryset(search(query, kinds=kinds))
+        return self.get_paginated_response(hydrate(page))
+
+
+class ScanView(APIView):
+    permission_classes = [IsAdminOrSupervisor]
+
+    def get(self, request, payload):
+        result = scan(payload)
+        if result is None:
+            return Response(
+                {'detail': 'Equipement introuvable.'}, status=status.HTTP_404_NOT_FOUND
             )
+        return Response(result)
+
 
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+class ReportJobViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = ReportJob.objects.all().order_by('-created_at')
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAdminOrSupervisor]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if _is_admin(self.request.user):
+            return queryset
+        return queryset.filter(created_by_id=self.request.user.pk)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by_id=request.user.pk)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.Status.DONE or not job.output:
+            return Response(
+                {'detail': 'Rapport pas encore disponible.', 'status': job.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return media_response(
+            job.output.name,
+            job.output.storage,
+            as_attachment=True,
+            filename=job.output.name.rsplit('/', 1)[-1],
         )
-        response['Content-Disposition'] = 'attachment; filename=rapports.xlsx'
-        return response
 
-    def _export_pdf(self):
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        pdf.setTitle('Rapports EquipTrack')
-        pdf.setFont('Helvetica-Bold', 16)
-        pdf.drawString(40, 800, 'Rapport EquipTrack')
-        pdf.setFont('Helvetica', 11)
-
-        equipement_counts = Equipement.objects.values('status').annotate(total=Count('id'))
-        incidents_by_type = Incident.objects.values('incident_type').annotate(total=Count('id'))
-
-        y = 760
-        pdf.drawString(40, y, 'Equipements par statut:')
-        y -= 18
-        for item in equipement_counts:
-            pdf.drawString(60, y, f"{item['status']}: {item['total']}")
-            y -= 16
-
-        y -= 10
-        pdf.drawString(40, y, 'Incidents par type:')
-        y -= 18
-        for item in incidents_by_type:
-            pdf.drawString(60, y, f"{item['incident_type']}: {item['total']}")
-            y -= 16
-
-        pdf.showPage()
-        pdf.save()
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename=rapports.pdf'
-        return response
 
+class MediaView(APIView):
+    """Stored files for staff. QR codes stay public, report files go through their job."""
+
+    permission_classes = [IsAdminOrSupervisor]
+    public_prefixes = ('qr_codes/',)
+
+    def get_permissions(self):
+        if self.kwargs.get('path', '').startswith(self.public_prefixes):
+            return []
+        return super().get_permissions()
+
+    def get(self, request, path):
+        name = posixpath.normpath(path)
+        if name.startswith(('..', '/', 'reports/')) or not default_storage.exists(name):
+            raise NotFound()
+        return media_response(name)
@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_background = None
+_background_lock = threading.Lock()
+
+
+# Imported by spawned children before Django is configured: no model imports here.
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def process_pool(workers):
+    # Spawn, never fork, so children do not inherit open DB connections.
+    connections.close_all()
+    return ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+
+
+def background_executor():
+    global _background
+    with _background_lock:
+        if _background is None:
+            _background = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='equiptrack-bg'
+            )
+        return _background
+
+
+def run_in_background(func, *args):
+    def task():
+        try:
+            return func(*args)
+        except Exception:
+            logger.exception('Background task %s failed', func.__name__)
+        finally:
+            # Connections are per thread: release the one this task opened.
+            connections.close_all()
+
+    return background_executor().submit(task)
@@ -0,0 +1,42 @@
+# Production server: gunicorn -c equiptrack/gunicorn.conf.py
+#
+# Prefork workers sized to the cores (password hashing makes logins CPU bound), each with a
+# few threads to overlap database waits. Every thread keeps its own persistent connection:
+# the database must accept GUNICORN_WORKERS * GUNICORN_THREADS connections per instance.
+import os
+
+
+wsgi_app = 'equiptrack.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', str(os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Load Django once in the master; workers are forked from it fully initialised.
+preload_app = True
+# Recycle workers now and then, staggered so they do not all restart together.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Heartbeat files on tmpfs: a container's overlay filesystem can stall them.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Behind the reverse proxy of docker-compose.yml.
+forwarded_allow_ips = os.environ.get('GUNICORN_FORWARDED_ALLOW_IPS', '*')
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Never share a connection the master may have opened while loading the app.
+    from django.db import connections
+
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    from core.audit import audit_writer
+
+    audit_writer.flush()
@@ -75,6 +75,13 @@ else:
         }
     }
 
+# Persistent connections, one per worker thread, checked before reuse. runserver starts a
+# thread per request, which would only leak them.
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('DB_CONN_MAX_AGE', '0' if DEBUG else '60')
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1'
+
 
 # Configuration spéciale pour les tests
 if 'test' in sys.argv:
@@ -86,6 +93,56 @@ if 'test' in sys.argv:
     }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'equiptrack'),
+    }
+}
+REPORTS_CACHE_TIMEOUT = int(os.environ.get('REPORTS_CACHE_TIMEOUT', '300'))
+SCAN_CACHE_SIZE = int(os.environ.get('SCAN_CACHE_SIZE', '1024'))
+
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '5'))
+AUDIT_DURABLE_ACTIONS = ('DELETE',)
+AUDIT_DURABLE_TARGETS = ('User',)
+
+QR_CODE_BACKGROUND = os.environ.get('QR_CODE_BACKGROUND', '1') == '1'
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', '2'))
+
+# Uploaded photos, ID documents and signatures are re-encoded after the request.
+IMAGE_PROCESSING_BACKGROUND = os.environ.get('IMAGE_PROCESSING_BACKGROUND', '1') == '1'
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '1600'))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '320'))
+
+if 'test' in sys.argv:
+    # Pool threads would race the test transaction: tests run these tasks themselves.
+    QR_CODE_BACKGROUND = IMAGE_PROCESSING_BACKGROUND = False
+
+# Resumable uploads: chunks are appended to a file per session until it is completed.
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', str(BASE_DIR / 'uploads'))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(15 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+UPLOAD_EXPIRY_HOURS = int(os.environ.get('UPLOAD_EXPIRY_HOURS', '24'))
+# Sessions are public (agent registration): new ones are throttled per client and the
+# unexpired ones may not hold more than UPLOAD_TOTAL_MAX_SIZE received bytes in all.
+UPLOAD_TOTAL_MAX_SIZE = int(os.environ.get('UPLOAD_TOTAL_MAX_SIZE', str(1024 * 1024 * 1024)))
+UPLOAD_THROTTLE_RATE = os.environ.get('UPLOAD_THROTTLE_RATE', '30/hour')
+
+# Affectation sheets are cached as files named after their id and a hash of their content.
+# Larger batches than PDF_BATCH_MAX are refused: they are built by report jobs.
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', str(BASE_DIR / 'cache' / 'pdf'))
+PDF_BATCH_MAX = int(os.environ.get('PDF_BATCH_MAX', '200'))
+
+TOKEN_REVOCATION_CACHE_TTL = int(os.environ.get('TOKEN_REVOCATION_CACHE_TTL', '30'))
+
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', '180'))
+LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', str(BASE_DIR / 'archives' / 'logs'))
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -111,6 +168,9 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Media hold ID documents, signatures and reports: Django checks the caller, then hands
+# the file to nginx through this internal location when it is set (deploy/nginx.conf).
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -121,7 +181,7 @@ FRONTEND_BASE_URL = os.environ.get('FRONTEND_BASE_URL', 'http://localhost:5173')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -131,4 +191,9 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
+    'DEFAULT_THROTTLE_RATES': {
+        'uploads': UPLOAD_THROTTLE_RATE,
+    },
+    # Throttles key on the address nginx appends to X-Forwarded-For, not the client's own.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '1')),
 }
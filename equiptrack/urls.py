@@ -1,16 +1,13 @@
 from django.contrib import admin
-from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
-from rest_framework_simplejwt.views import TokenRefreshView
-from core.auth_views import LoginView
+from django.urls import path, include, re_path
+from core.auth_views import LoginView, RefreshView
+from core.views import MediaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/login/', LoginView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', RefreshView.as_view(), name='token_refresh'),
     path('api/', include('core.urls')),
+    # Media go through Django for the permission check, in DEBUG as behind nginx.
+    re_path(r'^media/(?P<path>.+)$', MediaView.as_view(), name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
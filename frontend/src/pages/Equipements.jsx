@@ -10,6 +10,8 @@ export default function Equipements() {
   const [rows, setRows] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
+  const [importReport, setImportReport] = useState(null)
+  const [importing, setImporting] = useState(false)
   const {
     register,
     handleSubmit,
@@ -59,6 +61,29 @@ export default function Equipements() {
     }
   }
 
+  const onImport = async (event) => {
+    const file = event.target.files?.[0]
+    event.target.value = ''
+    if (!file) return
+    setError('')
+    setImporting(true)
+    try {
+      const form = new FormData()
+      form.append('file', file)
+      const { data } = await api.post('/equipements/import/', form)
+      setImportReport(data)
+      loadEquipements()
+    } catch (err) {
+      setError(
+        err?.response?.data?.file?.[0] ||
+          err?.response?.data?.detail ||
+          'Impossible d importer le fichier.'
+      )
+    } finally {
+      setImporting(false)
+    }
+  }
+
   const columns = [
     { name: 'Type', selector: (row) => row.type, sortable: true },
     {
@@ -144,6 +169,32 @@ export default function Equipements() {
         </form>
       </div>
 
+      <div className="card">
+        <h3>Import en masse (CSV / Excel)</h3>
+        <p>Colonnes: type, serial_number, imei, status, condition.</p>
+        <input
+          className="input"
+          type="file"
+          accept=".csv,.xlsx"
+          onChange={onImport}
+          disabled={importing}
+        />
+        {importReport ? (
+          <div className="stack">
+            <p>
+              {importReport.created}/{importReport.total} equipement(s) importe(s),{' '}
+              {importReport.errors.length} erreur(s).
+            </p>
+            {importReport.errors.slice(0, 50).map((item) => (
+              <div className="field__error" key={item.row}>
+                Ligne {item.row} ({item.serial_number || '-'}):{' '}
+                {Object.values(item.errors).join(' ')}
+              </div>
+            ))}
+          </div>
+        ) : null}
+      </div>
+
       <AppTable
         title="Inventaire"
         columns={columns}
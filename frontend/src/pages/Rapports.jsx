@@ -6,6 +6,10 @@ import StatusBadge from '../components/StatusBadge'
 import api from '../api/axios'
 import { unwrapResults } from '../utils/format'
 
+// Report jobs are polled every 2 s for at most 3 minutes.
+const POLL_INTERVAL_MS = 2000
+const MAX_POLLS = 90
+
 export default function Rapports() {
   const [stats, setStats] = useState({
     equipements_by_status: [],
@@ -18,7 +22,37 @@ export default function Rapports() {
   const [error, setError] = useState('')
 
   const handleExport = async (format) => {
-    const response = await api.get(`/rapports/?export=${format}`, {
+    setError('')
+    let job
+    try {
+      const { data } = await api.post('/rapports/jobs/', {
+        kind: format === 'excel' ? 'EXCEL' : 'PDF',
+      })
+      job = data
+      let polls = 0
+      while (job.status === 'PENDING' || job.status === 'RUNNING') {
+        if (polls >= MAX_POLLS) {
+          setError(
+            "Le rapport n'est pas encore pret. Reessayez dans quelques minutes."
+          )
+          return
+        }
+        polls += 1
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS))
+        const { data: current } = await api.get(`/rapports/jobs/${job.id}/`)
+        job = current
+      }
+    } catch (err) {
+      setError(
+        err?.response?.data?.detail || "La generation du rapport a echoue."
+      )
+      return
+    }
+    if (job.status !== 'DONE') {
+      setError(job.error || "La generation du rapport a echoue.")
+      return
+    }
+    const response = await api.get(`/rapports/jobs/${job.id}/download/`, {
       responseType: 'blob',
     })
     const blob = new Blob([response.data])
@@ -22,6 +22,9 @@ export default function Restitutions() {
   const [affectations, setAffectations] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
+  const [scanCodes, setScanCodes] = useState('')
+  const [scanCondition, setScanCondition] = useState('GOOD')
+  const [scanReport, setScanReport] = useState(null)
   const {
     register,
     handleSubmit,
@@ -87,6 +90,33 @@ export default function Restitutions() {
     }
   }
 
+  const onScanSubmit = async (event) => {
+    event.preventDefault()
+    const codes = scanCodes
+      .split('\n')
+      .map((code) => code.trim())
+      .filter(Boolean)
+    if (!codes.length) return
+    setError('')
+    try {
+      const { data } = await api.post('/restitutions/scan/', {
+        items: codes.map((code) => ({ code, condition: scanCondition })),
+      })
+      setScanReport(data)
+      setScanCodes('')
+      loadData()
+    } catch (err) {
+      if (err?.response?.data?.results) {
+        setScanReport(err.response.data)
+      } else {
+        setError(
+          err?.response?.data?.detail ||
+            'Impossible d enregistrer les retours scannes.'
+        )
+      }
+    }
+  }
+
   const columns = [
     {
       name: 'Affectation',
@@ -109,6 +139,54 @@ export default function Restitutions() {
 
       {error ? <div className="alert">{error}</div> : null}
 
+      <div className="card">
+        <h3>Retour par scan</h3>
+        <form className="form-grid" onSubmit={onScanSubmit}>
+          <div className="field">
+            <label>Codes scannes (un par ligne)</label>
+            <textarea
+              className="input"
+              rows={6}
+              value={scanCodes}
+              onChange={(event) => setScanCodes(event.target.value)}
+              placeholder="EQUIPEMENT:TB-0001"
+            />
+          </div>
+          <div className="field">
+            <label>Etat</label>
+            <select
+              className="select"
+              value={scanCondition}
+              onChange={(event) => setScanCondition(event.target.value)}
+            >
+              <option value="GOOD">Bon</option>
+              <option value="DAMAGED">Endommage</option>
+              <option value="NEEDS_REPAIR">A reparer</option>
+            </select>
+          </div>
+          <div className="form-actions">
+            <button className="btn btn-primary" type="submit">
+              Enregistrer les retours
+            </button>
+          </div>
+        </form>
+        {scanReport ? (
+          <div className="stack">
+            <p>
+              {scanReport.created} retour(s) enregistre(s), {scanReport.errors}{' '}
+              erreur(s).
+            </p>
+            {scanReport.results
+              .filter((item) => item.status === 'error')
+              .map((item) => (
+                <div className="field__error" key={item.index}>
+                  {item.code}: {Object.values(item.errors).join(' ')}
+                </div>
+              ))}
+          </div>
+        ) : null}
+      </div>
+
       <div className="card">
         <h3>Nouvelle restitution</h3>
         <form className="form-grid" onSubmit={handleSubmit(onSubmit)}>